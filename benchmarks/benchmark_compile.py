@@ -0,0 +1,144 @@
+'''
+Benchmark of the compiled policies (compile_policy: True).
+
+$ python benchmarks/benchmark_compile.py --backend inductor --algorithms DQN PPO DDPG SAC QMIX
+
+Builds the policy of each algorithm twice from the same seed, eager and with compile_policy, and times the action
+selection of n_envs environments (policy.act_numpy) and one learner step of batch_size samples (forward, backward and
+optimizer step). Reports the microseconds per call of both and the speedup of the compiled policy; the compilation
+itself is excluded by the warm-up calls. The compiled blocks that fail on this host fall back to eager with a warning,
+then the speedup is about 1.
+'''
+import argparse
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from gym.spaces import Box, Discrete
+from xuanpolicy.torch.representations import Basic_MLP
+from xuanpolicy.torch.policies import BasicQnetwork, Gaussian_AC_Policy, DDPGPolicy, Gaussian_SAC_Policy, \
+    MixingQnetwork, QMIX_mixer
+from xuanpolicy.torch.utils import compile_policy
+
+ALGORITHMS = ["DQN", "PPO", "DDPG", "SAC", "QMIX"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("Benchmark the compiled policies.")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--backend", type=str, default="inductor")
+    parser.add_argument("--algorithms", type=str, nargs="+", default=ALGORITHMS)
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--n-agents", type=int, default=3)
+    parser.add_argument("--obs-dim", type=int, default=17)
+    parser.add_argument("--act-dim", type=int, default=6)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-steps", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def make_policy(algorithm, args):
+    """Returns the policy, its action selection of the observations, and its learner loss of a batch."""
+    representation = Basic_MLP((args.obs_dim,), [256], None, None, nn.ReLU, args.device)
+    if algorithm == "DQN":
+        policy = BasicQnetwork(Discrete(args.act_dim), representation, [256], None, None, nn.ReLU, args.device)
+
+        def act(obs):
+            return policy.act_numpy(obs, sample=lambda outputs, argmax_action, evalQ: argmax_action)
+
+        def loss(obs):
+            q_target = policy.target(obs)[2].max(dim=-1).values
+            return (policy(obs)[2].max(dim=-1).values - q_target).pow(2).mean()
+    elif algorithm == "PPO":
+        policy = Gaussian_AC_Policy(Box(-1, 1, (args.act_dim,)), representation, [256], [256], None, None, nn.ReLU,
+                                    args.device)
+
+        def act(obs):
+            return policy.act_numpy(obs, sample=lambda outputs, dists, vs: (dists.stochastic_sample(), vs))
+
+        def loss(obs):
+            _, dists, vs = policy(obs)
+            return vs.pow(2).mean() - dists.entropy().mean()
+    elif algorithm == "DDPG":
+        policy = DDPGPolicy(Box(-1, 1, (args.act_dim,)), representation, [256], [256], None, nn.ReLU, args.device)
+
+        def act(obs):
+            return policy.act_numpy(obs, sample=lambda outputs, action: action)
+
+        def loss(obs):
+            return -policy.Qpolicy(obs).mean()
+    elif algorithm == "SAC":
+        policy = Gaussian_SAC_Policy(Box(-1, 1, (args.act_dim,)), representation, [256], [256], None, None, nn.ReLU,
+                                     args.device)
+
+        def act(obs):
+            return policy.act_numpy(obs, sample=lambda outputs, act_dist: act_dist.sample())
+
+        def loss(obs):
+            log_pi, q_policy = policy.Qpolicy(obs)
+            return (0.2 * log_pi - q_policy).mean()
+    elif algorithm == "QMIX":
+        mixer = QMIX_mixer(args.obs_dim * args.n_agents, 32, 64, args.n_agents, args.device)
+        policy = MixingQnetwork(Discrete(args.act_dim), args.n_agents, representation, mixer, [256], None, None,
+                                nn.ReLU, args.device, rnn="GRU", use_recurrent=False)
+        agent_ids = {}
+
+        def ids(batch_size):
+            if batch_size not in agent_ids:
+                agent_ids[batch_size] = torch.eye(args.n_agents, device=args.device).expand(batch_size, -1, -1)
+            return agent_ids[batch_size]
+
+        def act(obs):
+            obs = obs.reshape(-1, args.n_agents, args.obs_dim)
+            return policy.act_numpy(obs, ids(len(obs)), sample=lambda hidden, argmax_action, evalQ: argmax_action)
+
+        def loss(obs):
+            obs = obs.reshape(-1, args.n_agents, args.obs_dim)
+            q_eval = policy(obs, ids(len(obs)))[2].max(dim=-1).values
+            return policy.Q_tot(q_eval, obs.reshape(len(obs), -1)).pow(2).mean()
+    else:
+        raise NotImplementedError
+    return policy.to(args.device), act, loss
+
+
+def timed(fn, inputs, n_steps, device):
+    for step in range(20):  # the warm-up calls compile the graphs
+        fn(inputs[step % len(inputs)])
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for step in range(n_steps):
+        fn(inputs[step % len(inputs)])
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / n_steps * 1e6
+
+
+def run(algorithm, args, compiled):
+    torch.manual_seed(args.seed)
+    policy, act, loss = make_policy(algorithm, args)
+    if compiled:
+        compile_policy(policy, args.backend)
+    optimizer = torch.optim.Adam(policy.parameters(), 1e-4)
+
+    def learner_step(obs):
+        optimizer.zero_grad()
+        loss(obs).backward()
+        optimizer.step()
+
+    n_obs = args.n_agents if algorithm == "QMIX" else 1
+    observations = [np.random.randn(args.n_envs * n_obs, args.obs_dim).astype(np.float32) for _ in range(16)]
+    batches = [torch.randn(args.batch_size * n_obs, args.obs_dim, device=args.device) for _ in range(16)]
+    return timed(act, observations, args.n_steps, args.device), \
+           timed(learner_step, batches, args.n_steps // 10, args.device)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for algorithm in args.algorithms:
+        act_eager, learn_eager = run(algorithm, args, compiled=False)
+        act_compiled, learn_compiled = run(algorithm, args, compiled=True)
+        print("%s: act %.1f -> %.1f us (x%.2f), learner step %.1f -> %.1f us (x%.2f)" % (
+            algorithm, act_eager, act_compiled, act_eager / act_compiled,
+            learn_eager, learn_compiled, learn_eager / learn_compiled))
@@ -0,0 +1,133 @@
+'''
+Benchmark of the updates of the DQN-family learners.
+
+$ python benchmarks/benchmark_dqn_update.py --device cuda:0 --algorithms DQN DDQN C51 QRDQN
+$ python benchmarks/benchmark_dqn_update.py --mlp --obs-dim 17
+$ python benchmarks/benchmark_dqn_update.py --device cuda:0 --tensors
+
+Times one learner update of batch_size transitions on Atari-like 84x84x4 frames with the Basic_CNN of the atari
+configs (or a Basic_MLP with --mlp): the former update, which runs the networks on the observations and the next
+observations separately with autograd, against learner.update, which computes the targets under no_grad and runs the
+online network of DDQN and QRDQN once on the concatenated batch. Reports the milliseconds per update of both.
+With --tensors the batches are device tensors, like the batches of the PrefetchSampler (use_prefetch: True).
+'''
+import argparse
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from gym.spaces import Discrete
+from xuanpolicy.torch.representations import Basic_CNN, Basic_MLP
+from xuanpolicy.torch.policies import BasicQnetwork, C51Qnetwork, QRDQN_Network
+from xuanpolicy.torch.learners import DQN_Learner, DDQN_Learner, C51_Learner, QRDQN_Learner
+
+ALGORITHMS = ["DQN", "DDQN", "C51", "QRDQN"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("Benchmark the updates of the DQN-family learners.")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--algorithms", type=str, nargs="+", default=ALGORITHMS)
+    parser.add_argument("--mlp", action="store_true")
+    parser.add_argument("--tensors", action="store_true")
+    parser.add_argument("--obs-dim", type=int, default=17)
+    parser.add_argument("--act-dim", type=int, default=6)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--n-updates", type=int, default=200)
+    return parser.parse_args()
+
+
+def make_learner(algorithm, args):
+    if args.mlp:
+        representation = Basic_MLP((args.obs_dim,), [256, 256], None, None, nn.ReLU, args.device)
+    else:
+        representation = Basic_CNN((84, 84, 4), [8, 4, 3], [4, 2, 1], [32, 64, 64], None, None, nn.ReLU, args.device)
+    action_space = Discrete(args.act_dim)
+    if algorithm in ["DQN", "DDQN"]:
+        policy = BasicQnetwork(action_space, representation, [512], None, None, nn.ReLU, args.device)
+    elif algorithm == "C51":
+        policy = C51Qnetwork(action_space, 51, -10, 10, representation, [512], None, None, nn.ReLU, args.device)
+    elif algorithm == "QRDQN":
+        policy = QRDQN_Network(action_space, 200, representation, [512], None, None, nn.ReLU, args.device)
+    else:
+        raise NotImplementedError
+    optimizer = torch.optim.Adam(policy.parameters(), 1e-4)
+    learners = {"DQN": DQN_Learner, "DDQN": DDQN_Learner, "C51": C51_Learner, "QRDQN": QRDQN_Learner}
+    return learners[algorithm](policy, optimizer, None, args.device, "./", 0.99, 100)
+
+
+def former_update(algorithm, learner, obs_batch, act_batch, rew_batch, next_batch, terminal_batch):
+    """The update before the targets were computed under no_grad, with separate forwards of the batches."""
+    policy = learner.policy
+    act_batch = torch.as_tensor(act_batch, device=learner.device).long()
+    rew_batch = torch.as_tensor(rew_batch, device=learner.device)
+    ter_batch = torch.as_tensor(terminal_batch, device=learner.device)
+    if algorithm in ["DQN", "DDQN"]:
+        _, _, evalQ = policy(obs_batch)
+        if algorithm == "DQN":
+            targetQ = policy.target(next_batch)[2].max(dim=-1).values
+        else:
+            _, targetA, targetQ = policy(next_batch)
+            targetQ = (targetQ * F.one_hot(targetA, targetQ.shape[-1])).sum(dim=-1)
+        targetQ = rew_batch + learner.gamma * (1 - ter_batch) * targetQ
+        loss = F.mse_loss((evalQ * F.one_hot(act_batch, evalQ.shape[1])).sum(dim=-1), targetQ)
+    elif algorithm == "C51":
+        _, _, evalZ = policy(obs_batch)
+        _, targetA, targetZ = policy.target(next_batch)
+        current_dist = (evalZ * F.one_hot(act_batch, evalZ.shape[1]).unsqueeze(-1)).sum(1)
+        target_dist = (targetZ * F.one_hot(targetA.detach(), evalZ.shape[1]).unsqueeze(-1)).sum(1).detach()
+        next_supports = rew_batch.unsqueeze(1) + learner.gamma * policy.supports * (1 - ter_batch.unsqueeze(1))
+        next_supports = next_supports.clamp(policy.vmin, policy.vmax)
+        projection = 1 - (next_supports.unsqueeze(-1) - policy.supports.unsqueeze(0)).abs() / policy.deltaz
+        target_dist = torch.bmm(target_dist.unsqueeze(1), projection.clamp(0, 1)).squeeze(1)
+        loss = -(target_dist * torch.log(current_dist + 1e-8)).sum(1).mean()
+    else:
+        _, _, evalZ = policy(obs_batch)
+        _, targetA, targetZ = policy(next_batch)
+        current_quantile = (evalZ * F.one_hot(act_batch, evalZ.shape[1]).unsqueeze(-1)).sum(1)
+        target_quantile = (targetZ * F.one_hot(targetA.detach(), evalZ.shape[1]).unsqueeze(-1)).sum(1).detach()
+        target_quantile = rew_batch.unsqueeze(1) + learner.gamma * target_quantile * (1 - ter_batch.unsqueeze(1))
+        loss = F.mse_loss(target_quantile, current_quantile)
+    learner.optimizer.zero_grad()
+    loss.backward()
+    learner.optimizer.step()
+
+
+def make_batches(args):
+    obs_shape = (args.obs_dim,) if args.mlp else (84, 84, 4)
+    if args.mlp:
+        observations = [np.random.randn(args.batch_size, *obs_shape).astype(np.float32) for _ in range(4)]
+    else:
+        observations = [np.random.randint(0, 256, (args.batch_size,) + obs_shape, np.uint8) for _ in range(4)]
+    batches = [(observations[i], np.random.randint(0, args.act_dim, args.batch_size),
+                np.random.randn(args.batch_size).astype(np.float32), observations[(i + 1) % 4],
+                (np.random.rand(args.batch_size) < 0.05).astype(np.float32)) for i in range(4)]
+    if args.tensors:
+        return [tuple(torch.as_tensor(data, device=args.device) for data in batch) for batch in batches]
+    return batches
+
+
+def timed(update, batches, args):
+    for step in range(5):
+        update(*batches[step % len(batches)])
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for step in range(args.n_updates):
+        update(*batches[step % len(batches)])
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / args.n_updates * 1e3
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    batches = make_batches(args)
+    for algorithm in args.algorithms:
+        torch.manual_seed(1)
+        learner = make_learner(algorithm, args)
+        former = timed(lambda *batch: former_update(algorithm, learner, *batch), batches, args)
+        batched = timed(learner.update, batches, args)
+        print("%s: former update %.2f ms, learner.update %.2f ms (x%.2f)" % (algorithm, former, batched,
+                                                                              former / batched))
@@ -0,0 +1,76 @@
+'''
+Benchmark of the action selection of the agents.
+
+$ python benchmarks/benchmark_inference.py --device cuda:0 --n-envs 8 --obs-dim 17
+
+Times one action selection per environment step for a DQN policy (greedy actions) and a Gaussian PPO policy
+(sampled actions, values and log-probabilities): the former path, which runs the policy with autograd and converts
+each output with .detach().cpu().numpy(), against policy.act_numpy. Reports the mean, p50 and p99 latency in
+microseconds per step.
+'''
+import argparse
+import time
+import numpy as np
+import torch.nn as nn
+from gym.spaces import Box, Discrete
+from xuanpolicy.torch.representations import Basic_MLP
+from xuanpolicy.torch.policies import BasicQnetwork, Gaussian_AC_Policy
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("Benchmark the action selection of the agents.")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--obs-dim", type=int, default=17)
+    parser.add_argument("--act-dim", type=int, default=6)
+    parser.add_argument("--n-steps", type=int, default=5000)
+    return parser.parse_args()
+
+
+def dqn_former(policy, obs):
+    _, argmax_action, _ = policy(obs)
+    return argmax_action.detach().cpu().numpy()
+
+
+def dqn_act_numpy(policy, obs):
+    return policy.act_numpy(obs, sample=lambda outputs, argmax_action, evalQ: argmax_action)
+
+
+def ppo_former(policy, obs):
+    _, dists, vs = policy(obs)
+    acts = dists.stochastic_sample()
+    logps = dists.log_prob(acts)
+    return acts.detach().cpu().numpy(), vs.detach().cpu().numpy(), logps.detach().cpu().numpy()
+
+
+def ppo_act_numpy(policy, obs):
+    def sample(outputs, dists, vs):
+        acts = dists.stochastic_sample()
+        return acts, vs, dists.log_prob(acts)
+    return policy.act_numpy(obs, sample=sample)
+
+
+def run(action_fn, policy, args):
+    # the observations are float64 like the normalized observations of the agents
+    observations = [np.random.randn(args.n_envs, args.obs_dim) for _ in range(16)]
+    for step in range(100):
+        action_fn(policy, observations[step % len(observations)])
+    latencies = np.zeros(args.n_steps)
+    for step in range(args.n_steps):
+        start = time.perf_counter()
+        action_fn(policy, observations[step % len(observations)])
+        latencies[step] = (time.perf_counter() - start) * 1e6
+    return latencies.mean(), np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    representation = Basic_MLP((args.obs_dim,), [256, 256], None, None, nn.ReLU, args.device)
+    dqn = BasicQnetwork(Discrete(args.act_dim), representation, [256], None, None, nn.ReLU, args.device)
+    representation = Basic_MLP((args.obs_dim,), [256, 256], None, None, nn.ReLU, args.device)
+    ppo = Gaussian_AC_Policy(Box(-1, 1, (args.act_dim,)), representation, [256], [256], None, None, nn.ReLU,
+                             args.device)
+    for name, policy, action_fn in [("DQN former", dqn, dqn_former), ("DQN act_numpy", dqn, dqn_act_numpy),
+                                    ("PPO former", ppo, ppo_former), ("PPO act_numpy", ppo, ppo_act_numpy)]:
+        mean, p50, p99 = run(action_fn, policy.to(args.device), args)
+        print("%s: %.1f us/step mean, %.1f us p50, %.1f us p99" % (name, mean, p50, p99))
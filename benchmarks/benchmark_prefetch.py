@@ -0,0 +1,120 @@
+'''
+Benchmark of the background prefetching sampler for off-policy agents.
+
+$ python benchmarks/benchmark_prefetch.py --device cuda:0 --obs-dim 84 --batch-size 256
+$ python benchmarks/benchmark_prefetch.py --device cuda:0 --atari --batch-size 32
+
+Mimics the DQN training loop: every training_frequency steps a batch is sampled from the replay buffer and used for
+one DQN_Learner.update, with a Basic_MLP or, with --atari, the Basic_CNN of the atari configs on 84x84x4 uint8 frames.
+Reports the wall-clock time per training step with synchronous sampling and with the PrefetchSampler.
+Before timing, checks that an update from a prefetched batch, whose arrays are tensors on the device, gives the same
+loss and weights as an update from the same numpy batch.
+'''
+import argparse
+import copy
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from gym.spaces import Box, Discrete
+from xuanpolicy.common.memory_tools import DummyOffPolicyBuffer, DummyOffPolicyBuffer_Atari
+from xuanpolicy.torch.representations import Basic_MLP, Basic_CNN
+from xuanpolicy.torch.policies import BasicQnetwork
+from xuanpolicy.torch.learners import DQN_Learner
+from xuanpolicy.torch.utils.sampler import PrefetchSampler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("Benchmark the prefetching sampler of off-policy agents.")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--atari", action="store_true")
+    parser.add_argument("--n-envs", type=int, default=8)
+    parser.add_argument("--n-size", type=int, default=100000)
+    parser.add_argument("--obs-dim", type=int, default=84)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--training-frequency", type=int, default=1)
+    parser.add_argument("--n-steps", type=int, default=2000)
+    parser.add_argument("--queue-size", type=int, default=2)
+    return parser.parse_args()
+
+
+def make_memory(args):
+    if args.atari:
+        observation_space = Box(0, 255, (84, 84, 4), np.uint8)
+        return DummyOffPolicyBuffer_Atari(observation_space, Discrete(4), {}, args.n_envs,
+                                          args.n_size // args.n_envs, args.batch_size)
+    observation_space = Box(-np.inf, np.inf, (args.obs_dim,))
+    return DummyOffPolicyBuffer(observation_space, Discrete(4), {}, args.n_envs, args.n_size // args.n_envs,
+                                args.batch_size)
+
+
+def make_learner(args):
+    if args.atari:
+        representation = Basic_CNN((84, 84, 4), [8, 4, 3], [4, 2, 1], [32, 64, 64], None, None, nn.ReLU, args.device)
+    else:
+        representation = Basic_MLP((args.obs_dim,), [512], None, None, nn.ReLU, args.device)
+    policy = BasicQnetwork(Discrete(4), representation, [512], None, None, nn.ReLU, args.device)
+    optimizer = torch.optim.Adam(policy.parameters(), 1e-4)
+    return DQN_Learner(policy, optimizer, None, args.device, "./", 0.99, 100)
+
+
+def random_obs(args):
+    if args.atari:
+        return np.random.randint(0, 256, (args.n_envs, 84, 84, 4), np.uint8)
+    return np.random.randn(args.n_envs, args.obs_dim).astype(np.float32)
+
+
+def store_step(memory, obs, args):
+    next_obs = random_obs(args)
+    memory.store(obs, np.random.randint(0, 4, args.n_envs), np.random.randn(args.n_envs),
+                 np.random.rand(args.n_envs) < 0.01, next_obs)
+    return next_obs
+
+
+def check_prefetched_update(args):
+    """Asserts that DQN_Learner.update gives the same results from a numpy batch and from its prefetched tensors."""
+    memory, obs = make_memory(args), random_obs(args)
+    for _ in range(args.batch_size):
+        obs = store_step(memory, obs, args)
+    batch = memory.sample()
+    prefetched = PrefetchSampler(memory, args.device)._to_tensor(batch)
+    assert all(isinstance(data, torch.Tensor) for data in prefetched)
+    learner = make_learner(args)
+    learner_prefetched = copy.deepcopy(learner)
+    info = learner.update(*batch[:3], batch[4], batch[3])
+    info_prefetched = learner_prefetched.update(*prefetched[:3], prefetched[4], prefetched[3])
+    assert np.isclose(info["Qloss"], info_prefetched["Qloss"], rtol=1e-4), (info, info_prefetched)
+    for p, p_prefetched in zip(learner.policy.parameters(), learner_prefetched.policy.parameters()):
+        assert torch.allclose(p, p_prefetched, atol=1e-6)
+
+
+def run(args, use_prefetch):
+    memory = make_memory(args)
+    if use_prefetch:
+        memory = PrefetchSampler(memory, args.device, args.queue_size)
+    learner = make_learner(args)
+    obs = random_obs(args)
+    for _ in range(args.batch_size):
+        obs = store_step(memory, obs, args)
+
+    start = time.time()
+    for step in range(args.n_steps):
+        obs = store_step(memory, obs, args)
+        if step % args.training_frequency == 0:
+            obs_batch, act_batch, rew_batch, terminal_batch, next_batch = memory.sample()
+            learner.update(obs_batch, act_batch, rew_batch, next_batch, terminal_batch)
+    if args.device.startswith("cuda"):
+        torch.cuda.synchronize()
+    elapsed = time.time() - start
+    if use_prefetch:
+        memory.close()
+    n_updates = len(range(0, args.n_steps, args.training_frequency))
+    return elapsed / n_updates * 1000
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    check_prefetched_update(args)
+    print("A prefetched batch gives the same update as the numpy batch.")
+    print("Synchronous sampling: %.3f ms per training step" % run(args, use_prefetch=False))
+    print("Prefetching sampler: %.3f ms per training step" % run(args, use_prefetch=True))
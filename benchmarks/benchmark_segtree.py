@@ -0,0 +1,98 @@
+'''
+Micro-benchmark of the prioritized replay segment tree.
+
+$ python benchmarks/benchmark_segtree.py --n-size 1000000 --batch-size 256
+
+Compares the array-backed SumSegmentTree/MinSegmentTree against the former list-based tree
+with per-index updates and searches, measured in sampled transitions per second.
+'''
+import argparse
+import operator
+import time
+import numpy as np
+from xuanpolicy.common.segtree_tool import SumSegmentTree, MinSegmentTree
+
+
+class ListSegmentTree(object):
+    """The former list-based segment tree, kept here as the reference implementation."""
+    def __init__(self, capacity, operation, neutral_element):
+        self._capacity = capacity
+        self._value = [neutral_element for _ in range(2 * capacity)]
+        self._operation = operation
+
+    def __setitem__(self, idx, val):
+        idx += self._capacity
+        self._value[idx] = val
+        idx //= 2
+        while idx >= 1:
+            self._value[idx] = self._operation(self._value[2 * idx], self._value[2 * idx + 1])
+            idx //= 2
+
+    def __getitem__(self, idx):
+        return self._value[self._capacity + idx]
+
+    def find_prefixsum_idx(self, prefixsum):
+        idx = 1
+        while idx < self._capacity:
+            if self._value[2 * idx] > prefixsum:
+                idx = 2 * idx
+            else:
+                prefixsum -= self._value[2 * idx]
+                idx = 2 * idx + 1
+        return idx - self._capacity
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("Benchmark the segment trees of prioritized replay buffer.")
+    parser.add_argument("--n-size", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--n-iters", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def run_list_tree(capacity, priorities, batch_size, n_iters):
+    it_sum = ListSegmentTree(capacity, operator.add, 0.0)
+    it_min = ListSegmentTree(capacity, min, float('inf'))
+    for i, p in enumerate(priorities):
+        it_sum[i] = p
+        it_min[i] = p
+    start = time.time()
+    for _ in range(n_iters):
+        p_total = it_sum._value[1]
+        masses = (np.random.random(batch_size) + np.arange(batch_size)) * p_total / batch_size
+        idxes = [it_sum.find_prefixsum_idx(m) for m in masses]
+        weights = [it_sum[idx] / p_total for idx in idxes]
+        for idx, w in zip(idxes, weights):
+            it_sum[idx] = w
+            it_min[idx] = w
+    return n_iters * batch_size / (time.time() - start)
+
+
+def run_array_tree(capacity, priorities, batch_size, n_iters):
+    it_sum = SumSegmentTree(capacity)
+    it_min = MinSegmentTree(capacity)
+    it_sum[np.arange(len(priorities))] = priorities
+    it_min[np.arange(len(priorities))] = priorities
+    start = time.time()
+    for _ in range(n_iters):
+        p_total = it_sum.sum()
+        masses = (np.random.random(batch_size) + np.arange(batch_size)) * p_total / batch_size
+        idxes = it_sum.find_prefixsum_idx(masses)
+        weights = it_sum[idxes] / p_total
+        it_sum[idxes] = weights
+        it_min[idxes] = weights
+    return n_iters * batch_size / (time.time() - start)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    np.random.seed(args.seed)
+    capacity = 1
+    while capacity < args.n_size:
+        capacity *= 2
+    priorities = np.random.random(args.n_size) + 1e-3
+    print("List-based segment tree: %.1f samples/s" % run_list_tree(capacity, priorities, args.batch_size,
+                                                                    args.n_iters))
+    print("Array-based segment tree: %.1f samples/s" % run_array_tree(capacity, priorities, args.batch_size,
+                                                                      args.n_iters))
@@ -0,0 +1,83 @@
+'''
+Benchmark of the vectorized gym environments.
+
+$ python benchmarks/benchmark_vec_env.py --env-id CartPole-v1 --parallels 32
+$ python benchmarks/benchmark_vec_env.py --atari --env-id ALE/Breakout-v5 --parallels 32
+$ python benchmarks/benchmark_vec_env.py --context spawn --vec-envs Subproc Shmem
+
+Steps DummyVecEnv_Gym, ThreadVecEnv_Gym, SubprocVecEnv_Gym and ShmemVecEnv_Gym with random actions and reports the
+environment steps per second of each, the startup time until the first reset returns, and the resident memory of the
+main process plus the workers (Linux only). --context sets the start method of the workers, the first vec env started
+from the forkserver also pays for starting the server.
+ThreadVecEnv_Gym only scales with the simulators that release the GIL, compare it on Atari rather than CartPole.
+'''
+import argparse
+import os
+import time
+import numpy as np
+from xuanpolicy.environment.gym.gym_env import Gym_Env, Atari_Env
+from xuanpolicy.environment.gym.gym_vec_env import DummyVecEnv_Gym, ThreadVecEnv_Gym, SubprocVecEnv_Gym, \
+    ShmemVecEnv_Gym
+
+VEC_ENVS = {
+    "Dummy": DummyVecEnv_Gym,
+    "Thread": ThreadVecEnv_Gym,
+    "Subproc": SubprocVecEnv_Gym,
+    "Shmem": ShmemVecEnv_Gym
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser("Benchmark the vectorized gym environments.")
+    parser.add_argument("--env-id", type=str, default="CartPole-v1")
+    parser.add_argument("--atari", action="store_true")
+    parser.add_argument("--parallels", type=int, default=32)
+    parser.add_argument("--n-steps", type=int, default=1000)
+    parser.add_argument("--vec-envs", type=str, nargs="+", default=list(VEC_ENVS.keys()))
+    parser.add_argument("--context", type=str, default="forkserver")
+    return parser.parse_args()
+
+
+def make_env_fns(args):
+    def _thunk(seed):
+        if args.atari:
+            return Atari_Env(args.env_id, seed, "rgb_array", "grayscale", 4, 4, [84, 84], 30)
+        return Gym_Env(args.env_id, seed, None)
+    return [lambda seed=seed: _thunk(seed) for seed in range(args.parallels)]
+
+
+def rss_mb(vec_env):
+    """Resident memory in MB of the main process and the worker processes of vec_env, read from /proc."""
+    pids = [os.getpid()] + [p.pid for p in getattr(vec_env, "ps", [])]
+    pages = sum(int(open("/proc/%d/statm" % pid).read().split()[1]) for pid in pids)
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def run(vec_env, n_steps):
+    vec_env.reset()
+    actions = [np.stack([vec_env.action_space.sample() for _ in range(vec_env.num_envs)]) for _ in range(16)]
+    start = time.time()
+    for step in range(n_steps):
+        vec_env.step(actions[step % len(actions)])
+    steps_per_second = n_steps * vec_env.num_envs / (time.time() - start)
+    memory = rss_mb(vec_env)
+    vec_env.close()
+    return steps_per_second, memory
+
+
+def make_vec_env(name, args):
+    if name in ["Subproc", "Shmem"]:
+        return VEC_ENVS[name](make_env_fns(args), args.context)
+    return VEC_ENVS[name](make_env_fns(args))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for name in args.vec_envs:
+        start = time.time()
+        vec_env = make_vec_env(name, args)
+        vec_env.reset()
+        startup = time.time() - start
+        steps_per_second, memory = run(vec_env, args.n_steps)
+        print("%s: %.1f steps/s, %.2f s startup, %.1f MB RSS" % (VEC_ENVS[name].__name__, steps_per_second, startup,
+                                                                memory))
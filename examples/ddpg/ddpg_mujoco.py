@@ -109,6 +109,7 @@ def run(args):
 
     # the end.
     envs.close()
+    agent.metrics.close()
     if agent.use_wandb:
         wandb.finish()
     else:
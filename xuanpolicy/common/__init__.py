@@ -1,5 +1,6 @@
 from xuanpolicy.common.common_tools import *
 from xuanpolicy.common.statistic_tools import *
+from xuanpolicy.common.metric_tools import *
 from xuanpolicy.common.memory_tools import *
 from xuanpolicy.common.memory_tools_marl import *
 from xuanpolicy.common.segtree_tool import *
@@ -132,6 +132,7 @@ def get_runner(method,
             notation = args[i_alg].dl_toolbox + '/'
             args[i_alg].model_dir = os.path.join(os.getcwd(), args[i_alg].model_dir + notation + args[i_alg].env_id + '/')
             args[i_alg].log_dir = args[i_alg].log_dir + notation + args[i_alg].env_id + '/'
+            args[i_alg].buffer_dir = os.path.join(os.getcwd(), args[i_alg].buffer_dir + notation + args[i_alg].env_id + '/')
             if is_test:
                 args[i_alg].test_mode = int(is_test)
                 args[i_alg].parallels = 1
@@ -150,6 +151,7 @@ def get_runner(method,
         notation = args.dl_toolbox + '/'
         args.model_dir = os.path.join(os.getcwd(), args.model_dir, args.dl_toolbox, args.env_id)
         args.log_dir = os.path.join(args.log_dir, notation, args.env_id)
+        args.buffer_dir = os.path.join(os.getcwd(), args.buffer_dir, args.dl_toolbox, args.env_id)
         if is_test:
             args.test_mode = int(is_test)
             args.parallels = 1
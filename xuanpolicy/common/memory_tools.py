@@ -1,25 +1,72 @@
-import random
+import os
+import shutil
+import tempfile
+import weakref
 import numpy as np
 from gym import Space
 from abc import ABC, abstractmethod
 from typing import Optional, Union
 from xuanpolicy.common import space2shape, discount_cumsum
 from xuanpolicy.common.segtree_tool import SumSegmentTree, MinSegmentTree
-from collections import deque
-from typing import Dict
+
+
+def create_ram_array(shape: tuple, dtype: type, file_path: Optional[str] = None):
+    """Allocate an in-RAM numpy array."""
+    return np.zeros(shape, dtype)
+
+
+def create_memmap_array(shape: tuple, dtype: type, file_path: Optional[str] = None):
+    """
+    Create a new memory-mapped array saved in file_path (.npy format).
+    An existing file is unlinked first, so that the arrays still mapping it are not truncated.
+    """
+    assert file_path is not None, "A file path is required for the memmap storage."
+    file_path = file_path if file_path.endswith(".npy") else file_path + ".npy"
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    return np.lib.format.open_memmap(file_path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+
+def create_storage_dir(owner, storage: str, storage_dir: Optional[str]):
+    """
+    Create a directory of its own under storage_dir for the memmap files of a buffer (owner), named after the process
+    id, so that concurrent runs never share the files. The directory is removed with the owner or at exit.
+    Returns storage_dir unchanged for the other storages.
+    The files are never reused by a restarted run: the buffer of a resumed run is restored from the save_buffer
+    snapshot of its checkpoint (Buffer.load), which is read memory-mapped and copied into the new files.
+    """
+    if storage != "memmap" or storage_dir is None:
+        return storage_dir
+    os.makedirs(storage_dir, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix="pid%d_" % os.getpid(), dir=storage_dir)
+    weakref.finalize(owner, shutil.rmtree, run_dir, True)
+    return run_dir
+
+
+MEMORY_STORAGE = {
+    "ram": create_ram_array,
+    "memmap": create_memmap_array
+}
 
 
 def create_memory(shape: Optional[Union[tuple, dict]],
                   n_envs: int,
                   n_size: int,
-                  dtype: type = np.float32):
+                  dtype: type = np.float32,
+                  storage: str = "ram",
+                  file_path: Optional[str] = None):
     """
     Create a numpy array for memory data.
         shape: data shape.
         n_envs: number of parallel environments.
         n_size: length of data sequence for each environment.
         dtype: numpy data type.
+        storage: storage backend of the array, choices: "ram", "memmap".
+        file_path: file path of the array for the memmap storage (a suffix "_key" is added for dict shape).
     """
+    create_array = MEMORY_STORAGE[storage]
     if shape is None:
         return None
     elif isinstance(shape, dict):
@@ -28,10 +75,11 @@ def create_memory(shape: Optional[Union[tuple, dict]],
             if value is None:  # save an object type
                 memory[key] = np.zeros([n_envs, n_size], dtype=object)
             else:
-                memory[key] = np.zeros([n_envs, n_size] + list(value), dtype=dtype)
+                key_path = None if file_path is None else file_path + "_" + str(key)
+                memory[key] = create_array(tuple([n_envs, n_size] + list(value)), dtype, key_path)
         return memory
     elif isinstance(shape, tuple):
-        return np.zeros([n_envs, n_size] + list(shape), dtype)
+        return create_array(tuple([n_envs, n_size] + list(shape)), dtype, file_path)
     else:
         raise NotImplementedError
 
@@ -72,22 +120,166 @@ def sample_batch(memory: Optional[Union[np.ndarray, dict]],
         return memory[index]
 
 
+def sample_flat_batch(memory: Optional[Union[np.ndarray, dict]],
+                      flat_index: np.ndarray):
+    """
+    Sample a batch of data with the flat index env_choices * n_size + step_choices.
+    It gathers the same data as sample_batch, but with a single np.take on the (n_envs * n_size) view of the memory.
+        memory: memory that contains experience data.
+        flat_index: flat index of the selected data.
+    """
+    if memory is None:
+        return None
+    elif isinstance(memory, dict):
+        return {key: sample_flat_batch(value, flat_index) for key, value in memory.items()}
+    else:
+        return np.take(memory.reshape((-1, ) + memory.shape[2:]), flat_index, axis=0)
+
+
+def get_memory_state(buffer, keys):
+    """
+    Collect the state of a buffer as a flat dict of arrays.
+        buffer: the buffer (or a part of it, e.g., AtariFrameMemory).
+        keys: names of the attributes to collect, the dicts of arrays and the objects with state_dict() are
+              flattened with the keys "name.key", the missing or None attributes are skipped.
+    """
+    state = {}
+    for name in keys:
+        value = getattr(buffer, name, None)
+        if value is None:
+            continue
+        elif isinstance(value, dict):
+            state.update({name + "." + str(k): v for k, v in value.items()})
+        elif hasattr(value, "state_dict"):
+            state.update({name + "." + k: v for k, v in value.state_dict().items()})
+        else:
+            state[name] = np.asarray(value)
+    return state
+
+
+def set_memory_state(buffer, keys, state: dict):
+    """
+    Restore the state collected by get_memory_state() into a buffer built with the same configuration.
+    The arrays are copied in place, so the memories keep their storage (e.g., memmap).
+    """
+    for name in keys:
+        value = getattr(buffer, name, None)
+        if value is None:
+            continue
+        elif isinstance(value, dict):
+            for k in value.keys():
+                value[k][...] = state[name + "." + str(k)]
+        elif hasattr(value, "load_state_dict"):
+            prefix = name + "."
+            value.load_state_dict({k[len(prefix):]: v for k, v in state.items() if k.startswith(prefix)})
+        elif isinstance(value, np.ndarray):
+            assert value.shape == state[name].shape, f"The shape of {name} does not match the snapshot."
+            value[...] = state[name]
+        else:
+            setattr(buffer, name, state[name].item())
+
+
+def save_memory_state(path: str, state: dict):
+    """
+    Save the state of a buffer as a directory of .npy files, one file for each array.
+    The snapshot is written to a temporary directory first, so a run interrupted while saving keeps the last one.
+    """
+    tmp_path = path.rstrip("/") + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+    for name, value in state.items():
+        np.save(os.path.join(tmp_path, name + ".npy"), value)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+
+
+def load_memory_state(path: str):
+    """Load a snapshot saved by save_memory_state(), the arrays are memory-mapped rather than read at once."""
+    state = {}
+    for file in os.listdir(path):
+        if not file.endswith(".npy"):
+            continue
+        try:
+            state[file[:-4]] = np.load(os.path.join(path, file), mmap_mode='r')
+        except ValueError:  # arrays of python objects can not be memory-mapped
+            state[file[:-4]] = np.load(os.path.join(path, file), allow_pickle=True)
+    return state
+
+
 class Buffer(ABC):
     """
     Basic buffer single-agent DRL algorithms.
     """
+    state_keys = ['ptr', 'size']
+
     def __init__(self,
                  observation_space: Space,
                  action_space: Space,
-                 auxiliary_info_shape: Optional[dict]):
+                 auxiliary_info_shape: Optional[dict],
+                 storage: str = "ram",
+                 storage_dir: Optional[str] = None):
         self.observation_space = observation_space
         self.action_space = action_space
         self.auxiliary_shape = auxiliary_info_shape
+        self.storage, self.storage_dir = storage, create_storage_dir(self, storage, storage_dir)
         self.size, self.ptr = 0, 0
 
+    def _create_memory(self, name, shape, dtype=np.float32, n_size=None):
+        """Create memory with the storage of this buffer, the memmap files are named after the field."""
+        file_path = None if self.storage_dir is None else os.path.join(self.storage_dir, name)
+        n_size = self.n_size if n_size is None else n_size
+        return create_memory(shape, self.n_envs, n_size, dtype, self.storage, file_path)
+
+    def _create_record(self, name, shapes):
+        """
+        Create the memories of small float32 fields as views of one record memory,
+        so that all the fields of a batch are gathered at once by _sample_record().
+        The fields are created separately if any of the shapes is a dict.
+            name: name of the record memory.
+            shapes: the names and the shapes of the fields.
+        """
+        self.record_keys = list(shapes.keys())
+        if not all(isinstance(shape, tuple) for shape in shapes.values()):
+            self.record, self.record_slices = None, None
+            for key, shape in shapes.items():
+                setattr(self, key, self._create_memory(key, shape))
+            return
+        sizes = [int(np.prod(shape)) for shape in shapes.values()]
+        offsets = np.cumsum([0] + sizes)
+        self.record = self._create_memory(name, (int(offsets[-1]), ))
+        self.record_slices = []
+        for (key, shape), start, end in zip(shapes.items(), offsets[:-1], offsets[1:]):
+            field = self.record[..., start:end].reshape(self.record.shape[:2] + shape)
+            assert np.shares_memory(field, self.record)
+            setattr(self, key, field)
+            self.record_slices.append((slice(start, end), shape))
+
+    def _sample_record(self, flat_index):
+        """Gather the fields created by _create_record() with the flat index, in the order of their names."""
+        if self.record is None:
+            return [sample_flat_batch(getattr(self, key), flat_index) for key in self.record_keys]
+        batch = sample_flat_batch(self.record, flat_index)
+        return [batch[:, index].reshape((len(flat_index), ) + shape) for index, shape in self.record_slices]
+
     def full(self):
         pass
 
+    def state_dict(self):
+        return get_memory_state(self, self.state_keys)
+
+    def load_state_dict(self, state):
+        set_memory_state(self, self.state_keys, state)
+
+    def save(self, path):
+        """Save the stored data and the pointers of this buffer in the directory path."""
+        save_memory_state(path, self.state_dict())
+
+    def load(self, path):
+        """Load the data saved by save(path) into this buffer."""
+        self.load_state_dict(load_memory_state(path))
+
     @abstractmethod
     def store(self, *args):
         raise NotImplementedError
@@ -104,42 +296,6 @@ class Buffer(ABC):
         pass
 
 
-class EpisodeBuffer:
-    """
-    Episode buffer for DRQN agent.
-    """
-    def __init__(self):
-        self.obs = []
-        self.action = []
-        self.reward = []
-        self.done = []
-
-    def put(self, transition):
-        self.obs.append(transition[0])
-        self.action.append(transition[1])
-        self.reward.append(transition[2])
-        self.done.append(transition[3])
-
-    def sample(self, lookup_step=None, idx=None) -> Dict[str, np.ndarray]:
-        obs = np.array(self.obs)
-        action = np.array(self.action)
-        reward = np.array(self.reward)
-        done = np.array(self.done)
-
-        obs = obs[idx:idx + lookup_step + 1]
-        action = action[idx:idx + lookup_step]
-        reward = reward[idx:idx + lookup_step]
-        done = done[idx:idx + lookup_step]
-
-        return dict(obs=obs,
-                    acts=action,
-                    rews=reward,
-                    done=done)
-
-    def __len__(self) -> int:
-        return len(self.action)
-
-
 class DummyOnPolicyBuffer(Buffer):
     """
     Replay buffer for on-policy DRL algorithms.
@@ -153,6 +309,9 @@ class DummyOnPolicyBuffer(Buffer):
         gamma: discount factor.
         gae_lam: gae lambda.
     """
+    state_keys = ['observations', 'actions', 'rewards', 'returns', 'values', 'terminals', 'advantages',
+                  'auxiliary_infos', 'start_ids', 'ptr', 'size']
+
     def __init__(self,
                  observation_space: Space,
                  action_space: Space,
@@ -183,15 +342,9 @@ class DummyOnPolicyBuffer(Buffer):
         return self.size >= self.n_size
 
     def clear(self):
+        """Reset the pointers in place, the memory is allocated once and overwritten by the next rollout."""
         self.ptr, self.size = 0, 0
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.returns = create_memory((), self.n_envs, self.n_size)
-        self.values = create_memory((), self.n_envs, self.n_size)
-        self.terminals = create_memory((), self.n_envs, self.n_size)
-        self.advantages = create_memory((), self.n_envs, self.n_size)
-        self.auxiliary_infos = create_memory(self.auxiliary_shape, self.n_envs, self.n_size)
+        self.start_ids[:] = 0
 
     def store(self, obs, acts, rews, value, terminals, aux_info=None):
         store_element(obs, self.observations, self.ptr)
@@ -228,6 +381,41 @@ class DummyOnPolicyBuffer(Buffer):
         self.advantages[i, path_slice] = advantages
         self.start_ids[i] = self.ptr
 
+    def finish_all_paths(self, last_values, dones, env_mask=None):
+        """
+        Compute the returns and advantages of the open paths of all environments in one reverse scan.
+            last_values: bootstrap values of the environments, shape: (n_envs, ).
+            dones: terminal flags, the bootstrap values of the terminated environments are ignored.
+            env_mask: environments whose paths are finished, default is all the environments.
+        """
+        env_mask = np.ones(self.n_envs, bool) if env_mask is None else np.asarray(env_mask, bool)
+        end = self.n_size if self.full else self.ptr
+        start_ids = np.where(env_mask, self.start_ids, end)
+        start = start_ids.min()
+        if start < end:
+            last_values = np.where(np.asarray(dones, bool), 0.0, last_values).astype(self.values.dtype)
+            rewards = self.rewards[:, start:end]
+            values = self.values[:, start:end]
+            in_path = np.arange(start, end)[None, :] >= start_ids[:, None]  # the slots before a path are masked
+            if self.use_gae:  # use gae
+                not_dones = 1 - self.terminals[:, start:end]
+                next_values = np.concatenate([values[:, 1:], last_values[:, None]], axis=1)
+                deltas = rewards + not_dones * self.gamma * next_values - values
+                advantages = np.zeros_like(rewards)
+                last_gae_lam = np.zeros(self.n_envs, dtype=advantages.dtype)
+                for t in reversed(range(end - start)):
+                    last_gae_lam = deltas[:, t] + not_dones[:, t] * self.gamma * self.gae_lam * last_gae_lam
+                    advantages[:, t] = last_gae_lam
+                returns = advantages + values
+            else:
+                rewards = np.concatenate([rewards, last_values[:, None]], axis=1)
+                returns = discount_cumsum(rewards.T, self.gamma).T[:, :-1]
+                next_values = np.concatenate([values[:, 1:], last_values[:, None]], axis=1)
+                advantages = rewards[:, :-1] + self.gamma * next_values - values
+            self.returns[:, start:end] = np.where(in_path, returns, self.returns[:, start:end])
+            self.advantages[:, start:end] = np.where(in_path, advantages, self.advantages[:, start:end])
+        self.start_ids[env_mask] = self.ptr
+
     def sample(self, indexes):
         assert self.full, "Not enough transitions for on-policy buffer to random sample"
 
@@ -244,6 +432,23 @@ class DummyOnPolicyBuffer(Buffer):
 
         return obs_batch, act_batch, ret_batch, val_batch, adv_batch, aux_batch
 
+    def get_rollout(self):
+        """
+        Returns the whole rollout as views of shape (buffer_size, ...), the i-th item is step i % n_size of env
+        i // n_size as in sample(). The advantages are not normalized.
+        """
+        assert self.full, "Not enough transitions for on-policy buffer to get the rollout"
+
+        def flatten(memory):
+            if memory is None:
+                return None
+            elif isinstance(memory, dict):
+                return {key: flatten(value) for key, value in memory.items()}
+            return memory.reshape((self.buffer_size, ) + memory.shape[2:])
+
+        return (flatten(self.observations), flatten(self.actions), flatten(self.returns), flatten(self.values),
+                flatten(self.advantages), flatten(self.auxiliary_infos))
+
 
 class DummyOffPolicyBuffer(Buffer):
     """
@@ -254,29 +459,32 @@ class DummyOffPolicyBuffer(Buffer):
         n_envs: number of parallel environments.
         n_size: max length of steps to store for one environment.
         batch_size: batch size of transition data for a sample.
+        storage: storage backend of the memory, choices: "ram", "memmap".
+        storage_dir: directory of the memory-mapped files for the memmap storage.
     """
+    state_keys = ['observations', 'next_observations', 'actions', 'auxiliary_infos', 'rewards', 'terminals',
+                  'ptr', 'size']
+
     def __init__(self,
                  observation_space: Space,
                  action_space: Space,
                  auxiliary_shape: Optional[dict],
                  n_envs: int,
                  n_size: int,
-                 batch_size: int):
-        super(DummyOffPolicyBuffer, self).__init__(observation_space, action_space, auxiliary_shape)
+                 batch_size: int,
+                 storage: str = "ram",
+                 storage_dir: Optional[str] = None):
+        super(DummyOffPolicyBuffer, self).__init__(observation_space, action_space, auxiliary_shape,
+                                                   storage, storage_dir)
         self.n_envs, self.n_size, self.batch_size = n_envs, n_size, batch_size
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.next_observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.auxiliary_infos = create_memory(self.auxiliary_shape, self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.terminals = create_memory((), self.n_envs, self.n_size)
+        self.clear()
 
     def clear(self):
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.next_observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.terminals = create_memory((), self.n_envs, self.n_size)
+        self.observations = self._create_memory("observations", space2shape(self.observation_space))
+        self.next_observations = self._create_memory("next_observations", space2shape(self.observation_space))
+        self._create_record("transitions", {"actions": space2shape(self.action_space), "rewards": (), "terminals": ()})
+        self.auxiliary_infos = self._create_memory("auxiliary_infos", self.auxiliary_shape)
+        self.ptr, self.size = 0, 0
 
     def store(self, obs, acts, rews, terminals, next_obs):
         store_element(obs, self.observations, self.ptr)
@@ -290,26 +498,33 @@ class DummyOffPolicyBuffer(Buffer):
     def sample(self):
         env_choices = np.random.choice(self.n_envs, self.batch_size)
         step_choices = np.random.choice(self.size, self.batch_size)
-        obs_batch = sample_batch(self.observations, tuple([env_choices, step_choices]))
-        act_batch = sample_batch(self.actions, tuple([env_choices, step_choices]))
-        rew_batch = sample_batch(self.rewards, tuple([env_choices, step_choices]))
-        terminal_batch = sample_batch(self.terminals, tuple([env_choices, step_choices]))
-        next_batch = sample_batch(self.next_observations, tuple([env_choices, step_choices]))
+        flat_index = env_choices * self.n_size + step_choices
+        obs_batch = sample_flat_batch(self.observations, flat_index)
+        act_batch, rew_batch, terminal_batch = self._sample_record(flat_index)
+        next_batch = sample_flat_batch(self.next_observations, flat_index)
         return obs_batch, act_batch, rew_batch, terminal_batch, next_batch
 
 
 class RecurrentOffPolicyBuffer(Buffer):
     """
-    Replay buffer for DRQN-based algorithms.
+    Replay buffer for DRQN-based algorithms, the steps of each environment are pushed into a ring array and the
+    finished episodes are indexed by their start positions and lengths.
+    Stacked uint8 image observations (Atari) are stored frame by frame with AtariFrameMemory.
         observation_space: the observation space of the environment.
         action_space: the action space of the environment.
         auxiliary_shape: data shape of auxiliary information (if exists).
         n_envs: number of parallel environments.
-        n_size: max length of steps to store for one environment.
-        batch_size: batch size of transition data for a sample.
+        n_size: max number of episodes to store.
+        batch_size: batch size of episode segments for a sample.
         episode_length: data length for an episode.
         lookup_length: the length of history data.
+        step_capacity: max number of steps stored for one environment, default: n_size * (episode_length + 1) / n_envs.
+        obs_dtype: data type of the stored observations.
+        num_stack: number of stacked frames in one observation.
     """
+    state_keys = ['observations', 'obs_end', 'frame_memory', 'actions', 'rewards', 'terminals', 'step_ptr',
+                  'episode_start', 'episode_env', 'episode_pos', 'episode_len', 'ptr', 'size']
+
     def __init__(self,
                  observation_space: Space,
                  action_space: Space,
@@ -318,49 +533,137 @@ class RecurrentOffPolicyBuffer(Buffer):
                  n_size: int,
                  batch_size: int,
                  episode_length: int,
-                 lookup_length: int):
+                 lookup_length: int,
+                 step_capacity: Optional[int] = None,
+                 obs_dtype: type = np.float32,
+                 num_stack: int = 4):
         super(RecurrentOffPolicyBuffer, self).__init__(observation_space, action_space, auxiliary_shape)
         self.n_envs, self.n_size, self.episode_length, self.batch_size = n_envs, n_size, episode_length, batch_size
         self.lookup_length = lookup_length
-        self.memory = deque(maxlen=self.n_size)
+        if step_capacity is None:
+            step_capacity = -(-n_size * (episode_length + 1) // n_envs)
+        self.step_capacity = step_capacity
+        self.obs_dtype = obs_dtype
+        self.num_stack = num_stack
+        self.frame_stacked = np.dtype(obs_dtype) == np.uint8 and \
+            AtariFrameMemory.is_frame_stacked(space2shape(observation_space), num_stack)
+        self.frame_memory = None
+        self.env_index = np.arange(self.n_envs)
+        self.clear()
 
     @property
     def full(self):
         return self.size >= self.n_size
 
     def clear(self, *args):
-        self.memory = deque(maxlen=self.n_size)
+        # steps of each environment, the last observation of an episode takes one more slot.
+        obs_shape = space2shape(self.observation_space)
+        if self.frame_stacked:  # the absolute position of the newest frame of each observation
+            self.observations = None
+            self.obs_end = create_memory((), self.n_envs, self.step_capacity, np.int64)
+            if self.frame_memory is None:
+                self.frame_memory = AtariFrameMemory(obs_shape, self.n_envs, self.step_capacity, self.num_stack)
+            else:
+                self.frame_memory.clear()
+        else:
+            self.observations = create_memory(obs_shape, self.n_envs, self.step_capacity, self.obs_dtype)
+            self.obs_end = None
+        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.step_capacity)
+        self.rewards = create_memory((), self.n_envs, self.step_capacity)
+        self.terminals = create_memory((), self.n_envs, self.step_capacity)
+        self.step_ptr = np.zeros(self.n_envs, np.int64)  # absolute position of the current observation
+        self.episode_start = np.zeros(self.n_envs, np.int64)  # absolute start position of the current episode
+        # index of the finished episodes
+        self.episode_env = np.zeros(self.n_size, np.int64)
+        self.episode_pos = np.zeros(self.n_size, np.int64)
+        self.episode_len = np.zeros(self.n_size, np.int64)
+        self.ptr, self.size = 0, 0
 
-    def store(self, episode):
-        self.memory.append(episode)
-        self.ptr = (self.ptr + 1) % self.n_size
-        self.size = min(self.size + 1, self.n_size)
+    def start_episodes(self, obs, env_ids=None):
+        """Write the first observations of new episodes for env_ids (all the environments by default)."""
+        env_ids = self.env_index if env_ids is None else np.asarray(env_ids, np.int64)
+        self.episode_start[env_ids] = self.step_ptr[env_ids]
+        self._write_obs(env_ids, obs)
+
+    def _write_obs(self, env_ids, obs):
+        """Write the observations of env_ids at their current positions."""
+        pos = self.step_ptr[env_ids] % self.step_capacity
+        if self.frame_stacked:
+            self.obs_end[env_ids, pos] = self.frame_memory.push(env_ids, obs)
+        else:
+            self.observations[env_ids, pos] = obs
+
+    def store(self, acts, rews, terminals, next_obs):
+        """Push one step of all the environments, next_obs is written as the current observation."""
+        pos = self.step_ptr % self.step_capacity
+        self.actions[self.env_index, pos] = acts
+        self.rewards[self.env_index, pos] = rews
+        self.terminals[self.env_index, pos] = terminals
+        self.step_ptr += 1
+        self._write_obs(self.env_index, next_obs)
+
+    def finish_episodes(self, env_ids):
+        """Index the current episodes of env_ids, call start_episodes() for their next episodes."""
+        for i_env in np.asarray(env_ids, np.int64).reshape([-1]):
+            length = self.step_ptr[i_env] - self.episode_start[i_env]
+            if length > 0:
+                self.episode_env[self.ptr] = i_env
+                self.episode_pos[self.ptr] = self.episode_start[i_env]
+                self.episode_len[self.ptr] = length
+                self.ptr = (self.ptr + 1) % self.n_size
+                self.size = min(self.size + 1, self.n_size)
+            self.step_ptr[i_env] += 1  # skip the slot of the last observation
+
+    def _oldest_positions(self):
+        """The absolute positions of the oldest steps of each environment that are not overwritten yet."""
+        oldest_pos = np.maximum(self.step_ptr - self.step_capacity + 1, 0)
+        if not self.frame_stacked:
+            return oldest_pos
+        oldest_end = self.frame_memory.oldest_valid_end()
+        high = self.step_ptr.copy()
+        while np.any(oldest_pos < high):  # binary search for the oldest step whose frames are kept
+            searching = oldest_pos < high
+            mid = (oldest_pos + high) // 2
+            valid = self.obs_end[self.env_index, mid % self.step_capacity] >= oldest_end
+            high = np.where(searching & valid, mid, high)
+            oldest_pos = np.where(searching & (~valid), mid + 1, oldest_pos)
+        return oldest_pos
+
+    def _valid_episodes(self):
+        """Ids, start positions and lengths of the indexed episodes, cut to the steps not overwritten yet."""
+        env_ids = self.episode_env[:self.size]
+        oldest_pos = self._oldest_positions()[env_ids]
+        starts = np.maximum(self.episode_pos[:self.size], oldest_pos)
+        lengths = self.episode_pos[:self.size] + self.episode_len[:self.size] - starts
+        valid_ids = np.where(lengths > 0)[0]
+        return valid_ids, starts[valid_ids], lengths[valid_ids]
+
+    @property
+    def can_sample(self):
+        return len(self._valid_episodes()[0]) > 0
 
     def sample(self):
-        obs_batch, act_batch, rew_batch, terminal_batch = [], [], [], []
-        episode_choices = np.random.choice(self.memory, self.batch_size)
-        length_min = self.episode_length
-        for episode in episode_choices:
-            length_min = min(length_min, len(episode))
-
-        if length_min > self.lookup_length:
-            for episode in episode_choices:
-                start_idx = np.random.randint(0, len(episode) - self.lookup_length + 1)
-                sampled_data = episode.sample(lookup_step=self.lookup_length, idx=start_idx)
-                obs_batch.append(sampled_data["obs"])
-                act_batch.append(sampled_data["acts"])
-                rew_batch.append(sampled_data["rews"])
-                terminal_batch.append(sampled_data["done"])
+        # the steps of the episodes overwritten by the newer steps are not sampled.
+        valid_ids, starts, lengths = self._valid_episodes()
+        assert len(valid_ids) > 0, "No episode to sample, check can_sample first."
+        choices = np.random.choice(len(valid_ids), self.batch_size)
+        env_choices = self.episode_env[valid_ids[choices]]
+        lengths = lengths[choices]
+        lookup_length = min(self.lookup_length, lengths.min())
+        start_ids = starts[choices] + np.random.randint(0, lengths - lookup_length + 1)
+
+        steps = (start_ids[:, None] + np.arange(lookup_length + 1)) % self.step_capacity
+        env_choices = env_choices[:, None]
+        if self.frame_stacked:
+            obs_ends = self.obs_end[env_choices, steps].reshape([-1])
+            obs_batch = self.frame_memory.gather(np.repeat(env_choices[:, 0], lookup_length + 1), obs_ends)
+            obs_batch = obs_batch.reshape(steps.shape + obs_batch.shape[1:])
         else:
-            for episode in episode_choices:
-                start_idx = np.random.randint(0, len(episode) - length_min + 1)
-                sampled_data = episode.sample(lookup_step=length_min, idx=start_idx)
-                obs_batch.append(sampled_data["obs"])
-                act_batch.append(sampled_data["acts"])
-                rew_batch.append(sampled_data["rews"])
-                terminal_batch.append(sampled_data["done"])
-
-        return np.array(obs_batch), np.array(act_batch), np.array(rew_batch), np.array(terminal_batch)
+            obs_batch = self.observations[env_choices, steps]
+        act_batch = self.actions[env_choices, steps[:, :-1]]
+        rew_batch = self.rewards[env_choices, steps[:, :-1]]
+        terminal_batch = self.terminals[env_choices, steps[:, :-1]]
+        return obs_batch, act_batch, rew_batch, terminal_batch
 
 
 class PerOffPolicyBuffer(Buffer):
@@ -373,7 +676,12 @@ class PerOffPolicyBuffer(Buffer):
         n_size: max length of steps to store for one environment.
         batch_size: batch size of transition data for a sample.
         alpha: prioritized factor.
+        storage: storage backend of the memory, choices: "ram", "memmap".
+        storage_dir: directory of the memory-mapped files for the memmap storage.
     """
+    state_keys = ['observations', 'next_observations', 'actions', 'rewards', 'terminals', '_max_priority',
+                  'ptr', 'size']
+
     def __init__(self,
                  observation_space: Space,
                  action_space: Space,
@@ -381,48 +689,53 @@ class PerOffPolicyBuffer(Buffer):
                  n_envs: int,
                  n_size: int,
                  batch_size: int,
-                 alpha: float = 0.6):
-        super(PerOffPolicyBuffer, self).__init__(observation_space, action_space, auxiliary_shape)
+                 alpha: float = 0.6,
+                 storage: str = "ram",
+                 storage_dir: Optional[str] = None):
+        super(PerOffPolicyBuffer, self).__init__(observation_space, action_space, auxiliary_shape,
+                                                 storage, storage_dir)
         self.n_envs, self.n_size, self.batch_size = n_envs, n_size, batch_size
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.next_observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.terminals = create_memory((), self.n_envs, self.n_size)
-
         self._alpha = alpha
 
         # set segment tree size
         it_capacity = 1
         while it_capacity < self.n_size:
             it_capacity *= 2
+        self._it_capacity = it_capacity
 
-        # init segment tree
-        self._it_sum = []
-        self._it_min = []
-        for _ in range(n_envs):
-            self._it_sum.append(SumSegmentTree(it_capacity))
-            self._it_min.append(MinSegmentTree(it_capacity))
-        self._max_priority = np.ones((n_envs))
+        # init memory and segment tree
+        self._it_sum, self._it_min, self._max_priority = [], [], None
+        self.clear()
+
+    def _build_segment_trees(self):
+        self._it_sum = [SumSegmentTree(self._it_capacity) for _ in range(self.n_envs)]
+        self._it_min = [MinSegmentTree(self._it_capacity) for _ in range(self.n_envs)]
+        self._max_priority = np.ones((self.n_envs))
+
+    def state_dict(self):
+        state = super(PerOffPolicyBuffer, self).state_dict()
+        state['it_sum'] = np.stack([tree._value for tree in self._it_sum])
+        state['it_min'] = np.stack([tree._value for tree in self._it_min])
+        return state
+
+    def load_state_dict(self, state):
+        super(PerOffPolicyBuffer, self).load_state_dict(state)
+        for i in range(self.n_envs):
+            self._it_sum[i]._value[:] = state['it_sum'][i]
+            self._it_min[i]._value[:] = state['it_min'][i]
 
     def _sample_proportional(self, env_idx, batch_size):
-        res = []
-        p_total = self._it_sum[env_idx].sum(0, self.size - 1)
+        p_total = self._it_sum[env_idx].sum()
         every_range_len = p_total / batch_size
-        for i in range(batch_size):
-            mass = random.random() * every_range_len + i * every_range_len
-            idx = self._it_sum[env_idx].find_prefixsum_idx(mass)
-            res.append(int(idx))
-        return res
+        mass = (np.random.random(batch_size) + np.arange(batch_size)) * every_range_len
+        return self._it_sum[env_idx].find_prefixsum_idx(mass)
 
     def clear(self):
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.next_observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.terminals = create_memory((), self.n_envs, self.n_size)
-        self._it_sum = []
-        self._it_min = []
+        self.observations = self._create_memory("observations", space2shape(self.observation_space))
+        self.next_observations = self._create_memory("next_observations", space2shape(self.observation_space))
+        self._create_record("transitions", {"actions": space2shape(self.action_space), "rewards": (), "terminals": ()})
+        self._build_segment_trees()
+        self.ptr, self.size = 0, 0
 
     def store(self, obs, acts, rews, terminals, next_obs):
         store_element(obs, self.observations, self.ptr)
@@ -432,40 +745,38 @@ class PerOffPolicyBuffer(Buffer):
         store_element(next_obs, self.next_observations, self.ptr)
 
         # prioritized process
+        priorities = self._max_priority ** self._alpha
         for i in range(self.n_envs):
-            self._it_sum[i][self.ptr] = self._max_priority[i] ** self._alpha
-            self._it_min[i][self.ptr] = self._max_priority[i] ** self._alpha
+            self._it_sum[i][self.ptr] = priorities[i]
+            self._it_min[i][self.ptr] = priorities[i]
 
         self.ptr = (self.ptr + 1) % self.n_size
         self.size = min(self.size + 1, self.n_size)
 
-    def sample(self, beta):
-        env_choices = np.array(range(self.n_envs)).repeat(int(self.batch_size / self.n_envs))
-        step_choices = np.zeros((self.n_envs, int(self.batch_size / self.n_envs)))
-        weights = np.zeros((self.n_envs, int(self.batch_size / self.n_envs)))
+    def _sample_index(self, beta):
+        batch_size_env = int(self.batch_size / self.n_envs)
+        env_choices = np.array(range(self.n_envs)).repeat(batch_size_env)
+        step_choices = np.zeros((self.n_envs, batch_size_env), np.int64)
+        weights = np.zeros((self.n_envs, batch_size_env))
 
         assert beta > 0
 
         for i in range(self.n_envs):
-            idxes = self._sample_proportional(i, int(self.batch_size / self.n_envs))
-
-            weights_ = []
-            p_min = self._it_min[i].min() / self._it_sum[i].sum()
+            idxes = self._sample_proportional(i, batch_size_env)
+            p_total = self._it_sum[i].sum()
+            p_min = self._it_min[i].min() / p_total
             max_weight = p_min * self.size ** (-beta)
-
-            for idx in idxes:
-                p_sample = self._it_sum[i][idx] / self._it_sum[i].sum()
-                weight = p_sample * self.size ** (-beta)
-                weights_.append(weight / max_weight)
+            p_sample = self._it_sum[i][idxes] / p_total
             step_choices[i] = idxes
-            weights[i] = np.array(weights_)
-        step_choices = step_choices.astype(np.uint8)
+            weights[i] = p_sample * self.size ** (-beta) / max_weight
+        return env_choices, step_choices, weights
 
-        obs_batch = sample_batch(self.observations, tuple([env_choices, step_choices.flatten()]))
-        act_batch = sample_batch(self.actions, tuple([env_choices, step_choices.flatten()]))
-        rew_batch = sample_batch(self.rewards, tuple([env_choices, step_choices.flatten()]))
-        terminal_batch = sample_batch(self.terminals, tuple([env_choices, step_choices.flatten()]))
-        next_batch = sample_batch(self.next_observations, tuple([env_choices, step_choices.flatten()]))
+    def sample(self, beta):
+        env_choices, step_choices, weights = self._sample_index(beta)
+        flat_index = env_choices * self.n_size + step_choices.flatten()
+        obs_batch = sample_flat_batch(self.observations, flat_index)
+        act_batch, rew_batch, terminal_batch = self._sample_record(flat_index)
+        next_batch = sample_flat_batch(self.next_observations, flat_index)
 
         # return tuple(list(encoded_sample) + [weights, idxes])
         return (obs_batch,
@@ -478,46 +789,306 @@ class PerOffPolicyBuffer(Buffer):
 
     def update_priorities(self, idxes, priorities):
         priorities = priorities.reshape((self.n_envs, int(self.batch_size / self.n_envs)))
+        priorities = np.where(priorities == 0, 1e-8, priorities)
+        idxes = np.asarray(idxes, dtype=np.int64)
+        assert np.all((0 <= idxes) & (idxes < self.size))
         for i in range(self.n_envs):
-            for idx, priority in zip(idxes[i], priorities[i]):
-                if priority == 0:
-                    priority += 1e-8
-                assert 0 <= idx < self.size
-                self._it_sum[i][idx] = priority ** self._alpha
-                self._it_min[i][idx] = priority ** self._alpha
+            self._it_sum[i][idxes[i]] = priorities[i] ** self._alpha
+            self._it_min[i][idxes[i]] = priorities[i] ** self._alpha
+        self._max_priority = np.maximum(self._max_priority, priorities.max(axis=-1))
 
-                self._max_priority[i] = max(self._max_priority[i], priority)
+
+class AtariFrameMemory:
+    """
+    Frame-deduplicated storage of stacked Atari observations.
+    Each single frame is saved once in a per-env ring, and a transition keeps the ring positions of the newest frames
+    of its observation and next observation. A whole stack is written only when it does not continue the previous
+    one, e.g., at the beginning of an episode, so the stacks are rebuilt exactly at sample time.
+        obs_shape: shape of the stacked observation, (height, width, num_stack * frame_channels).
+        n_envs: number of parallel environments.
+        n_size: max length of steps to store for one environment.
+        num_stack: number of stacked frames.
+        frame_capacity: number of frames in the ring for one environment, default is 1.05 * n_size + num_stack.
+        storage: storage backend of the memory, choices: "ram", "memmap".
+        storage_dir: directory of the memory-mapped files for the memmap storage.
+    """
+    state_keys = ['frames', 'obs_end', 'next_end', 'frame_count', 'last_next_obs', 'has_last']
+
+    def __init__(self,
+                 obs_shape: tuple,
+                 n_envs: int,
+                 n_size: int,
+                 num_stack: int = 4,
+                 frame_capacity: Optional[int] = None,
+                 storage: str = "ram",
+                 storage_dir: Optional[str] = None):
+        self.obs_shape = obs_shape
+        self.n_envs, self.n_size, self.num_stack = n_envs, n_size, num_stack
+        self.frame_channels = obs_shape[-1] // num_stack
+        self.frame_shape = tuple(obs_shape[:-1]) + (self.frame_channels,)
+        self.frame_capacity = int(1.05 * n_size) + num_stack if frame_capacity is None else frame_capacity
+        assert self.frame_capacity > n_size + num_stack, "frame_capacity must be larger than n_size + num_stack."
+        file_path = (lambda name: None) if storage_dir is None else (lambda name: os.path.join(storage_dir, name))
+        self.frames = create_memory(self.frame_shape, n_envs, self.frame_capacity, np.uint8, storage,
+                                    file_path("frames"))
+        # absolute positions of the newest frames of obs and next_obs
+        self.obs_end = create_memory((), n_envs, n_size, np.int64, storage, file_path("obs_end"))
+        self.next_end = create_memory((), n_envs, n_size, np.int64, storage, file_path("next_end"))
+        self.frame_count = np.zeros(n_envs, np.int64)
+        self.last_next_obs = np.zeros((n_envs,) + tuple(obs_shape), np.uint8)
+        self.has_last = np.zeros(n_envs, np.bool_)
+        self.env_index = np.arange(n_envs)
+        self.stack_offsets = np.arange(1 - num_stack, 1)
+
+    @staticmethod
+    def is_frame_stacked(obs_shape, num_stack):
+        return isinstance(obs_shape, tuple) and len(obs_shape) == 3 and obs_shape[-1] % num_stack == 0
+
+    def _write_stack(self, i_env, stacked_obs):
+        frames = stacked_obs.reshape(self.frame_shape[:-1] + (self.num_stack, self.frame_channels))
+        positions = (self.frame_count[i_env] + np.arange(self.num_stack)) % self.frame_capacity
+        self.frames[i_env, positions] = np.moveaxis(frames, -2, 0)
+        self.frame_count[i_env] += self.num_stack
+
+    def store(self, obs, next_obs, ptr):
+        obs, next_obs = np.asarray(obs), np.asarray(next_obs)
+        n_channels = self.frame_channels
+        continued = self.has_last & (obs == self.last_next_obs).reshape(self.n_envs, -1).all(axis=-1)
+        for i in np.where(~continued)[0]:
+            self._write_stack(i, obs[i])
+        self.obs_end[:, ptr] = self.frame_count - 1
+
+        shifted = (next_obs[..., :-n_channels] == obs[..., n_channels:]).reshape(self.n_envs, -1).all(axis=-1)
+        for i in np.where(~shifted)[0]:
+            self._write_stack(i, next_obs[i])
+        env_shifted = self.env_index[shifted]
+        self.frames[env_shifted, self.frame_count[env_shifted] % self.frame_capacity] = \
+            next_obs[env_shifted][..., -n_channels:]
+        self.frame_count[env_shifted] += 1
+        self.next_end[:, ptr] = self.frame_count - 1
+
+        self.last_next_obs[:] = next_obs
+        self.has_last[:] = True
+
+    def push(self, env_ids, obs):
+        """
+        Push one stacked observation for each env of env_ids, only the newest frame is written if it continues the
+        last observation of the env. Returns the absolute positions of the newest frames.
+        """
+        obs = np.asarray(obs)
+        n_channels = self.frame_channels
+        shifted = self.has_last[env_ids] & (obs[..., :-n_channels] == self.last_next_obs[env_ids][..., n_channels:]
+                                            ).reshape(len(env_ids), -1).all(axis=-1)
+        for i in np.where(~shifted)[0]:
+            self._write_stack(env_ids[i], obs[i])
+        env_shifted = env_ids[shifted]
+        self.frames[env_shifted, self.frame_count[env_shifted] % self.frame_capacity] = obs[shifted][..., -n_channels:]
+        self.frame_count[env_shifted] += 1
+        self.last_next_obs[env_ids] = obs
+        self.has_last[env_ids] = True
+        return self.frame_count[env_ids] - 1
+
+    def oldest_valid_end(self):
+        """The oldest absolute position of the newest frame of an observation whose frames are all kept."""
+        return self.frame_count - self.frame_capacity + self.num_stack - 1
+
+    def valid_size(self, ptr, size):
+        """Number of the latest transitions of each env whose frames are not overwritten yet."""
+        oldest_valid_end = self.oldest_valid_end()
+        low, high = np.zeros(self.n_envs, np.int64), np.full(self.n_envs, size, np.int64)
+        while np.any(low < high):  # binary search over the age of transitions
+            mid = (low + high + 1) // 2
+            valid = self.obs_end[self.env_index, (ptr - mid) % self.n_size] >= oldest_valid_end
+            searching = low < high
+            low = np.where(searching & valid, mid, low)
+            high = np.where(searching & (~valid), mid - 1, high)
+        return low
+
+    def sample(self, env_choices, step_choices):
+        return self.gather(env_choices, self.obs_end[env_choices, step_choices]), \
+            self.gather(env_choices, self.next_end[env_choices, step_choices])
+
+    def gather(self, env_choices, end_positions):
+        """Rebuild the stacked observations of env_choices from the absolute positions of their newest frames."""
+        return self._stack(env_choices, end_positions[:, None] + self.stack_offsets)
+
+    def _stack(self, env_choices, positions):
+        frames = self.frames[env_choices[:, None], positions % self.frame_capacity]  # batch, stack, h, w, c
+        frames = np.moveaxis(frames, 1, -2)  # batch, h, w, stack, c
+        return frames.reshape((len(env_choices),) + tuple(self.obs_shape))
+
+    def clear(self):
+        self.frame_count[:] = 0
+        self.has_last[:] = False
+
+    def state_dict(self):
+        return get_memory_state(self, self.state_keys)
+
+    def load_state_dict(self, state):
+        set_memory_state(self, self.state_keys, state)
 
 
 class DummyOffPolicyBuffer_Atari(DummyOffPolicyBuffer):
     """
     Replay buffer for off-policy DRL algorithms and Atari tasks.
+    Stacked image observations are stored frame by frame with AtariFrameMemory, other observations are stored as uint8.
         observation_space: the observation space of the environment.
         action_space: the action space of the environment.
         auxiliary_shape: data shape of auxiliary information (if exists).
         n_envs: number of parallel environments.
         n_size: max length of steps to store for one environment.
         batch_size: batch size of transition data for a sample.
+        storage: storage backend of the memory, choices: "ram", "memmap".
+        storage_dir: directory of the memory-mapped files for the memmap storage.
+        num_stack: number of stacked frames in one observation.
     """
+    state_keys = DummyOffPolicyBuffer.state_keys + ['frame_memory']
+
     def __init__(self,
                  observation_space: Space,
                  action_space: Space,
                  auxiliary_shape: Optional[dict],
                  n_envs: int,
                  n_size: int,
-                 batch_size: int):
+                 batch_size: int,
+                 storage: str = "ram",
+                 storage_dir: Optional[str] = None,
+                 num_stack: int = 4):
+        self.num_stack = num_stack
+        self.frame_stacked = AtariFrameMemory.is_frame_stacked(space2shape(observation_space), num_stack)
+        self.frame_memory = None
         super(DummyOffPolicyBuffer_Atari, self).__init__(observation_space, action_space, auxiliary_shape,
-                                                         n_envs, n_size, batch_size)
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size, np.uint8)
-        self.next_observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size, np.uint8)
+                                                         n_envs, n_size, batch_size, storage, storage_dir)
 
     def clear(self):
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size, np.uint8)
-        self.next_observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size, np.uint8)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.auxiliary_infos = create_memory(self.auxiliary_shape, self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.terminals = create_memory((), self.n_envs, self.n_size)
+        obs_shape = space2shape(self.observation_space)
+        if self.frame_stacked:
+            self.observations, self.next_observations = None, None
+            if self.frame_memory is None:
+                self.frame_memory = AtariFrameMemory(obs_shape, self.n_envs, self.n_size, self.num_stack,
+                                                     storage=self.storage, storage_dir=self.storage_dir)
+            else:
+                self.frame_memory.clear()
+        else:
+            self.observations = self._create_memory("observations", obs_shape, np.uint8)
+            self.next_observations = self._create_memory("next_observations", obs_shape, np.uint8)
+        self._create_record("transitions", {"actions": space2shape(self.action_space), "rewards": (), "terminals": ()})
+        self.auxiliary_infos = self._create_memory("auxiliary_infos", self.auxiliary_shape)
+        self.ptr, self.size = 0, 0
+
+    def store(self, obs, acts, rews, terminals, next_obs):
+        if not self.frame_stacked:
+            return super(DummyOffPolicyBuffer_Atari, self).store(obs, acts, rews, terminals, next_obs)
+        self.frame_memory.store(obs, next_obs, self.ptr)
+        store_element(acts, self.actions, self.ptr)
+        store_element(rews, self.rewards, self.ptr)
+        store_element(terminals, self.terminals, self.ptr)
+        self.ptr = (self.ptr + 1) % self.n_size
+        self.size = min(self.size + 1, self.n_size)
+
+    def sample(self):
+        if not self.frame_stacked:
+            return super(DummyOffPolicyBuffer_Atari, self).sample()
+        env_choices = np.random.choice(self.n_envs, self.batch_size)
+        valid_size = self.frame_memory.valid_size(self.ptr, self.size)[env_choices]
+        step_choices = (self.ptr - 1 - (np.random.random(self.batch_size) * valid_size).astype(np.int64)) % self.n_size
+        obs_batch, next_batch = self.frame_memory.sample(env_choices, step_choices)
+        act_batch, rew_batch, terminal_batch = self._sample_record(env_choices * self.n_size + step_choices)
+        return obs_batch, act_batch, rew_batch, terminal_batch, next_batch
+
+
+class PerOffPolicyBuffer_Atari(PerOffPolicyBuffer):
+    """
+    Prioritized Replay Buffer for Atari tasks.
+    Stacked image observations are stored frame by frame with AtariFrameMemory, other observations are stored as uint8.
+    Transitions whose frames have been overwritten in the frame ring get zero priority.
+        observation_space: the observation space of the environment.
+        action_space: the action space of the environment.
+        auxiliary_shape: data shape of auxiliary information (if exists).
+        n_envs: number of parallel environments.
+        n_size: max length of steps to store for one environment.
+        batch_size: batch size of transition data for a sample.
+        alpha: prioritized factor.
+        storage: storage backend of the memory, choices: "ram", "memmap".
+        storage_dir: directory of the memory-mapped files for the memmap storage.
+        num_stack: number of stacked frames in one observation.
+    """
+    state_keys = PerOffPolicyBuffer.state_keys + ['frame_memory', '_valid_size']
+
+    def __init__(self,
+                 observation_space: Space,
+                 action_space: Space,
+                 auxiliary_shape: Optional[dict],
+                 n_envs: int,
+                 n_size: int,
+                 batch_size: int,
+                 alpha: float = 0.6,
+                 storage: str = "ram",
+                 storage_dir: Optional[str] = None,
+                 num_stack: int = 4):
+        self.num_stack = num_stack
+        self.frame_stacked = AtariFrameMemory.is_frame_stacked(space2shape(observation_space), num_stack)
+        self.frame_memory = None
+        self._valid_size = np.zeros(n_envs, np.int64)
+        super(PerOffPolicyBuffer_Atari, self).__init__(observation_space, action_space, auxiliary_shape,
+                                                       n_envs, n_size, batch_size, alpha, storage, storage_dir)
+
+    def clear(self):
+        obs_shape = space2shape(self.observation_space)
+        if self.frame_stacked:
+            self.observations, self.next_observations = None, None
+            if self.frame_memory is None:
+                self.frame_memory = AtariFrameMemory(obs_shape, self.n_envs, self.n_size, self.num_stack,
+                                                     storage=self.storage, storage_dir=self.storage_dir)
+            else:
+                self.frame_memory.clear()
+        else:
+            self.observations = self._create_memory("observations", obs_shape, np.uint8)
+            self.next_observations = self._create_memory("next_observations", obs_shape, np.uint8)
+        self._create_record("transitions", {"actions": space2shape(self.action_space), "rewards": (), "terminals": ()})
+        self._valid_size[:] = 0
+        self._build_segment_trees()
+        self.ptr, self.size = 0, 0
+
+    def store(self, obs, acts, rews, terminals, next_obs):
+        if not self.frame_stacked:
+            return super(PerOffPolicyBuffer_Atari, self).store(obs, acts, rews, terminals, next_obs)
+        self.frame_memory.store(obs, next_obs, self.ptr)
+        store_element(acts, self.actions, self.ptr)
+        store_element(rews, self.rewards, self.ptr)
+        store_element(terminals, self.terminals, self.ptr)
+
+        # prioritized process
+        priorities = self._max_priority ** self._alpha
+        for i in range(self.n_envs):
+            self._it_sum[i][self.ptr] = priorities[i]
+            self._it_min[i][self.ptr] = priorities[i]
+
+        self.ptr = (self.ptr + 1) % self.n_size
+        self.size = min(self.size + 1, self.n_size)
+
+        # the transitions from valid_size to last_valid_size + 1 (in age) have just lost their frames
+        valid_size = self.frame_memory.valid_size(self.ptr, self.size)
+        for i in np.where(valid_size < np.minimum(self._valid_size + 1, self.size))[0]:
+            ages = np.arange(valid_size[i], min(self._valid_size[i] + 1, self.size))
+            idxes = (self.ptr - 1 - ages) % self.n_size
+            self._it_sum[i][idxes] = 0.0
+            self._it_min[i][idxes] = float('inf')
+        self._valid_size = valid_size
+
+    def sample(self, beta):
+        if not self.frame_stacked:
+            return super(PerOffPolicyBuffer_Atari, self).sample(beta)
+        env_choices, step_choices, weights = self._sample_index(beta)
+        obs_batch, next_batch = self.frame_memory.sample(env_choices, step_choices.flatten())
+        act_batch, rew_batch, terminal_batch = self._sample_record(env_choices * self.n_size + step_choices.flatten())
+        return (obs_batch,
+                act_batch,
+                rew_batch,
+                terminal_batch,
+                next_batch,
+                weights,
+                step_choices)
 
 
 class DummyOnPolicyBuffer_Atari(DummyOnPolicyBuffer):
@@ -546,12 +1117,3 @@ class DummyOnPolicyBuffer_Atari(DummyOnPolicyBuffer):
         super(DummyOnPolicyBuffer_Atari, self).__init__(observation_space, action_space, auxiliary_shape,
                                                         n_envs, n_size, use_gae, use_advnorm, gamma, gae_lam)
         self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size, np.uint8)
-
-    def clear(self):
-        self.ptr, self.size = 0, 0
-        self.observations = create_memory(space2shape(self.observation_space), self.n_envs, self.n_size, np.uint8)
-        self.actions = create_memory(space2shape(self.action_space), self.n_envs, self.n_size)
-        self.auxiliary_infos = create_memory(self.auxiliary_shape, self.n_envs, self.n_size)
-        self.rewards = create_memory((), self.n_envs, self.n_size)
-        self.returns = create_memory((), self.n_envs, self.n_size)
-        self.advantages = create_memory((), self.n_envs, self.n_size)
@@ -1,12 +1,17 @@
+import os
 import numpy as np
 from abc import ABC, abstractmethod
 from xuanpolicy.common.common_tools import discount_cumsum
+from xuanpolicy.common.memory_tools import create_memory, create_storage_dir, get_memory_state, set_memory_state, \
+    save_memory_state, load_memory_state
 
 
 class BaseBuffer(ABC):
     """
     Basic buffer for MARL algorithms.
     """
+    state_keys = ['data', 'ptr', 'size']
+
     def __init__(self, *args):
         self.n_agents, self.state_space, self.obs_space, self.act_space, self.rew_space, self.done_space, self.n_envs, self.n_size = args
         self.ptr = 0  # last data pointer
@@ -31,6 +36,20 @@ class BaseBuffer(ABC):
     def finish_path(self, *args):
         return
 
+    def state_dict(self):
+        return get_memory_state(self, self.state_keys)
+
+    def load_state_dict(self, state):
+        set_memory_state(self, self.state_keys, state)
+
+    def save(self, path):
+        """Save the stored data and the pointers of this buffer in the directory path."""
+        save_memory_state(path, self.state_dict())
+
+    def load(self, path):
+        """Load the data saved by save(path) into this buffer."""
+        self.load_state_dict(load_memory_state(path))
+
 
 class MARL_OffPolicyBuffer(BaseBuffer):
     """
@@ -44,6 +63,8 @@ class MARL_OffPolicyBuffer(BaseBuffer):
         n_envs: number of parallel environments.
         n_size: buffer size for one environment.
         batch_size: batch size of transition data for a sample.
+        storage: storage backend of the memory, choices: "ram", "memmap" (optional keyword).
+        storage_dir: directory of the memory-mapped files for the memmap storage (optional keyword).
     """
     def __init__(self, n_agents, state_space, obs_space, act_space, rew_space, done_space,
                  n_envs, n_size, batch_size, **kwargs):
@@ -51,6 +72,8 @@ class MARL_OffPolicyBuffer(BaseBuffer):
                                                    n_envs, n_size)
         self.buffer_size = n_size * n_envs
         self.batch_size = batch_size
+        self.storage = kwargs.get('storage', "ram")
+        self.storage_dir = create_storage_dir(self, self.storage, kwargs.get('storage_dir', None))
         if self.state_space is not None:
             self.store_global_state = True
         else:
@@ -59,18 +82,23 @@ class MARL_OffPolicyBuffer(BaseBuffer):
         self.clear()
         self.keys = self.data.keys()
 
+    def _create_memory(self, name, shape, dtype=np.float32):
+        file_path = None if self.storage_dir is None else os.path.join(self.storage_dir, name)
+        return create_memory(shape, self.n_envs, self.n_size, dtype, self.storage, file_path)
+
     def clear(self):
         self.data = {
-            'obs': np.zeros((self.n_envs, self.n_size, self.n_agents) + self.obs_space).astype(np.float32),
-            'actions': np.zeros((self.n_envs, self.n_size, self.n_agents) + self.act_space).astype(np.float32),
-            'obs_next': np.zeros((self.n_envs, self.n_size, self.n_agents) + self.obs_space).astype(np.float32),
-            'rewards': np.zeros((self.n_envs, self.n_size) + self.rew_space).astype(np.float32),
-            'terminals': np.zeros((self.n_envs, self.n_size) + self.done_space).astype(np.bool),
-            'agent_mask': np.ones((self.n_envs, self.n_size, self.n_agents)).astype(np.bool)
+            'obs': self._create_memory('obs', (self.n_agents, ) + self.obs_space),
+            'actions': self._create_memory('actions', (self.n_agents, ) + self.act_space),
+            'obs_next': self._create_memory('obs_next', (self.n_agents, ) + self.obs_space),
+            'rewards': self._create_memory('rewards', self.rew_space),
+            'terminals': self._create_memory('terminals', self.done_space, bool),
+            'agent_mask': self._create_memory('agent_mask', (self.n_agents, ), bool)
         }
+        self.data['agent_mask'][:] = True
         if self.state_space is not None:
-            self.data.update({'state': np.zeros((self.n_envs, self.n_size) + self.state_space).astype(np.float32),
-                              'state_next': np.zeros((self.n_envs, self.n_size) + self.state_space).astype(np.float32)})
+            self.data.update({'state': self._create_memory('state', self.state_space),
+                              'state_next': self._create_memory('state_next', self.state_space)})
         self.ptr, self.size = 0, 0
 
     def store(self, step_data):
@@ -99,37 +127,101 @@ class MARL_OffPolicyBuffer_RNN(MARL_OffPolicyBuffer):
         n_size: buffer size for one environment.
         batch_size: batch size of episodes for a sample.
         max_episode_length: maximum length of data for one episode trajectory.
+        packed: store only the filled steps of the episodes in a ring of steps (optional keyword).
+        packed_steps: number of steps of the packed storage, default is buffer_size * (max_episode_length + 1).
     """
+    state_keys = BaseBuffer.state_keys + ['step_ptr', 'episode_pos', 'episode_len']  # the last three for packed
+
     def __init__(self, n_agents, state_space, obs_space, act_space, rew_space, done_space,
                  n_envs, n_size, batch_size, **kwargs):
         self.max_eps_len = kwargs['max_episode_length']
         self.dim_act = kwargs['dim_act']
+        self.packed = kwargs.get('packed', False)
+        self.packed_steps = kwargs.get('packed_steps', None) or n_envs * n_size * (self.max_eps_len + 1)
+        self.agent_keys = ['obs', 'actions', 'rewards', 'avail_actions']  # keys with an agent axis before time
         super(MARL_OffPolicyBuffer_RNN, self).__init__(n_agents, state_space, obs_space, act_space, rew_space,
                                                        done_space, n_envs, n_size, batch_size)
 
     def clear(self):
-        self.data = {
-            'obs': np.zeros((self.buffer_size, self.n_agents, self.max_eps_len + 1) + self.obs_space, np.float),
-            'actions': np.zeros((self.buffer_size, self.n_agents, self.max_eps_len) + self.act_space, np.float),
-            'rewards': np.zeros((self.buffer_size, self.n_agents, self.max_eps_len) + self.rew_space, np.float),
-            'terminals': np.zeros((self.buffer_size, self.max_eps_len) + self.done_space, np.bool),
-            'avail_actions': np.ones((self.buffer_size, self.n_agents, self.max_eps_len + 1, self.dim_act), np.bool),
-            'filled': np.zeros((self.buffer_size, self.max_eps_len, 1)).astype(np.bool)
-        }
-        if self.state_space is not None:
-            self.data.update({'state': np.zeros(
-                (self.buffer_size, self.max_eps_len + 1) + self.state_space).astype(np.float32)})
+        if self.packed:  # steps first, the filled mask is rebuilt from the episode lengths.
+            self.data = {
+                'obs': np.zeros((self.packed_steps, self.n_agents) + self.obs_space, np.float32),
+                'actions': np.zeros((self.packed_steps, self.n_agents) + self.act_space, np.float32),
+                'rewards': np.zeros((self.packed_steps, self.n_agents) + self.rew_space, np.float32),
+                'terminals': np.zeros((self.packed_steps, ) + self.done_space, bool),
+                'avail_actions': np.ones((self.packed_steps, self.n_agents, self.dim_act), bool)
+            }
+            if self.state_space is not None:
+                self.data.update({'state': np.zeros((self.packed_steps, ) + self.state_space, np.float32)})
+            self.step_ptr = 0  # absolute position of the next step
+            self.episode_pos = np.zeros(self.buffer_size, np.int64)
+            self.episode_len = np.zeros(self.buffer_size, np.int64)
+        else:
+            self.data = {
+                'obs': np.zeros((self.buffer_size, self.n_agents, self.max_eps_len + 1) + self.obs_space, np.float32),
+                'actions': np.zeros((self.buffer_size, self.n_agents, self.max_eps_len) + self.act_space, np.float32),
+                'rewards': np.zeros((self.buffer_size, self.n_agents, self.max_eps_len) + self.rew_space, np.float32),
+                'terminals': np.zeros((self.buffer_size, self.max_eps_len) + self.done_space, bool),
+                'avail_actions': np.ones((self.buffer_size, self.n_agents, self.max_eps_len + 1, self.dim_act), bool),
+                'filled': np.zeros((self.buffer_size, self.max_eps_len, 1), bool)
+            }
+            if self.state_space is not None:
+                self.data.update({'state': np.zeros(
+                    (self.buffer_size, self.max_eps_len + 1) + self.state_space).astype(np.float32)})
         self.ptr, self.size = 0, 0
 
     def store(self, episode_data, i_env=None):
-        for k in self.keys:
-            self.data[k][self.ptr] = episode_data[k][i_env]
+        if self.packed:
+            length = int(episode_data['filled'][i_env].sum())
+            if length + 1 > self.packed_steps:
+                return
+            steps = (self.step_ptr + np.arange(length + 1)) % self.packed_steps
+            for k in self.keys:
+                data = episode_data[k][i_env]
+                if k in self.agent_keys:
+                    data = np.swapaxes(data, 0, 1)
+                n_steps = length + 1 if data.shape[0] > self.max_eps_len else length
+                self.data[k][steps[:n_steps]] = data[:n_steps]
+            self.episode_pos[self.ptr] = self.step_ptr
+            self.episode_len[self.ptr] = length
+            self.step_ptr += length + 1
+        else:
+            for k in self.keys:
+                self.data[k][self.ptr] = episode_data[k][i_env]
         self.ptr = (self.ptr + 1) % self.buffer_size
         self.size = np.min([self.size + 1, self.buffer_size])
 
     def sample(self):
+        """Sample a padded batch of episodes trimmed to the longest sampled episode."""
+        if self.packed:
+            return self._sample_packed()
         sample_choices = np.random.choice(self.size, self.batch_size)
-        samples = {k: self.data[k][sample_choices] for k in self.keys}
+        length = int(self.data['filled'][sample_choices].sum(axis=1).max())
+        samples = {}
+        for k in self.keys:
+            n_steps = length + 1 if self.data[k].shape[2 if k in self.agent_keys else 1] > self.max_eps_len else length
+            index = (sample_choices, slice(None), slice(n_steps)) if k in self.agent_keys else (
+                sample_choices, slice(n_steps))
+            samples[k] = self.data[k][index]
+        return samples
+
+    def _sample_packed(self):
+        # the episodes partly overwritten by the newer steps are not sampled.
+        valid_ids = np.where(self.episode_pos[:self.size] >= self.step_ptr - self.packed_steps)[0]
+        sample_choices = np.random.choice(valid_ids, self.batch_size)
+        lengths = self.episode_len[sample_choices][:, None]
+        length = int(lengths.max())
+        t = np.arange(length + 1)[None, :]
+        steps = (self.episode_pos[sample_choices][:, None] + np.minimum(t, lengths)) % self.packed_steps
+        samples = {}
+        for k in self.keys:
+            n_steps = length + 1 if k in ['obs', 'avail_actions', 'state'] else length
+            batch = self.data[k][steps[:, :n_steps]]
+            mask = (t[:, :n_steps] <= lengths) if n_steps > length else (t[:, :n_steps] < lengths)
+            mask = mask.reshape(mask.shape + (1, ) * (batch.ndim - 2))
+            batch = np.where(mask, batch, k == 'avail_actions')  # pad with zeros and available actions
+            samples[k] = np.swapaxes(batch, 1, 2) if k in self.agent_keys else batch
+        samples['filled'] = (t[:, :length] < lengths)[..., None]
         return samples
 
 
@@ -181,6 +273,8 @@ class MARL_OnPolicyBuffer(BaseBuffer):
         gamma: discount factor.
         gae_lam: gae lambda.
     """
+    state_keys = BaseBuffer.state_keys + ['start_ids']
+
     def __init__(self, n_agents, state_space, obs_space, act_space, rew_space, done_space, n_envs, n_size,
                  use_gae, use_advnorm, gamma, gae_lam, **kwargs):
         super(MARL_OnPolicyBuffer, self).__init__(n_agents, state_space, obs_space, act_space, rew_space, done_space,
@@ -481,6 +575,8 @@ class MeanField_OnPolicyBuffer(MARL_OnPolicyBuffer):
 
 
 class COMA_Buffer(BaseBuffer, ABC):
+    state_keys = BaseBuffer.state_keys + ['buffer_ptrs', 'step_ptr', 'end_ids']
+
     def __init__(self, state_space, obs_space, act_space, act_onehot_space, rew_space, done_space,
                  n_envs, buffer_size, batch_size, max_seq_length):
         super(COMA_Buffer, self).__init__(obs_space, act_space, rew_space, n_envs, buffer_size, batch_size)
@@ -0,0 +1,97 @@
+import threading
+
+
+class MetricsSink(object):
+    """
+    Aggregate the logged scalars in memory and write them to TensorBoard or wandb from a background thread.
+    In each flush window, a scalar is written once at its last step: its mean under the key, and its min, max and
+    count under key/min, key/max and key/count if it is logged more than once. The dict values of log_infos are the
+    groups of add_scalars, their means are written as a group.
+        writer: the SummaryWriter of TensorBoard, or None to log with wandb.
+        flush_interval: seconds between the flushes, 0 to write synchronously in every log().
+    """
+    def __init__(self, writer=None, flush_interval: float = 5.0):
+        self.writer = writer
+        if writer is None:
+            import wandb
+            self.wandb = wandb
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.window = {}  # (key, key in the group or None): [sum, min, max, count, step]
+        self.closed = threading.Event()
+        self.thread = None
+        if flush_interval > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+
+    def _add(self, key, value, x_index):
+        value = float(value)
+        entry = self.window.get(key)
+        if entry is None:
+            self.window[key] = [value, value, value, 1, x_index]
+        else:
+            entry[0] += value
+            entry[1] = min(entry[1], value)
+            entry[2] = max(entry[2], value)
+            entry[3] += 1
+            entry[4] = x_index
+
+    def log(self, info: dict, x_index: int):
+        with self.lock:
+            for k, v in info.items():
+                if isinstance(v, dict):
+                    for k_group, v_group in v.items():
+                        self._add((k, k_group), v_group, x_index)
+                else:
+                    self._add((k, None), v, x_index)
+        if self.thread is None:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            window, self.window = self.window, {}
+        scalars, groups = {}, {}  # {step: {tag: value}}, {(key, step): {key in the group: value}}
+        for (key, k_group), (total, v_min, v_max, count, step) in window.items():
+            if k_group is not None:
+                if self.writer is None:
+                    scalars.setdefault(step, {})["%s/%s" % (key, k_group)] = total / count
+                else:
+                    groups.setdefault((key, step), {})[k_group] = total / count
+                continue
+            values = scalars.setdefault(step, {})
+            values[key] = total / count
+            if count > 1:
+                values[key + "/min"], values[key + "/max"], values[key + "/count"] = v_min, v_max, count
+        with self.write_lock:
+            for step in sorted(scalars):  # the steps of wandb must not decrease
+                if self.writer is None:
+                    self.wandb.log(scalars[step], step=step)
+                else:
+                    for tag, value in scalars[step].items():
+                        self.writer.add_scalar(tag, value, step)
+            for (key, step), values in groups.items():
+                self.writer.add_scalars(key, values, step)
+
+    def log_videos(self, info: dict, fps: int, x_index: int):
+        """Write the videos after the pending scalars, so that the steps of wandb never decrease."""
+        self.flush()
+        with self.write_lock:
+            for k, v in info.items():
+                if self.writer is None:
+                    self.wandb.log({k: self.wandb.Video(v, fps=fps, format='gif')}, step=x_index)
+                else:
+                    self.writer.add_video(k, v, fps=fps, global_step=x_index)
+
+    def close(self):
+        """Stop the background thread and write the last window, call it before closing the writer or wandb."""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
@@ -1,50 +1,67 @@
-import operator
+import numpy as np
 
 
 class SegmentTree(object):
+    """
+    Array-backed segment tree, the leaves are stored in self._value[capacity: 2 * capacity].
+        capacity: number of leaves, must be a power of 2.
+        operation: a vectorized binary operation, e.g., np.add, np.minimum.
+        neutral_element: neutral element of the operation.
+    """
     def __init__(self, capacity, operation, neutral_element):
         assert capacity > 0 and capacity & (capacity - 1) == 0, "capacity must be positive and a power of 2."
         self._capacity = capacity
-        self._value = [neutral_element for _ in range(2 * capacity)]
+        self._neutral_element = neutral_element
+        self._value = np.full(2 * capacity, neutral_element, dtype=np.float64)
         self._operation = operation
 
-    def _reduce_helper(self, start, end, node, node_start, node_end):
-        if start == node_start and end == node_end:
-            return self._value[node]
-        mid = (node_start + node_end) // 2
-        if end <= mid:
-            return self._reduce_helper(start, end, 2 * node, node_start, mid)
-        else:
-            if mid + 1 <= start:
-                return self._reduce_helper(start, end, 2 * node + 1, mid + 1, node_end)
-            else:
-                return self._operation(
-                    self._reduce_helper(start, mid, 2 * node, node_start, mid),
-                    self._reduce_helper(mid + 1, end, 2 * node + 1, mid + 1, node_end)
-                )
-
     def reduce(self, start=0, end=None):
+        """Returns operation(arr[start], ..., arr[end - 1])"""
         if end is None:
             end = self._capacity
         if end < 0:
             end += self._capacity
-        end -= 1
-        return self._reduce_helper(start, end, 1, 0, self._capacity - 1)
+        if start == 0 and end == self._capacity:
+            return self._value[1]
+        result = self._neutral_element
+        start += self._capacity
+        end += self._capacity
+        while start < end:
+            if start & 1:
+                result = self._operation(result, self._value[start])
+                start += 1
+            if end & 1:
+                end -= 1
+                result = self._operation(result, self._value[end])
+            start //= 2
+            end //= 2
+        return result
 
     def __setitem__(self, idx, val):
-        # index of the leaf
-        idx += self._capacity
-        self._value[idx] = val
-        idx //= 2
-        while idx >= 1:
-            self._value[idx] = self._operation(
-                self._value[2 * idx],
-                self._value[2 * idx + 1]
-            )
+        """Supports both a single index and a batch of indexes."""
+        if np.isscalar(idx):
+            idx += self._capacity
+            self._value[idx] = val
             idx //= 2
+            while idx >= 1:
+                self._value[idx] = self._operation(self._value[2 * idx], self._value[2 * idx + 1])
+                idx //= 2
+        else:
+            idx = np.asarray(idx, dtype=np.int64) + self._capacity
+            if idx.size == 0:
+                return
+            self._value[idx] = val
+            idx = np.unique(idx // 2)
+            while idx[0] >= 1:
+                self._value[idx] = self._operation(self._value[2 * idx], self._value[2 * idx + 1])
+                idx = np.unique(idx // 2)
 
     def __getitem__(self, idx):
-        assert 0 <= idx < self._capacity
+        if np.isscalar(idx):
+            assert 0 <= idx < self._capacity
+        else:
+            idx = np.asarray(idx, dtype=np.int64)
+            assert np.all((0 <= idx) & (idx < self._capacity))
         return self._value[self._capacity + idx]
 
 
@@ -52,7 +69,7 @@ class SumSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super(SumSegmentTree, self).__init__(
             capacity=capacity,
-            operation=operator.add,
+            operation=np.add,
             neutral_element=0.0
         )
 
@@ -61,22 +78,25 @@ class SumSegmentTree(SegmentTree):
         return super(SumSegmentTree, self).reduce(start, end)
 
     def find_prefixsum_idx(self, prefixsum):
-        assert 0 <= prefixsum <= self.sum() + 1e-5
-        idx = 1
-        while idx < self._capacity:  # while non-leaf
-            if self._value[2 * idx] > prefixsum:
-                idx = 2 * idx
-            else:
-                prefixsum -= self._value[2 * idx]
-                idx = 2 * idx + 1
-        return idx - self._capacity
+        """Find the highest index i such that arr[0] + ... + arr[i - 1] <= prefixsum, batched if prefixsum is an array."""
+        is_scalar = np.isscalar(prefixsum)
+        prefixsum = np.array(prefixsum, dtype=np.float64, ndmin=1)
+        assert np.all(0 <= prefixsum) and np.all(prefixsum <= self.sum() + 1e-5)
+        idx = np.ones(len(prefixsum), dtype=np.int64)
+        while idx[0] < self._capacity:  # while non-leaf, all the nodes are in the same depth
+            left = self._value[2 * idx]
+            go_right = left <= prefixsum
+            prefixsum = np.where(go_right, prefixsum - left, prefixsum)
+            idx = 2 * idx + go_right
+        idx -= self._capacity
+        return idx[0] if is_scalar else idx
 
 
 class MinSegmentTree(SegmentTree):
     def __init__(self, capacity):
         super(MinSegmentTree, self).__init__(
             capacity=capacity,
-            operation=min,
+            operation=np.minimum,
             neutral_element=float('inf')
         )
 
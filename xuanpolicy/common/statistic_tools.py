@@ -111,6 +111,28 @@ class RunningMeanStd(object):
             self.var = new_var
             self.count = new_count
 
+    def state_dict(self):
+        """The running statistics as a flat dict of arrays, the keys of a dict shape are saved as "mean.key"."""
+        state = {}
+        for name in ['mean', 'var', 'count']:
+            value = getattr(self, name)
+            if isinstance(self.shape, dict):
+                state.update({name + "." + str(key): np.asarray(value[key]) for key in self.shape.keys()})
+            else:
+                state[name] = np.asarray(value)
+        return state
+
+    def load_state_dict(self, state):
+        def restore(value):
+            value = np.array(value)
+            return value.item() if value.ndim == 0 else value
+
+        for name in ['mean', 'var', 'count']:
+            if isinstance(self.shape, dict):
+                setattr(self, name, {key: restore(state[name + "." + str(key)]) for key in self.shape.keys()})
+            else:
+                setattr(self, name, restore(state[name]))
+
 
 class OUNoise(object):
     def __init__(self, action_space, mu=0, theta=0.15, sigma=0.2):
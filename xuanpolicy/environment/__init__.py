@@ -4,9 +4,11 @@ from xuanpolicy.environment.gym.gym_env import Gym_Env, MountainCar
 from .pettingzoo import PETTINGZOO_ENVIRONMENTS
 
 from .vector_envs.vector_env import VecEnv
-from xuanpolicy.environment.gym.gym_vec_env import DummyVecEnv_Gym, DummyVecEnv_Atari, SubprocVecEnv_Gym, SubprocVecEnv_Atari
-from xuanpolicy.environment.pettingzoo.pettingzoo_vec_env import DummyVecEnv_Pettingzoo
-from xuanpolicy.environment.magent2.magent_vec_env import DummyVecEnv_MAgent
+from xuanpolicy.environment.gym.gym_vec_env import DummyVecEnv_Gym, DummyVecEnv_Atari, SubprocVecEnv_Gym, SubprocVecEnv_Atari, \
+    ShmemVecEnv_Gym, AsyncVecEnv_Gym, ThreadVecEnv_Gym, ThreadVecEnv_Atari
+from xuanpolicy.environment.pettingzoo.pettingzoo_vec_env import DummyVecEnv_Pettingzoo, SubprocVecEnv_Pettingzoo
+from xuanpolicy.environment.magent2.magent_vec_env import DummyVecEnv_MAgent, SubprocVecEnv_MAgent, ThreadVecEnv_MAgent, \
+    NativeVecEnv_MAgent
 from xuanpolicy.environment.starcraft2.sc2_vec_env import SubprocVecEnv_StarCraft2
 from xuanpolicy.environment.football.gfootball_vec_env import DummyVecEnv_GFootball
 
@@ -47,7 +49,7 @@ def make_envs(config: Namespace):
         return env
 
     if config.vectorize == "Subproc":
-        return SubprocVecEnv([_thunk for _ in range(config.parallels)])
+        return SubprocVecEnv([_thunk for _ in range(config.parallels)], context=config.worker_context)
     elif config.vectorize == "Dummy_Gym":
         return DummyVecEnv_Gym([_thunk for _ in range(config.parallels)])
     elif config.vectorize == "Dummy_Pettingzoo":
@@ -55,11 +57,37 @@ def make_envs(config: Namespace):
     elif config.vectorize == "Dummy_MAgent":
         return DummyVecEnv_MAgent([_thunk for _ in range(config.parallels)])
     elif config.vectorize == "Dummy_StarCraft2":
-        return SubprocVecEnv_StarCraft2([_thunk for _ in range(config.parallels)])
+        return SubprocVecEnv_StarCraft2([_thunk for _ in range(config.parallels)], context=config.worker_context)
     elif config.vectorize == "Dummy_Football":
         return DummyVecEnv_GFootball([_thunk for _ in range(config.parallels)])
     elif config.vectorize == "Dummy_Atari":
         return DummyVecEnv_Atari([_thunk for _ in range(config.parallels)])
+    elif config.vectorize == "Subproc_Gym":
+        return SubprocVecEnv_Gym([_thunk for _ in range(config.parallels)], config.worker_context,
+                                 config.in_series)
+    elif config.vectorize == "Subproc_Atari":
+        return SubprocVecEnv_Atari([_thunk for _ in range(config.parallels)], config.worker_context,
+                                   config.in_series)
+    elif config.vectorize == "Subproc_Pettingzoo":
+        return SubprocVecEnv_Pettingzoo([_thunk for _ in range(config.parallels)], config.worker_context,
+                                        config.in_series)
+    elif config.vectorize == "Subproc_MAgent":
+        return SubprocVecEnv_MAgent([_thunk for _ in range(config.parallels)], config.worker_context,
+                                    config.in_series)
+    elif config.vectorize == "Thread_Gym":
+        return ThreadVecEnv_Gym([_thunk for _ in range(config.parallels)], n_threads=config.n_threads or None)
+    elif config.vectorize == "Thread_Atari":
+        return ThreadVecEnv_Atari([_thunk for _ in range(config.parallels)], n_threads=config.n_threads or None)
+    elif config.vectorize == "Thread_MAgent":
+        return ThreadVecEnv_MAgent([_thunk for _ in range(config.parallels)], n_threads=config.n_threads or None)
+    elif config.vectorize == "Native_MAgent":
+        return NativeVecEnv_MAgent([_thunk for _ in range(config.parallels)])
+    elif config.vectorize == "Async_Gym":
+        batch_size = min(config.env_batch_size, config.parallels) or None
+        return AsyncVecEnv_Gym([_thunk for _ in range(config.parallels)], batch_size, config.worker_context)
+    elif config.vectorize in ["Shmem_Gym", "Shmem_Atari"]:  # the observations keep the dtype of the space
+        return ShmemVecEnv_Gym([_thunk for _ in range(config.parallels)], config.worker_context,
+                               config.in_series)
     elif config.vectorize == "NOREQUIRED":
         return _thunk()
     else:
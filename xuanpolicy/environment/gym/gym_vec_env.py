@@ -2,22 +2,41 @@ from xuanpolicy.environment.vector_envs.vector_env import VecEnv, AlreadySteppin
 from xuanpolicy.common import space2shape, combined_shape
 from gym.spaces import Dict
 import numpy as np
-import multiprocessing as mp
-from xuanpolicy.environment.vector_envs.subproc_vec_env import clear_mpi_env_vars, flatten_list, CloudpickleWrapper
+import time
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import wait
+from concurrent.futures import ThreadPoolExecutor
+from xuanpolicy.environment.vector_envs.subproc_vec_env import clear_mpi_env_vars, get_worker_context, flatten_list, \
+    CloudpickleWrapper
 
 
 def worker(remote, parent_remote, env_fn_wrappers):
     def step_env(env, action):
         obs, reward_n, terminated, truncated, info = env.step(action)
+        if terminated or truncated:  # reset here rather than in another round-trip
+            info["reset_obs"], _ = env.reset()
         return obs, reward_n, terminated, truncated, info
 
     parent_remote.close()
     envs = [env_fn_wrapper() for env_fn_wrapper in env_fn_wrappers.x]
+    send_latency = False  # attach the step latencies to the replies, for VecEnvStats
     try:
         while True:
             cmd, data = remote.recv()
             if cmd == 'step':
-                remote.send([step_env(env, action) for env, action in zip(envs, data)])
+                start = time.perf_counter()
+                results, env_ms = [], []
+                for env, action in zip(envs, data):
+                    env_start = time.perf_counter()
+                    results.append(step_env(env, action))
+                    env_ms.append((time.perf_counter() - env_start) * 1000)
+                if send_latency:
+                    remote.send((results, env_ms, (time.perf_counter() - start) * 1000))
+                else:
+                    remote.send(results)
+            elif cmd == 'set_stats':
+                send_latency = data
+                remote.send(None)
             elif cmd == 'reset':
                 remote.send([env.reset() for env in envs])
             elif cmd == 'render':
@@ -57,7 +76,7 @@ class SubprocVecEnv_Gym(VecEnv):
         assert num_envs % in_series == 0, "Number of envs must be divisible by number of envs to run in series"
         self.n_remotes = num_envs // in_series
         env_fns = np.array_split(env_fns, self.n_remotes)
-        ctx = mp.get_context(context)
+        ctx = get_worker_context(context)
         self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.n_remotes)])
         self.ps = [ctx.Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
                    for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
@@ -70,7 +89,7 @@ class SubprocVecEnv_Gym(VecEnv):
 
         self.remotes[0].send(('get_spaces', None))
         observation_space, action_space = self.remotes[0].recv().x
-        VecEnv.__init__(self, len(env_fns), observation_space, action_space)
+        VecEnv.__init__(self, num_envs, observation_space, action_space)
 
         self.obs_shape = space2shape(self.observation_space)
         if isinstance(self.observation_space, Dict):
@@ -96,16 +115,12 @@ class SubprocVecEnv_Gym(VecEnv):
     def step_wait(self):
         self._assert_not_closed()
         results = [remote.recv() for remote in self.remotes]
+        if self.stats is not None:
+            results = self.stats.record_replies(results)
         results = flatten_list(results)
         obs, rews, dones, truncated, infos = zip(*results)
-        self.buf_obs, self.buf_rews = np.array(obs), np.array(rews)
+        self.buf_obs, self.buf_rews = self._stack_obs(obs), np.array(rews, dtype=np.float32)
         self.buf_dones, self.buf_trunctions, self.buf_infos = np.array(dones), np.array(truncated), list(infos)
-        for e in range(self.num_envs):
-            if self.buf_dones[e] or self.buf_trunctions[e]:
-                self.remotes[e].send(('reset', None))
-                reset_result = self.remotes[e].recv()
-                obs_reset, _ = zip(*reset_result)
-                self.buf_infos[e]["reset_obs"] = np.array(obs_reset)
         self.waiting = False
         return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), self.buf_trunctions.copy(), self.buf_infos.copy()
 
@@ -116,9 +131,15 @@ class SubprocVecEnv_Gym(VecEnv):
         result = [remote.recv() for remote in self.remotes]
         result = flatten_list(result)
         obs, infos = zip(*result)
-        self.buf_obs, self.buf_infos = np.array(obs), list(infos)
+        self.buf_obs, self.buf_infos = self._stack_obs(obs), list(infos)
         return self.buf_obs.copy(), self.buf_infos.copy()
 
+    def _stack_obs(self, obs):
+        """Stack the observations of the envs with the dtype of buf_obs, e.g., uint8 for the Atari frames."""
+        if isinstance(self.buf_obs, dict):
+            return {k: np.array([o[k] for o in obs], dtype=v.dtype) for k, v in self.buf_obs.items()}
+        return np.array(obs, dtype=self.buf_obs.dtype)
+
     def close_extras(self):
         self.closed = True
         if self.waiting:
@@ -137,6 +158,16 @@ class SubprocVecEnv_Gym(VecEnv):
         imgs = flatten_list(imgs)
         return imgs
 
+    def enable_stats(self):
+        assert not self.waiting, "Enabling the statistics while stepping."
+        if self.stats is not None:
+            return
+        VecEnv.enable_stats(self, self.n_remotes)
+        for remote in self.remotes:
+            remote.send(('set_stats', True))
+        for remote in self.remotes:
+            remote.recv()
+
     def _assert_not_closed(self):
         assert not self.closed, "Trying to operate on a SubprocVecEnv after calling close()"
 
@@ -145,6 +176,275 @@ class SubprocVecEnv_Gym(VecEnv):
             self.close()
 
 
+def shmem_worker(remote, parent_remote, env_fn_wrappers):
+    def write_obs(buffers, prefix, i, obs):
+        for name, key in obs_names[prefix]:
+            buffers[name][i] = obs if key is None else obs[key]
+
+    parent_remote.close()
+    envs = [env_fn_wrapper() for env_fn_wrapper in env_fn_wrappers.x]
+    memories, buffers, obs_names = [], {}, {}
+    send_latency = False  # attach the step latencies to the replies, for VecEnvStats
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                start = time.perf_counter()
+                infos, env_ms = [], []
+                for i, (env, action) in enumerate(zip(envs, data)):
+                    env_start = time.perf_counter()
+                    obs, rew, terminated, truncated, info = env.step(action)
+                    buffers['rewards'][i], buffers['terminated'][i], buffers['truncated'][i] = rew, terminated, truncated
+                    write_obs(buffers, 'obs', i, obs)
+                    if terminated or truncated:
+                        obs_reset, _ = env.reset()
+                        write_obs(buffers, 'reset_obs', i, obs_reset)
+                    infos.append(info)
+                    env_ms.append((time.perf_counter() - env_start) * 1000)
+                if send_latency:
+                    remote.send((infos, env_ms, (time.perf_counter() - start) * 1000))
+                else:
+                    remote.send(infos)
+            elif cmd == 'set_stats':
+                send_latency = data
+                remote.send(None)
+            elif cmd == 'reset':
+                infos = []
+                for i, env in enumerate(envs):
+                    obs, info = env.reset()
+                    write_obs(buffers, 'obs', i, obs)
+                    infos.append(info)
+                remote.send(infos)
+            elif cmd == 'set_shared_memory':
+                specs, obs_names, start = data
+                for name, (memory_name, shape, dtype) in specs.items():
+                    memory = shared_memory.SharedMemory(name=memory_name)
+                    memories.append(memory)
+                    buffers[name] = np.ndarray(shape, dtype, buffer=memory.buf)[start: start + len(envs)]
+                remote.send(None)
+            elif cmd == 'render':
+                remote.send([env.render(data) for env in envs])
+            elif cmd == 'close':
+                remote.close()
+                break
+            elif cmd == 'get_spaces':
+                remote.send(CloudpickleWrapper((envs[0].observation_space, envs[0].action_space)))
+            elif cmd == 'get_max_cycles':
+                remote.send(CloudpickleWrapper((envs[0].env._max_episode_steps)))
+            else:
+                raise NotImplementedError
+    except KeyboardInterrupt:
+        print('ShmemVecEnv worker: got KeyboardInterrupt')
+    finally:
+        for env in envs:
+            env.close()
+        buffers.clear()  # release the views before closing the shared memory
+        for memory in memories:
+            memory.close()
+
+
+class ShmemVecEnv_Gym(VecEnv):
+    """
+    VecEnv that runs multiple environments in subprocesses, and the workers write the observations, rewards,
+    terminals and truncations into shared memory, so the pipes only carry the commands and the info dicts.
+    A finished environment is reset by its worker, the observation after reset is returned in info["reset_obs"].
+    """
+    def __init__(self, env_fns, context='spawn', in_series=1):
+        """
+        Arguments:
+        env_fns: iterable of callables -  functions that create environments to run in subprocesses. Need to be cloud-pickleable
+        in_series: number of environments to run in series in a single process
+        (e.g. when len(env_fns) == 12 and in_series == 3, it will run 4 processes, each running 3 envs in series)
+        """
+        self.waiting = False
+        self.closed = False
+        self.in_series = in_series
+        num_envs = len(env_fns)
+        assert num_envs % in_series == 0, "Number of envs must be divisible by number of envs to run in series"
+        self.n_remotes = num_envs // in_series
+        env_fns = np.array_split(env_fns, self.n_remotes)
+        ctx = get_worker_context(context)
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.n_remotes)])
+        self.ps = [ctx.Process(target=shmem_worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
+                   for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
+        resource_tracker.ensure_running()  # shared with the workers, so the shared memory is only unlinked by close()
+        for p in self.ps:
+            p.daemon = True  # if the main process crashes, we should not cause things to hang
+            with clear_mpi_env_vars():
+                p.start()
+        for remote in self.work_remotes:
+            remote.close()
+
+        self.remotes[0].send(('get_spaces', None))
+        observation_space, action_space = self.remotes[0].recv().x
+        VecEnv.__init__(self, num_envs, observation_space, action_space)
+        self.obs_shape = space2shape(self.observation_space)
+
+        # shared arrays of all the envs, the names of observations are "obs" or "obs.key" for Dict spaces
+        if isinstance(self.observation_space, Dict):
+            obs_spaces = [(k, v) for k, v in self.observation_space.spaces.items()]
+        else:
+            obs_spaces = [(None, self.observation_space)]
+        self.obs_names = {prefix: [(prefix if k is None else prefix + "." + k, k) for k, _ in obs_spaces]
+                          for prefix in ['obs', 'reset_obs']}
+        specs = {'rewards': ((), np.float32), 'terminated': ((), bool), 'truncated': ((), bool)}
+        for prefix in ['obs', 'reset_obs']:
+            for (name, _), (_, space) in zip(self.obs_names[prefix], obs_spaces):
+                specs[name] = (space.shape, space.dtype)
+        self.shared_memories, self.buffers, shared_specs = [], {}, {}
+        for name, (shape, dtype) in specs.items():
+            shape = combined_shape(self.num_envs, shape)
+            n_bytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            memory = shared_memory.SharedMemory(create=True, size=n_bytes)
+            self.shared_memories.append(memory)
+            self.buffers[name] = np.ndarray(shape, dtype, buffer=memory.buf)
+            shared_specs[name] = (memory.name, shape, np.dtype(dtype).str)
+        for i_remote, remote in enumerate(self.remotes):
+            remote.send(('set_shared_memory', (shared_specs, self.obs_names, i_remote * in_series)))
+        for remote in self.remotes:
+            remote.recv()
+
+        # copies of the shared arrays after the last reset or step, read by the agents like SubprocVecEnv_Gym
+        self.buf_obs = self._get_obs('obs')
+        self.buf_dones = np.zeros((self.num_envs,), dtype=bool)
+        self.buf_trunctions = np.zeros((self.num_envs,), dtype=bool)
+        self.buf_rews = np.zeros((self.num_envs,), dtype=np.float32)
+        self.buf_infos = [{} for _ in range(self.num_envs)]
+        self.actions = None
+        self.remotes[0].send(('get_max_cycles', None))
+        self.max_episode_length = self.remotes[0].recv().x
+
+    def _get_obs(self, prefix, e=None):
+        index = slice(None) if e is None else e
+        names = self.obs_names[prefix]
+        if names[0][1] is None:
+            return self.buffers[prefix][index].copy()
+        return {key: self.buffers[name][index].copy() for name, key in names}
+
+    def step_async(self, actions):
+        self._assert_not_closed()
+        actions = np.array_split(actions, self.n_remotes)
+        for remote, action in zip(self.remotes, actions):
+            remote.send(('step', action))
+        self.waiting = True
+
+    def step_wait(self):
+        self._assert_not_closed()
+        results = [remote.recv() for remote in self.remotes]
+        if self.stats is not None:
+            results = self.stats.record_replies(results)
+        self.buf_infos = flatten_list(results)
+        self.waiting = False
+        self.buf_obs, self.buf_rews = self._get_obs('obs'), self.buffers['rewards'].copy()
+        self.buf_dones, self.buf_trunctions = self.buffers['terminated'].copy(), self.buffers['truncated'].copy()
+        for e in np.where(self.buf_dones | self.buf_trunctions)[0]:
+            self.buf_infos[e]["reset_obs"] = self._get_obs('reset_obs', e)
+        # the observations are copied from the shared memory once, buf_obs is the returned copy
+        return self.buf_obs, self.buf_rews.copy(), self.buf_dones.copy(), self.buf_trunctions.copy(), \
+            self.buf_infos.copy()
+
+    def reset(self):
+        self._assert_not_closed()
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        self.buf_infos = flatten_list([remote.recv() for remote in self.remotes])
+        self.buf_obs = self._get_obs('obs')
+        return self.buf_obs, self.buf_infos.copy()
+
+    def close_extras(self):
+        self.closed = True
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.buffers.clear()  # release the views before closing the shared memory
+        for memory in self.shared_memories:
+            memory.close()
+            memory.unlink()
+
+    def render(self, mode):
+        self._assert_not_closed()
+        for pipe in self.remotes:
+            pipe.send(('render', mode))
+        imgs = [pipe.recv() for pipe in self.remotes]
+        imgs = flatten_list(imgs)
+        return imgs
+
+    def enable_stats(self):
+        assert not self.waiting, "Enabling the statistics while stepping."
+        if self.stats is not None:
+            return
+        VecEnv.enable_stats(self, self.n_remotes)
+        for remote in self.remotes:
+            remote.send(('set_stats', True))
+        for remote in self.remotes:
+            remote.recv()
+
+    def _assert_not_closed(self):
+        assert not self.closed, "Trying to operate on a ShmemVecEnv after calling close()"
+
+    def __del__(self):
+        if not self.closed:
+            self.close()
+
+
+class AsyncVecEnv_Gym(SubprocVecEnv_Gym):
+    """
+    VecEnv that runs each environment in a subprocess and returns the first batch_size environments that are ready,
+    so the throughput is set by the ready workers rather than the slowest one.
+    After reset(), call send(actions, env_ids) and recv() alternately, the synchronous step() is still available
+    when no environment is pending.
+    """
+    def __init__(self, env_fns, batch_size=None, context='spawn'):
+        super(AsyncVecEnv_Gym, self).__init__(env_fns, context, in_series=1)
+        self.batch_size = self.num_envs if batch_size is None else batch_size
+        assert 0 < self.batch_size <= self.num_envs, "batch_size must be in [1, number of envs]."
+        self.pending = np.zeros(self.num_envs, dtype=bool)  # the envs whose step results are not received yet
+        self.remote_ids = {remote: i for i, remote in enumerate(self.remotes)}
+
+    def send(self, actions, env_ids):
+        self._assert_not_closed()
+        assert not np.any(self.pending[env_ids]), "Sending actions to the envs that are still stepping."
+        for action, e in zip(actions, env_ids):
+            self.remotes[e].send(('step', [action]))
+        self.pending[env_ids] = True
+
+    def recv(self):
+        """Returns the step results and the ids of the first batch_size envs that are ready."""
+        self._assert_not_closed()
+        assert self.pending.sum() >= self.batch_size, "Fewer than batch_size envs are stepping."
+        env_ids, results = [], []
+        while len(env_ids) < self.batch_size:
+            for remote in wait([self.remotes[e] for e in np.where(self.pending)[0]]):
+                if len(env_ids) == self.batch_size:
+                    break
+                e = self.remote_ids[remote]
+                reply = remote.recv()
+                if self.stats is not None:
+                    reply = self.stats.record_replies([reply], [e])[0]
+                results.append(reply[0])
+                env_ids.append(e)
+                self.pending[e] = False
+        obs, rews, dones, truncated, infos = zip(*results)
+        if self.stats is not None:
+            self.stats.record_resets(env_ids, np.array(dones), np.array(truncated))
+        return self._stack_obs(obs), np.array(rews, dtype=np.float32), np.array(dones), np.array(truncated), list(infos), \
+            np.array(env_ids)
+
+    def enable_stats(self):
+        assert not np.any(self.pending), "Enabling the statistics while stepping."
+        super(AsyncVecEnv_Gym, self).enable_stats()
+
+    def close_extras(self):
+        for e in np.where(self.pending)[0]:
+            self.remotes[e].recv()
+        self.pending[:] = False
+        super(AsyncVecEnv_Gym, self).close_extras()
+
+
 class DummyVecEnv_Gym(VecEnv):
     """
     VecEnv that does runs multiple environments sequentially, that is,
@@ -173,9 +473,7 @@ class DummyVecEnv_Gym(VecEnv):
 
     def reset(self):
         for e in range(self.num_envs):
-            obs, info = self.envs[e].reset()
-            self._save_obs(e, obs)
-            self._save_infos(e, info)
+            self._reset_env(e)
         return self.buf_obs.copy(), self.buf_infos.copy()
 
     def step_async(self, actions):
@@ -199,15 +497,29 @@ class DummyVecEnv_Gym(VecEnv):
         if not self.waiting:
             raise NotSteppingError
         for e in range(self.num_envs):
-            action = self.actions[e]
-            obs, self.buf_rews[e], self.buf_dones[e], self.buf_trunctions[e], self.buf_infos[e] = self.envs[e].step(action)
-            if self.buf_dones[e] or self.buf_trunctions[e]:
-                obs_reset, _ = self.envs[e].reset()
-                self.buf_infos[e]["reset_obs"] = obs_reset
-            self._save_obs(e, obs)
+            self._step_env(e)
         self.waiting = False
         return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), self.buf_trunctions.copy(), self.buf_infos.copy()
 
+    def enable_stats(self):
+        if self.stats is not None:
+            return
+        super(DummyVecEnv_Gym, self).enable_stats()
+        self._step_env = self.stats.timed_env(self._step_env)  # also timed in the threads of the Thread vec envs
+
+    def _step_env(self, e):
+        action = self.actions[e]
+        obs, self.buf_rews[e], self.buf_dones[e], self.buf_trunctions[e], self.buf_infos[e] = self.envs[e].step(action)
+        if self.buf_dones[e] or self.buf_trunctions[e]:
+            obs_reset, _ = self.envs[e].reset()
+            self.buf_infos[e]["reset_obs"] = obs_reset
+        self._save_obs(e, obs)
+
+    def _reset_env(self, e):
+        obs, info = self.envs[e].reset()
+        self._save_obs(e, obs)
+        self._save_infos(e, info)
+
     def close_extras(self):
         self.closed = True
         for env in self.envs:
@@ -234,7 +546,41 @@ class DummyVecEnv_Atari(DummyVecEnv_Gym):
         self.buf_obs = np.zeros(combined_shape(self.num_envs, self.obs_shape), dtype=np.uint8)
 
 
+class ThreadVecEnv_Gym(DummyVecEnv_Gym):
+    """
+    VecEnv that steps the environments in a pool of threads of the main process. It only speeds up the simulators that
+    release the GIL during their step, e.g. the C++ emulator of ALE, and saves the process spawn, the pickling and the
+    duplicated memory of SubprocVecEnv_Gym.
+        n_threads: number of the threads, defaults to one for each environment.
+    """
+    def __init__(self, env_fns, n_threads=None):
+        super(ThreadVecEnv_Gym, self).__init__(env_fns)
+        self.n_threads = self.num_envs if n_threads is None else min(n_threads, self.num_envs)
+        self.pool = ThreadPoolExecutor(max_workers=self.n_threads)
+
+    def reset(self):
+        list(self.pool.map(self._reset_env, range(self.num_envs)))
+        return self.buf_obs.copy(), self.buf_infos.copy()
+
+    def step_wait(self):
+        if not self.waiting:
+            raise NotSteppingError
+        list(self.pool.map(self._step_env, range(self.num_envs)))  # list() re-raises the errors of the threads
+        self.waiting = False
+        return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), self.buf_trunctions.copy(), self.buf_infos.copy()
+
+    def close_extras(self):
+        self.pool.shutdown(wait=True)
+        super(ThreadVecEnv_Gym, self).close_extras()
+
+
+class ThreadVecEnv_Atari(ThreadVecEnv_Gym):
+    def __init__(self, env_fns, n_threads=None):
+        super(ThreadVecEnv_Atari, self).__init__(env_fns, n_threads)
+        self.buf_obs = np.zeros(combined_shape(self.num_envs, self.obs_shape), dtype=np.uint8)
+
+
 class SubprocVecEnv_Atari(SubprocVecEnv_Gym):
-    def __init__(self, env_fns):
-        super(SubprocVecEnv_Atari, self).__init__(env_fns)
+    def __init__(self, env_fns, context='spawn', in_series=1):
+        super(SubprocVecEnv_Atari, self).__init__(env_fns, context, in_series)
         self.buf_obs = np.zeros(combined_shape(self.num_envs, self.obs_shape), dtype=np.uint8)
@@ -15,12 +15,12 @@ class MAgent_Env(PettingZoo_Env, ParallelEnv):
         if env_id in ["battle_v4", "battlefield_v4", "combined_arms_v6"]:
             kwargs['step_reward'] = -0.005
             kwargs['dead_penalty'] = -0.1
-            kwargs['attack_peanlty'] = -0.1
+            kwargs['attack_penalty'] = -0.1
             kwargs['attack_opponent_reward'] = 0.2
         if env_id in ["gather_v4"]:
             kwargs['step_reward'] = -0.01
             kwargs['dead_penalty'] = -1
-            kwargs['attack_peanlty'] = -0.1
+            kwargs['attack_penalty'] = -0.1
             kwargs['attack_food_reward'] = 0.5
         if env_id in ["tiger_deer_v3"]:
             kwargs['tiger_step_recover'] = -0.1
@@ -2,8 +2,10 @@ import copy
 
 from xuanpolicy.environment.vector_envs.vector_env import VecEnv, AlreadySteppingError, NotSteppingError
 from xuanpolicy.environment.vector_envs.env_utils import obs_n_space_info
-from xuanpolicy.environment.pettingzoo.pettingzoo_vec_env import DummyVecEnv_Pettingzoo
+from xuanpolicy.environment.pettingzoo.pettingzoo_vec_env import DummyVecEnv_Pettingzoo, SubprocVecEnv_Pettingzoo, \
+    agent_index_info
 from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import time
 
@@ -14,6 +16,7 @@ class DummyVecEnv_MAgent(DummyVecEnv_Pettingzoo):
         self.envs = [fn() for fn in env_fns]
         env = self.envs[0]
         self.handles = env.handles
+        self.side_names = env.side_names
         VecEnv.__init__(self, len(env_fns), env.observation_spaces, env.action_spaces)
         self.state_space = env.state_space
         obs_n_space = env.observation_spaces  # [Box(dim_o), Box(dim_o), ...] ----> dict
@@ -28,126 +31,147 @@ class DummyVecEnv_MAgent(DummyVecEnv_Pettingzoo):
         self.obs_shapes = [self.shapes[self.agent_keys[h.value][0]] for h in self.handles]
         self.obs_dtype = self.dtypes[self.keys[0]]
 
-        # buffer of dict data
-        self.buf_obs_dict = [{k: np.zeros(tuple(self.shapes[k]), dtype=self.dtypes[k]) for k in self.keys} for _ in
-                             range(self.num_envs)]
-        self.buf_rews_dict = [{k: 0.0 for k in self.keys} for _ in range(self.num_envs)]
-        self.buf_dones_dict = [{k: False for k in self.keys} for _ in range(self.num_envs)]
-        self.buf_trunctions_dict = [{k: False for k in self.keys} for _ in range(self.num_envs)]
+        # precomputed positions of the agents in the group-wise arrays
+        self.agent_index = agent_index_info(self.agent_keys)
+        self.agent_getters = [itemgetter(*agent_keys_h) for agent_keys_h in self.agent_keys]
+        self.empty_infos = {k: {} for k in self.keys}
         self.buf_infos_dict = [{} for _ in range(self.num_envs)]
         # buffer of numpy data
         self.buf_obs = [np.zeros((self.num_envs, n, np.prod(self.obs_shapes[h])), dtype=self.obs_dtype) for h, n in
                         enumerate(self.n_agents)]
         self.buf_rews = [np.zeros((self.num_envs, n, 1), dtype=np.float32) for n in self.n_agents]
-        self.buf_dones = [np.ones((self.num_envs, n), dtype=np.bool) for n in self.n_agents]
-        self.buf_trunctions = [np.ones((self.num_envs, n), dtype=np.bool) for n in self.n_agents]
+        self.buf_dones = [np.ones((self.num_envs, n), dtype=bool) for n in self.n_agents]
+        self.buf_trunctions = [np.ones((self.num_envs, n), dtype=bool) for n in self.n_agents]
 
         self.max_episode_length = env.max_cycles
         self.actions = None
 
-    def empty_dict_buffers(self, i_env):
-        # buffer of dict data
-        self.buf_obs_dict[i_env] = {k: np.zeros(tuple(self.shapes[k]), dtype=self.dtypes[k]) for k in self.keys}
-        self.buf_rews_dict[i_env] = {k: 0.0 for k in self.keys}
-        self.buf_dones_dict[i_env] = {k: False for k in self.keys}
-        self.buf_trunctions_dict[i_env] = {k: False for k in self.keys}
-        self.buf_infos_dict[i_env] = {k: {} for k in self.keys}
+
+class ThreadVecEnv_MAgent(DummyVecEnv_MAgent):
+    """
+    DummyVecEnv_MAgent that steps the environments in a pool of threads, the simulations of libmagent.so release the
+    GIL in their ctypes calls, so they run in parallel without the subprocesses.
+        n_threads: number of the threads, defaults to one for each environment.
+    """
+    def __init__(self, env_fns, n_threads=None):
+        super(ThreadVecEnv_MAgent, self).__init__(env_fns)
+        self.n_threads = self.num_envs if n_threads is None else min(n_threads, self.num_envs)
+        self.pool = ThreadPoolExecutor(max_workers=self.n_threads)
 
     def reset(self):
-        for e in range(self.num_envs):
-            obs, info = self.envs[e].reset()
-            self.buf_obs_dict[e].update(obs)
-            self.buf_infos_dict[e].update(info["infos"])
-            for h, agent_keys_h in enumerate(self.agent_keys):
-                self.buf_obs[h][e] = itemgetter(*agent_keys_h)(self.buf_obs_dict[e])
+        list(self.pool.map(self._reset_env, range(self.num_envs)))
         return self.buf_obs.copy(), self.buf_infos_dict.copy()
 
-    def reset_one_env(self, e):
-        o = self.envs[e].reset()
-        self.buf_obs_dict[e].update(o)
-        obs_e = []
-        for h, agent_keys_h in enumerate(self.agent_keys):
-            self.buf_obs[h][e] = itemgetter(*agent_keys_h)(self.buf_obs_dict[e])
-            obs_e.append(self.buf_obs[h][e])
-
-        return obs_e
-
-    def _get_max_obs_shape(self, k, observation_shape):
-        obs_shape_n = itemgetter(*list(k))(observation_shape)
-        size_obs_n = []
-        for shape in obs_shape_n:
-            size_obs_n.append(shape.shape)
-        return max(size_obs_n)
-
-    def step_async(self, actions):
-        if self.waiting:
-            raise AlreadySteppingError
-        listify = True
-        try:
-            if len(actions) == self.num_envs:
-                listify = False
-        except TypeError:
-            pass
-        if not listify:
-            self.actions = actions
-        else:
-            assert self.num_envs == 1, "actions {} is either not a list or has a wrong size - cannot match to {} environments".format(
-                actions, self.num_envs)
-            self.actions = [actions]
-        self.waiting = True
-
     def step_wait(self):
         if not self.waiting:
             raise NotSteppingError
-
-        for e in range(self.num_envs):
-            action_n = self.actions[e]
-            o, r, d, t, info = self.envs[e].step(action_n)
-            if len(o.keys()) < self.n_agent_all:
-                self.empty_dict_buffers(e)
-            # update the data of alive agents
-            self.buf_obs_dict[e].update(o)
-            self.buf_rews_dict[e].update(r)
-            self.buf_dones_dict[e].update(d)
-            self.buf_trunctions_dict[e].update(t)
-            self.buf_infos_dict[e].update(info["infos"])
-
-            # resort the data as group-wise
-            episode_scores = []
-            for h, agent_keys_h in enumerate(self.agent_keys):
-                getter = itemgetter(*agent_keys_h)
-                self.buf_obs[h][e] = getter(self.buf_obs_dict[e])
-                self.buf_rews[h][e, :, 0] = getter(self.buf_rews_dict[e])
-                self.buf_dones[h][e] = getter(self.buf_dones_dict[e])
-                self.buf_trunctions[h][e] = getter(self.buf_trunctions_dict[e])
-                episode_scores.append(getter(info["individual_episode_rewards"]))
-            self.buf_infos_dict[e]["individual_episode_rewards"] = episode_scores
-
-            if all(self.buf_dones_dict[e].values()) or all(self.buf_trunctions_dict[e].values()):
-                obs_reset, _ = self.envs[e].reset()
-                obs_reset_handles = []
-                for h, agent_keys_h in enumerate(self.agent_keys):
-                    getter = itemgetter(*agent_keys_h)
-                    obs_reset_handles.append(np.array(getter(obs_reset)))
-
-                self.buf_infos_dict[e]["reset_obs"] = obs_reset_handles
+        list(self.pool.map(self._step_env, range(self.num_envs)))  # list() re-raises the errors of the threads
         self.waiting = False
         return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), self.buf_trunctions.copy(), self.buf_infos_dict.copy()
 
-    def render(self, mode=None):
-        return [env.render() for env in self.envs]
+    def close_extras(self):
+        self.pool.shutdown(wait=True)
+        super(ThreadVecEnv_MAgent, self).close_extras()
 
-    def global_state(self):
-        return np.array([env.state() for env in self.envs])
 
-    def global_state_one_env(self, e):
-        return np.array(self.envs[e].state())
+class SubprocVecEnv_MAgent(SubprocVecEnv_Pettingzoo):
+    """
+    SubprocVecEnv_Pettingzoo for the MAgent2 environments, the observations of each agent are flattened as in
+    DummyVecEnv_MAgent.
+    """
+    def _group_obs_shape(self, h):
+        return (int(np.prod(self.obs_shapes[h])),)
 
-    def agent_mask(self):
-        agent_mask = [np.ones([self.num_envs, n], dtype=np.bool) for n in self.n_agents]
-        for e, env in enumerate(self.envs):
-            mask = env.get_agent_mask()
-            for h, ids in enumerate(self.agent_ids):
-                agent_mask[h][e] = mask[ids]
 
-        return agent_mask
+class NativeVecEnv_MAgent(DummyVecEnv_MAgent):
+    """
+    VecEnv of MAgent2 that drives the GridWorld of each environment directly. The group buffers filled by the C library
+    are copied into the group-wise arrays and the actions are set group by group, so a step has no Python work for
+    each agent. step() takes the actions as the group-wise arrays [num_envs, n_agents] of each handle.
+    The agents killed in the former steps have zero observations and rewards, their terminals stay True and
+    agent_mask() marks them as dead.
+    """
+    def __init__(self, env_fns):
+        super(NativeVecEnv_MAgent, self).__init__(env_fns)
+        self.parallel_envs = [env.env for env in self.envs]
+        self.worlds = [env.env.env for env in self.envs]
+        self.id_offsets = []
+        for ids in self.agent_ids:
+            assert np.array_equal(ids, np.arange(ids[0], ids[0] + len(ids))), "The agent ids of a group must be consecutive."
+            self.id_offsets.append(int(ids[0]))
+        self.obs_shapes = [tuple(shape) for shape in self.obs_shapes]
+        self.buf_reset_obs = [np.zeros_like(buf) for buf in self.buf_obs]
+        self.buf_agent_mask = [np.zeros((self.num_envs, n), dtype=bool) for n in self.n_agents]
+        self.buf_episode_rewards = [np.zeros((self.num_envs, n), dtype=np.float32) for n in self.n_agents]
+        self.alive_slots = [[np.arange(n) for n in self.n_agents] for _ in range(self.num_envs)]
+
+    def _write_observations(self, e, buf_obs):
+        world, env = self.worlds[e], self.parallel_envs[e]
+        for h, handle in enumerate(self.handles):
+            slots = world.get_agent_id(handle) - self.id_offsets[h]
+            view, features = world.get_observation(handle)
+            obs = buf_obs[h][e].reshape((self.n_agents[h],) + self.obs_shapes[h])  # a view of the group array
+            obs[:] = 0
+            obs[slots, :, :, :view.shape[-1]] = view
+            if env.minimap_mode or env.extra_features:
+                if env.minimap_mode and not env.extra_features:
+                    features = features[:, -2:]
+                obs[slots, :, :, view.shape[-1]:] = features[:, np.newaxis, np.newaxis, :]
+
+    def _update_alive(self, e):
+        # the agents in the world after clear_dead()
+        for h, handle in enumerate(self.handles):
+            self.alive_slots[e][h] = self.worlds[e].get_agent_id(handle) - self.id_offsets[h]
+            self.buf_agent_mask[h][e] = False
+            self.buf_agent_mask[h][e, self.alive_slots[e][h]] = True
+
+    def _reset_env(self, e, buf_obs=None):
+        env = self.parallel_envs[e]
+        env.agents = env.possible_agents[:]
+        env.env.reset()
+        env.frames = 0
+        env.generate_map()
+        env.team_sizes = [env.env.get_num(handle) for handle in self.handles]
+        for rewards in self.buf_episode_rewards:
+            rewards[e] = 0.0
+        self._write_observations(e, self.buf_obs if buf_obs is None else buf_obs)
+        self._update_alive(e)
+        self.buf_infos_dict[e] = {}
+
+    def step_async(self, actions):
+        if self.waiting:
+            raise AlreadySteppingError
+        self.actions = actions
+        self.waiting = True
+
+    def _step_env(self, e):
+        world, env = self.worlds[e], self.parallel_envs[e]
+        for h, handle in enumerate(self.handles):
+            actions = np.asarray(self.actions[h][e]).reshape(-1)[self.alive_slots[e][h]]
+            world.set_action(handle, np.ascontiguousarray(actions, dtype=np.int32))
+        step_done = world.step()
+        env.frames += 1
+
+        for h, handle in enumerate(self.handles):
+            slots = world.get_agent_id(handle) - self.id_offsets[h]  # including the agents killed in this step
+            rewards = world.get_reward(handle)
+            self.buf_rews[h][e] = 0.0
+            self.buf_rews[h][e, slots, 0] = rewards
+            self.buf_dones[h][e] = True
+            if not step_done:
+                self.buf_dones[h][e, slots] = ~world.get_alive(handle)
+            self.buf_trunctions[h][e] = env.frames >= env.max_cycles
+            self.buf_episode_rewards[h][e, slots] += rewards
+        self._write_observations(e, self.buf_obs)
+        world.clear_dead()
+        self._update_alive(e)
+        self.buf_infos_dict[e] = {"individual_episode_rewards": [rewards[e].copy() for rewards in self.buf_episode_rewards]}
+
+        if all(dones[e].all() for dones in self.buf_dones) or all(trunc[e].all() for trunc in self.buf_trunctions):
+            info = self.buf_infos_dict[e]
+            self._reset_env(e, self.buf_reset_obs)
+            info["reset_obs"] = [obs[e].copy() for obs in self.buf_reset_obs]
+            self.buf_infos_dict[e] = info
+
+    def agent_mask(self):
+        return [mask.copy() for mask in self.buf_agent_mask]
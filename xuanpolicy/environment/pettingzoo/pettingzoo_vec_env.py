@@ -1,9 +1,50 @@
 from xuanpolicy.environment.vector_envs.vector_env import VecEnv, AlreadySteppingError, NotSteppingError
 from xuanpolicy.environment.vector_envs.env_utils import obs_n_space_info
+from xuanpolicy.environment.vector_envs.subproc_vec_env import clear_mpi_env_vars, get_worker_context, flatten_list, \
+    CloudpickleWrapper
 from xuanpolicy.environment.gym.gym_vec_env import DummyVecEnv_Gym
 from operator import itemgetter
 from gymnasium.spaces.box import Box
 import numpy as np
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+
+def agent_index_info(agent_keys):
+    """
+    Map the agent keys to their positions in the group-wise arrays.
+        agent_keys: the keys of the agents in each group.
+    Returns the dict from the keys to the agent ids, and the group and the slot in the group of each agent id.
+    """
+    keys = [k for keys_h in agent_keys for k in keys_h]
+    index = {k: i for i, k in enumerate(keys)}
+    handles = np.array([h for h, keys_h in enumerate(agent_keys) for _ in keys_h], dtype=np.int64)
+    slots = np.array([i for keys_h in agent_keys for i in range(len(keys_h))], dtype=np.int64)
+    return index, handles, slots
+
+
+def write_group_obs(agent_index, buf_obs, e, obs_dict):
+    """Write the observations in obs_dict into the group-wise arrays buf_obs of env e."""
+    index, handles, slots = agent_index
+    ids = np.fromiter(map(index.__getitem__, obs_dict.keys()), np.int64, len(obs_dict))
+    values = list(obs_dict.values())
+    handles_ids = handles[ids]
+    for h, buf in enumerate(buf_obs):
+        positions = np.flatnonzero(handles_ids == h)
+        if len(positions):
+            obs_h = np.concatenate([values[j] for j in positions])
+            buf[e, slots[ids[positions]]] = obs_h.reshape((-1,) + buf.shape[2:])
+
+
+def write_group_values(agent_index, bufs, e, data_dict, dtype):
+    """Write the scalars in data_dict, e.g. the rewards or terminals, into the group-wise arrays bufs of env e."""
+    index, handles, slots = agent_index
+    ids = np.fromiter(map(index.__getitem__, data_dict.keys()), np.int64, len(data_dict))
+    values = np.fromiter(data_dict.values(), dtype, len(data_dict))
+    handles_ids = handles[ids]
+    for h, buf in enumerate(bufs):
+        in_h = handles_ids == h
+        buf[e].reshape(-1)[slots[ids[in_h]]] = values[in_h]
 
 
 class DummyVecEnv_Pettingzoo(DummyVecEnv_Gym):
@@ -12,6 +53,7 @@ class DummyVecEnv_Pettingzoo(DummyVecEnv_Gym):
         self.envs = [fn() for fn in env_fns]
         env = self.envs[0]
         self.handles = env.handles
+        self.side_names = env.side_names
         VecEnv.__init__(self, len(env_fns), env.observation_spaces, env.action_spaces)
         self.state_space = env.state_space
         obs_n_space = env.observation_spaces  # [Box(dim_o), Box(dim_o), ...] ----> dict
@@ -28,49 +70,44 @@ class DummyVecEnv_Pettingzoo(DummyVecEnv_Gym):
         self.obs_shapes = [self.shapes[self.agent_keys[h.value][0]] for h in self.handles]
         self.obs_dtype = self.dtypes[self.keys[0]]
 
-        # buffer of dict data
-        self.buf_obs_dict = [{k: np.zeros(tuple(self.shapes[k]), dtype=self.dtypes[k]) for k in self.keys} for _ in
-                             range(self.num_envs)]
-        self.buf_rews_dict = [{k: 0.0 for k in self.keys} for _ in range(self.num_envs)]
-        self.buf_dones_dict = [{k: False for k in self.keys} for _ in range(self.num_envs)]
-        self.buf_trunctions_dict = [{k: False for k in self.keys} for _ in range(self.num_envs)]
+        # precomputed positions of the agents in the group-wise arrays
+        self.agent_index = agent_index_info(self.agent_keys)
+        self.agent_getters = [itemgetter(*agent_keys_h) for agent_keys_h in self.agent_keys]
+        self.empty_infos = {k: {} for k in self.keys}
         self.buf_infos_dict = [{} for _ in range(self.num_envs)]
         # buffer of numpy data
         self.buf_obs = [np.zeros((self.num_envs, n) + tuple(self.obs_shapes[h]), dtype=self.obs_dtype) for h, n in
                         enumerate(self.n_agents)]
         self.buf_rews = [np.zeros((self.num_envs, n, 1), dtype=np.float32) for n in self.n_agents]
-        self.buf_dones = [np.ones((self.num_envs, n), dtype=np.bool) for n in self.n_agents]
-        self.buf_trunctions = [np.ones((self.num_envs, n), dtype=np.bool) for n in self.n_agents]
+        self.buf_dones = [np.ones((self.num_envs, n), dtype=bool) for n in self.n_agents]
+        self.buf_trunctions = [np.ones((self.num_envs, n), dtype=bool) for n in self.n_agents]
 
         self.max_episode_length = env.max_cycles
         self.actions = None
 
-    def empty_dict_buffers(self, i_env):
-        # buffer of dict data
-        self.buf_obs_dict[i_env] = {k: np.zeros(tuple(self.shapes[k]), dtype=self.dtypes[k]) for k in self.keys}
-        self.buf_rews_dict[i_env] = {k: 0.0 for k in self.keys}
-        self.buf_dones_dict[i_env] = {k: False for k in self.keys}
-        self.buf_trunctions_dict[i_env] = {k: False for k in self.keys}
-        self.buf_infos_dict[i_env] = {k: {} for k in self.keys}
+    def empty_group_buffers(self, i_env):
+        # the data of dead agents are zeros
+        for h in range(len(self.n_agents)):
+            self.buf_obs[h][i_env] = 0
+            self.buf_rews[h][i_env] = 0.0
+            self.buf_dones[h][i_env] = False
+            self.buf_trunctions[h][i_env] = False
+        self.buf_infos_dict[i_env].update(self.empty_infos)
 
     def reset(self):
         for e in range(self.num_envs):
-            obs, info = self.envs[e].reset()
-            self.buf_obs_dict[e].update(obs)
-            self.buf_infos_dict[e].update(info["infos"])
-            for h, agent_keys_h in enumerate(self.agent_keys):
-                self.buf_obs[h][e] = itemgetter(*agent_keys_h)(self.buf_obs_dict[e])
+            self._reset_env(e)
         return self.buf_obs.copy(), self.buf_infos_dict.copy()
 
-    def reset_one_env(self, e):
-        o = self.envs[e].reset()
-        self.buf_obs_dict[e].update(o)
-        obs_e = []
-        for h, agent_keys_h in enumerate(self.agent_keys):
-            self.buf_obs[h][e] = itemgetter(*agent_keys_h)(self.buf_obs_dict[e])
-            obs_e.append(self.buf_obs[h][e])
+    def _reset_env(self, e):
+        obs, info = self.envs[e].reset()
+        write_group_obs(self.agent_index, self.buf_obs, e, obs)
+        self.buf_infos_dict[e].update(info["infos"])
 
-        return obs_e
+    def reset_one_env(self, e):
+        obs, _ = self.envs[e].reset()
+        write_group_obs(self.agent_index, self.buf_obs, e, obs)
+        return [self.buf_obs[h][e] for h in range(len(self.n_agents))]
 
     def _get_max_obs_shape(self, k, observation_shape):
         obs_shape_n = itemgetter(*list(k))(observation_shape)
@@ -101,39 +138,28 @@ class DummyVecEnv_Pettingzoo(DummyVecEnv_Gym):
             raise NotSteppingError
 
         for e in range(self.num_envs):
-            action_n = self.actions[e]
-            o, r, d, t, info = self.envs[e].step(action_n)
-            if len(o.keys()) < self.n_agent_all:
-                self.empty_dict_buffers(e)
-            # update the data of alive agents
-            self.buf_obs_dict[e].update(o)
-            self.buf_rews_dict[e].update(r)
-            self.buf_dones_dict[e].update(d)
-            self.buf_trunctions_dict[e].update(t)
-            self.buf_infos_dict[e].update(info["infos"])
-
-            # resort the data as group-wise
-            episode_scores = []
-            for h, agent_keys_h in enumerate(self.agent_keys):
-                getter = itemgetter(*agent_keys_h)
-                self.buf_obs[h][e] = getter(self.buf_obs_dict[e])
-                self.buf_rews[h][e, :, 0] = getter(self.buf_rews_dict[e])
-                self.buf_dones[h][e] = getter(self.buf_dones_dict[e])
-                self.buf_trunctions[h][e] = getter(self.buf_trunctions_dict[e])
-                episode_scores.append(getter(info["individual_episode_rewards"]))
-            self.buf_infos_dict[e]["individual_episode_rewards"] = episode_scores
-
-            if all(self.buf_dones_dict[e].values()) or all(self.buf_trunctions_dict[e].values()):
-                obs_reset, _ = self.envs[e].reset()
-                obs_reset_handles = []
-                for h, agent_keys_h in enumerate(self.agent_keys):
-                    getter = itemgetter(*agent_keys_h)
-                    obs_reset_handles.append(np.array(getter(obs_reset)))
-
-                self.buf_infos_dict[e]["reset_obs"] = obs_reset_handles
+            self._step_env(e)
         self.waiting = False
         return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), self.buf_trunctions.copy(), self.buf_infos_dict.copy()
 
+    def _step_env(self, e):
+        action_n = self.actions[e]
+        o, r, d, t, info = self.envs[e].step(action_n)
+        if len(o.keys()) < self.n_agent_all:
+            self.empty_group_buffers(e)
+        # write the data of alive agents into the group-wise arrays
+        write_group_obs(self.agent_index, self.buf_obs, e, o)
+        write_group_values(self.agent_index, self.buf_rews, e, r, np.float32)
+        write_group_values(self.agent_index, self.buf_dones, e, d, bool)
+        write_group_values(self.agent_index, self.buf_trunctions, e, t, bool)
+        self.buf_infos_dict[e].update(info["infos"])
+        self.buf_infos_dict[e]["individual_episode_rewards"] = [getter(info["individual_episode_rewards"])
+                                                                for getter in self.agent_getters]
+
+        if all(dones[e].all() for dones in self.buf_dones) or all(trunc[e].all() for trunc in self.buf_trunctions):
+            obs_reset, _ = self.envs[e].reset()
+            self.buf_infos_dict[e]["reset_obs"] = [np.array(getter(obs_reset)) for getter in self.agent_getters]
+
     def render(self, mode=None):
         return [env.render() for env in self.envs]
 
@@ -144,7 +170,7 @@ class DummyVecEnv_Pettingzoo(DummyVecEnv_Gym):
         return np.array(self.envs[e].state())
 
     def agent_mask(self):
-        agent_mask = [np.ones([self.num_envs, n], dtype=np.bool) for n in self.n_agents]
+        agent_mask = [np.ones([self.num_envs, n], dtype=bool) for n in self.n_agents]
         for e, env in enumerate(self.envs):
             mask = env.get_agent_mask()
             for h, ids in enumerate(self.agent_ids):
@@ -152,5 +178,287 @@ class DummyVecEnv_Pettingzoo(DummyVecEnv_Gym):
         return agent_mask
 
     def available_actions(self):
-        act_mask = [np.ones([self.num_envs, n, self.act_dim[h]], dtype=np.bool) for h, n in enumerate(self.n_agents)]
+        act_mask = [np.ones([self.num_envs, n, self.act_dim[h]], dtype=bool) for h, n in enumerate(self.n_agents)]
         return np.array(act_mask)
+
+
+def shmem_worker(remote, parent_remote, env_fn_wrappers):
+    def groups(prefix):
+        return [buffers["%s_%d" % (prefix, h)] for h in range(len(agent_keys))]
+
+    def write_state(i):
+        # read by global_state() and agent_mask() of the main process
+        if 'state' in buffers:
+            buffers['state'][i] = envs[i].state()
+        mask = envs[i].get_agent_mask()
+        for h, ids in enumerate(agent_ids):
+            buffers["agent_mask_%d" % h][i] = mask[ids]
+
+    parent_remote.close()
+    envs = [env_fn_wrapper() for env_fn_wrapper in env_fn_wrappers.x]
+    keys, _, _ = obs_n_space_info(envs[0].observation_spaces)
+    agent_ids = envs[0].agent_ids
+    agent_keys = [[keys[k] for k in ids] for ids in agent_ids]
+    agent_index = agent_index_info(agent_keys)
+    agent_getters = [itemgetter(*agent_keys_h) for agent_keys_h in agent_keys]
+    empty_infos = {k: {} for k in keys}
+    buf_infos_dict = [{} for _ in envs]
+    memories, buffers = [], {}
+    send_latency = False  # attach the step latencies to the replies, for VecEnvStats
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                start = time.perf_counter()
+                infos, env_ms = [], []
+                for i, (env, action_n) in enumerate(zip(envs, data)):
+                    env_start = time.perf_counter()
+                    o, r, d, t, info = env.step(action_n)
+                    if len(o.keys()) < len(keys):  # the data of dead agents are zeros
+                        for prefix in ['obs', 'rews', 'dones', 'trunctions']:
+                            for buf in groups(prefix):
+                                buf[i] = 0
+                        buf_infos_dict[i].update(empty_infos)
+                    # write the data of alive agents into the group-wise arrays
+                    write_group_obs(agent_index, groups('obs'), i, o)
+                    write_group_values(agent_index, groups('rews'), i, r, np.float32)
+                    write_group_values(agent_index, groups('dones'), i, d, bool)
+                    write_group_values(agent_index, groups('trunctions'), i, t, bool)
+                    buf_infos_dict[i].update(info["infos"])
+                    buf_infos_dict[i]["individual_episode_rewards"] = [getter(info["individual_episode_rewards"])
+                                                                       for getter in agent_getters]
+
+                    reset = all(dones[i].all() for dones in groups('dones')) or \
+                        all(trunc[i].all() for trunc in groups('trunctions'))
+                    if reset:
+                        obs_reset, _ = env.reset()
+                        write_group_obs(agent_index, groups('reset_obs'), i, obs_reset)
+                    write_state(i)
+                    infos.append((buf_infos_dict[i], reset))
+                    env_ms.append((time.perf_counter() - env_start) * 1000)
+                if send_latency:
+                    remote.send((infos, env_ms, (time.perf_counter() - start) * 1000))
+                else:
+                    remote.send(infos)
+            elif cmd == 'set_stats':
+                send_latency = data
+                remote.send(None)
+            elif cmd == 'reset':
+                infos = []
+                for i, env in enumerate(envs):
+                    obs, info = env.reset()
+                    write_group_obs(agent_index, groups('obs'), i, obs)
+                    buf_infos_dict[i].update(info["infos"])
+                    write_state(i)
+                    infos.append(buf_infos_dict[i])
+                remote.send(infos)
+            elif cmd == 'set_shared_memory':
+                specs, start = data
+                for name, (memory_name, shape, dtype) in specs.items():
+                    memory = shared_memory.SharedMemory(name=memory_name)
+                    memories.append(memory)
+                    buffers[name] = np.ndarray(shape, dtype, buffer=memory.buf)[start: start + len(envs)]
+                remote.send(None)
+            elif cmd == 'render':
+                remote.send([env.render() for env in envs])
+            elif cmd == 'close':
+                remote.close()
+                break
+            elif cmd == 'get_env_info':
+                env = envs[0]
+                remote.send(CloudpickleWrapper({'handles': env.handles, 'side_names': env.side_names,
+                                                'observation_spaces': env.observation_spaces,
+                                                'action_spaces': env.action_spaces, 'state_space': env.state_space,
+                                                'agent_ids': env.agent_ids,
+                                                'n_agents': [env.get_num(h) for h in env.handles],
+                                                'max_cycles': env.max_cycles}))
+            else:
+                raise NotImplementedError
+    except KeyboardInterrupt:
+        print('SubprocVecEnv_Pettingzoo worker: got KeyboardInterrupt')
+    finally:
+        for env in envs:
+            env.close()
+        buffers.clear()  # release the views before closing the shared memory
+        for memory in memories:
+            memory.close()
+
+
+class SubprocVecEnv_Pettingzoo(VecEnv):
+    """
+    VecEnv that runs multiple multi-agent environments in subprocesses. Each worker resorts the dict data of its
+    environments as group-wise arrays and writes the observations, rewards, terminals, truncations, global states and
+    agent masks into shared memory, so global_state() and agent_mask() read them without another round-trip.
+    A finished environment is reset by its worker, the group-wise observations after reset are in info["reset_obs"].
+    """
+    def __init__(self, env_fns, context='spawn', in_series=1):
+        """
+        Arguments:
+        env_fns: iterable of callables -  functions that create environments to run in subprocesses. Need to be cloud-pickleable
+        in_series: number of environments to run in series in a single process
+        (e.g. when len(env_fns) == 12 and in_series == 3, it will run 4 processes, each running 3 envs in series)
+        """
+        self.waiting = False
+        self.closed = False
+        self.in_series = in_series
+        num_envs = len(env_fns)
+        assert num_envs % in_series == 0, "Number of envs must be divisible by number of envs to run in series"
+        self.n_remotes = num_envs // in_series
+        env_fns = np.array_split(env_fns, self.n_remotes)
+        ctx = get_worker_context(context)
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.n_remotes)])
+        self.ps = [ctx.Process(target=shmem_worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
+                   for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
+        resource_tracker.ensure_running()  # shared with the workers, so the shared memory is only unlinked by close()
+        for p in self.ps:
+            p.daemon = True  # if the main process crashes, we should not cause things to hang
+            with clear_mpi_env_vars():
+                p.start()
+        for remote in self.work_remotes:
+            remote.close()
+
+        self.remotes[0].send(('get_env_info', None))
+        env_info = self.remotes[0].recv().x
+        self.handles = env_info['handles']
+        self.side_names = env_info['side_names']
+        VecEnv.__init__(self, num_envs, env_info['observation_spaces'], env_info['action_spaces'])
+        self.state_space = env_info['state_space']
+        obs_n_space = env_info['observation_spaces']  # [Box(dim_o), Box(dim_o), ...] ----> dict
+        self.agent_ids = env_info['agent_ids']
+        self.n_agents = env_info['n_agents']
+
+        self.keys, self.shapes, self.dtypes = obs_n_space_info(obs_n_space)
+        self.agent_keys = [[self.keys[k] for k in ids] for ids in self.agent_ids]
+        if isinstance(self.action_space[self.agent_keys[0][0]], Box):
+            self.act_dim = [self.action_space[keys[0]].shape[0] for keys in self.agent_keys]
+        else:
+            self.act_dim = [self.action_space[keys[0]].n for keys in self.agent_keys]
+        self.n_agent_all = len(self.keys)
+        self.obs_shapes = [self.shapes[self.agent_keys[h.value][0]] for h in self.handles]
+        self.obs_dtype = self.dtypes[self.keys[0]]
+
+        # shared arrays of all the envs, one for each group of agents
+        specs = {}
+        for h, n in enumerate(self.n_agents):
+            for prefix in ['obs', 'reset_obs']:
+                specs["%s_%d" % (prefix, h)] = ((n,) + self._group_obs_shape(h), self.obs_dtype)
+            specs["rews_%d" % h] = ((n, 1), np.float32)
+            specs["dones_%d" % h] = ((n,), bool)
+            specs["trunctions_%d" % h] = ((n,), bool)
+            specs["agent_mask_%d" % h] = ((n,), bool)
+        if self.state_space is not None:
+            specs['state'] = (self.state_space.shape, self.state_space.dtype)
+        self.shared_memories, self.buffers, shared_specs = [], {}, {}
+        for name, (shape, dtype) in specs.items():
+            shape = (self.num_envs,) + tuple(shape)
+            n_bytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            memory = shared_memory.SharedMemory(create=True, size=n_bytes)
+            self.shared_memories.append(memory)
+            self.buffers[name] = np.ndarray(shape, dtype, buffer=memory.buf)
+            shared_specs[name] = (memory.name, shape, np.dtype(dtype).str)
+        for i_remote, remote in enumerate(self.remotes):
+            remote.send(('set_shared_memory', (shared_specs, i_remote * in_series)))
+        for remote in self.remotes:
+            remote.recv()
+
+        self.buf_obs = self._get_groups('obs')
+        self.buf_infos_dict = [{} for _ in range(self.num_envs)]
+        self.max_episode_length = env_info['max_cycles']
+        self.actions = None
+
+    def _group_obs_shape(self, h):
+        return tuple(self.obs_shapes[h])
+
+    def _get_groups(self, prefix, e=None):
+        index = slice(None) if e is None else e
+        return [self.buffers["%s_%d" % (prefix, h)][index].copy() for h in range(len(self.n_agents))]
+
+    def reset(self):
+        self._assert_not_closed()
+        for remote in self.remotes:
+            remote.send(('reset', None))
+        self.buf_infos_dict = flatten_list([remote.recv() for remote in self.remotes])
+        self.buf_obs = self._get_groups('obs')
+        return self.buf_obs.copy(), self.buf_infos_dict.copy()
+
+    def step_async(self, actions):
+        self._assert_not_closed()
+        if self.waiting:
+            raise AlreadySteppingError
+        for i_remote, remote in enumerate(self.remotes):  # the actions are dicts of the agents
+            remote.send(('step', actions[i_remote * self.in_series: (i_remote + 1) * self.in_series]))
+        self.waiting = True
+
+    def step_wait(self):
+        self._assert_not_closed()
+        if not self.waiting:
+            raise NotSteppingError
+        results = [remote.recv() for remote in self.remotes]
+        if self.stats is not None:
+            results = self.stats.record_replies(results)
+        results = flatten_list(results)
+        self.waiting = False
+        self.buf_infos_dict = []
+        for e, (info, reset) in enumerate(results):
+            if reset:
+                info["reset_obs"] = self._get_groups('reset_obs', e)
+            self.buf_infos_dict.append(info)
+        self.buf_obs = self._get_groups('obs')
+        return self.buf_obs.copy(), self._get_groups('rews'), self._get_groups('dones'), \
+            self._get_groups('trunctions'), self.buf_infos_dict.copy()
+
+    def close_extras(self):
+        self.closed = True
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for p in self.ps:
+            p.join()
+        self.buffers.clear()  # release the views before closing the shared memory
+        for memory in self.shared_memories:
+            memory.close()
+            memory.unlink()
+
+    def render(self, mode=None):
+        self._assert_not_closed()
+        for pipe in self.remotes:
+            pipe.send(('render', mode))
+        imgs = [pipe.recv() for pipe in self.remotes]
+        imgs = flatten_list(imgs)
+        return imgs
+
+    def global_state(self):
+        if 'state' not in self.buffers:
+            return np.array([None for _ in range(self.num_envs)])
+        return self.buffers['state'].copy()
+
+    def global_state_one_env(self, e):
+        if 'state' not in self.buffers:
+            return None
+        return self.buffers['state'][e].copy()
+
+    def agent_mask(self):
+        return self._get_groups('agent_mask')
+
+    def available_actions(self):
+        act_mask = [np.ones([self.num_envs, n, self.act_dim[h]], dtype=bool) for h, n in enumerate(self.n_agents)]
+        return np.array(act_mask)
+
+    def enable_stats(self):
+        assert not self.waiting, "Enabling the statistics while stepping."
+        if self.stats is not None:
+            return
+        VecEnv.enable_stats(self, self.n_remotes)
+        for remote in self.remotes:
+            remote.send(('set_stats', True))
+        for remote in self.remotes:
+            remote.recv()
+
+    def _assert_not_closed(self):
+        assert not self.closed, "Trying to operate on a SubprocVecEnv_Pettingzoo after calling close()"
+
+    def __del__(self):
+        if not self.closed:
+            self.close()
@@ -1,8 +1,8 @@
 from xuanpolicy.common import combined_shape
 from gymnasium.spaces import Discrete, Box
 import numpy as np
-import multiprocessing as mp
-from xuanpolicy.environment.vector_envs.subproc_vec_env import clear_mpi_env_vars, flatten_list, CloudpickleWrapper
+from xuanpolicy.environment.vector_envs.subproc_vec_env import clear_mpi_env_vars, get_worker_context, flatten_list, \
+    CloudpickleWrapper
 from xuanpolicy.environment.vector_envs.vector_env import VecEnv
 
 
@@ -57,7 +57,7 @@ class SubprocVecEnv_StarCraft2(VecEnv):
         assert num_envs % in_series == 0, "Number of envs must be divisible by number of envs to run in series"
         self.n_remotes = num_envs // in_series
         env_fns = np.array_split(env_fns, self.n_remotes)
-        ctx = mp.get_context(context)
+        ctx = get_worker_context(context)
         self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.n_remotes)])
         self.ps = [ctx.Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
                    for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
@@ -184,7 +184,7 @@ class DummyVecEnv_StarCraft2(VecEnv):
         assert num_envs % in_series == 0, "Number of envs must be divisible by number of envs to run in series"
         self.n_remotes = num_envs // in_series
         env_fns = np.array_split(env_fns, self.n_remotes)
-        ctx = mp.get_context(context)
+        ctx = get_worker_context(context)
         self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.n_remotes)])
         self.ps = [ctx.Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
                    for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
@@ -31,6 +31,24 @@ def flatten_list(l):
     return [l__ for l_ in l for l__ in l_]
 
 
+# imported once by the forkserver, the workers forked from it skip the imports of xuanpolicy and the simulators
+WORKER_PRELOAD = ['xuanpolicy.environment']
+
+
+def get_worker_context(context='spawn'):
+    """
+    Returns the multiprocessing context to start the env workers, falls back to 'spawn' where context is unavailable.
+    With 'forkserver', WORKER_PRELOAD is imported once by the server and every worker is forked from it, so the
+    workers of the later vec envs, e.g. the test envs, start without importing the package again.
+    """
+    if context not in mp.get_all_start_methods():
+        context = 'spawn'
+    ctx = mp.get_context(context)
+    if context == 'forkserver':
+        ctx.set_forkserver_preload(WORKER_PRELOAD)
+    return ctx
+
+
 def flatten_obs(obs):
     assert isinstance(obs, (list, tuple))
     assert len(obs) > 0
@@ -110,7 +128,7 @@ class SubprocVecEnv(VecEnv):
         assert nenvs % in_series == 0, "Number of envs must be divisible by number of envs to run in series"
         self.nremotes = nenvs // in_series
         env_fns = np.array_split(env_fns, self.nremotes)
-        ctx = mp.get_context(context)
+        ctx = get_worker_context(context)
         self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(self.nremotes)])
         self.ps = [ctx.Process(target=worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)))
                    for (work_remote, remote, env_fn) in zip(self.work_remotes, self.remotes, env_fns)]
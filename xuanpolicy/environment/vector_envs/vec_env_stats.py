@@ -0,0 +1,134 @@
+import time
+import numpy as np
+
+LATENCY_BINS_MS = np.geomspace(0.01, 10000.0, 61)  # upper edges of the histogram bins, 10 bins per decade
+
+
+def finished_envs(num_envs, terminated, truncated):
+    """Whether each environment ends an episode, i.e. all of its agents are terminated or truncated."""
+    def all_agents(flags):
+        if isinstance(flags, list):  # the group-wise arrays of the multi-agent envs
+            return np.all([np.reshape(f, (num_envs, -1)).all(-1) for f in flags], axis=0)
+        return np.reshape(flags, (num_envs, -1)).all(-1)
+    return all_agents(terminated) | all_agents(truncated)
+
+
+class VecEnvStats(object):
+    """
+    Latency statistics of a vectorized environment, recorded after VecEnv.enable_stats().
+    The step latencies of each environment and each worker process are counted in histograms with log-spaced bins.
+    The IPC time of a step is the wall time of step_async() and step_wait() that is not spent by the slowest worker.
+        num_envs: number of the environments.
+        n_workers: number of the worker processes that report their latencies, 0 for the envs of the main process.
+    """
+    def __init__(self, num_envs, n_workers=0):
+        self.num_envs = num_envs
+        self.n_workers = n_workers
+        self.envs_per_worker = num_envs // n_workers if n_workers else 0
+        self.bin_edges = LATENCY_BINS_MS
+        self.step_start, self.wait_start, self.worker_step_ms = 0.0, 0.0, None
+        self.clear()
+
+    def clear(self):
+        n_bins = len(self.bin_edges) + 1
+        self.env_hist = np.zeros((self.num_envs, n_bins), np.int64)
+        self.env_ms = np.zeros(self.num_envs)
+        self.worker_hist = np.zeros((self.n_workers, n_bins), np.int64)
+        self.worker_ms = np.zeros(self.n_workers)
+        self.resets = np.zeros(self.num_envs, np.int64)
+        self.n_steps, self.step_ms, self.wait_ms, self.ipc_ms = 0, 0.0, 0.0, 0.0
+        self.n_resets, self.reset_ms = 0, 0.0
+
+    def _bins(self, ms):
+        return np.searchsorted(self.bin_edges, ms)
+
+    def record_env(self, e, ms):
+        self.env_hist[e, self._bins(ms)] += 1
+        self.env_ms[e] += ms
+
+    def record_replies(self, replies, worker_ids=None):
+        """
+        Record the latencies attached to the step replies of the workers and return the replies without them.
+            replies: (data, the step latency of each env, the latency of the worker) of each worker.
+            worker_ids: the workers of the replies, defaults to all of them in order.
+        """
+        worker_ids = np.arange(self.n_workers) if worker_ids is None else np.asarray(worker_ids)
+        data, env_ms, worker_ms = zip(*replies)
+        env_ids = (worker_ids[:, np.newaxis] * self.envs_per_worker + np.arange(len(env_ms[0]))).reshape(-1)
+        env_ms, worker_ms = np.array(env_ms).reshape(-1), np.array(worker_ms)
+        np.add.at(self.env_hist, (env_ids, self._bins(env_ms)), 1)
+        np.add.at(self.env_ms, env_ids, env_ms)
+        np.add.at(self.worker_hist, (worker_ids, self._bins(worker_ms)), 1)
+        np.add.at(self.worker_ms, worker_ids, worker_ms)
+        self.worker_step_ms = worker_ms.max()
+        return list(data)
+
+    def record_resets(self, env_ids, terminated, truncated):
+        self.resets[env_ids] += finished_envs(len(env_ids), terminated, truncated)
+
+    def timed_env(self, step_env):
+        """Wrap the step_env(e) of the envs in the main process to record the latency of each env."""
+        def _step_env(e):
+            start = time.perf_counter()
+            step_env(e)
+            self.record_env(e, (time.perf_counter() - start) * 1000)
+        return _step_env
+
+    def timed_step_async(self, step_async):
+        def _step_async(actions):
+            self.step_start = time.perf_counter()
+            step_async(actions)
+            self.wait_start = time.perf_counter()
+        return _step_async
+
+    def timed_step_wait(self, step_wait):
+        def _step_wait():
+            self.worker_step_ms = None
+            results = step_wait()
+            end = time.perf_counter()
+            step_ms = (end - self.step_start) * 1000
+            self.n_steps += 1
+            self.step_ms += step_ms
+            self.wait_ms += (end - self.wait_start) * 1000
+            if self.worker_step_ms is not None:
+                self.ipc_ms += max(step_ms - float(self.worker_step_ms), 0.0)
+            self.resets += finished_envs(self.num_envs, results[-3], results[-2])
+            return results
+        return _step_wait
+
+    def timed_reset(self, reset):
+        def _reset(*args, **kwargs):
+            start = time.perf_counter()
+            results = reset(*args, **kwargs)
+            self.n_resets += 1
+            self.reset_ms += (time.perf_counter() - start) * 1000
+            return results
+        return _reset
+
+    def _percentile(self, hist, q):
+        cumulative = np.cumsum(hist)
+        i_bin = np.searchsorted(cumulative, q * cumulative[-1])
+        return float(self.bin_edges[min(i_bin, len(self.bin_edges) - 1)])
+
+    def scalars(self, prefix="vec_env/"):
+        """The statistics as the scalars of log_infos, the per-env and per-worker means are dicts of scalars."""
+        scalars = {prefix + "resets": int(self.resets.sum())}
+        if self.n_steps:
+            scalars[prefix + "step_ms"] = self.step_ms / self.n_steps
+            scalars[prefix + "step_wait_ms"] = self.wait_ms / self.n_steps
+            if self.n_workers:
+                scalars[prefix + "ipc_ms"] = self.ipc_ms / self.n_steps
+        if self.n_resets:
+            scalars[prefix + "reset_ms"] = self.reset_ms / self.n_resets
+        for name, hist, total in [("env", self.env_hist, self.env_ms), ("worker", self.worker_hist, self.worker_ms)]:
+            counts = hist.sum(axis=1)
+            if counts.sum() == 0:
+                continue
+            hist_all = hist.sum(axis=0)
+            scalars[prefix + name + "_step_ms/mean"] = float(total.sum() / counts.sum())
+            scalars[prefix + name + "_step_ms/p50"] = self._percentile(hist_all, 0.5)
+            scalars[prefix + name + "_step_ms/p99"] = self._percentile(hist_all, 0.99)
+            scalars[prefix + name + "_step_ms/slowest"] = float(np.max(total / np.maximum(counts, 1)))
+            scalars[prefix + name + "_step_ms"] = {"%s_%d" % (name, i): float(total[i] / counts[i])
+                                                   for i in range(len(counts)) if counts[i]}
+        return scalars
@@ -1,6 +1,7 @@
 from abc import ABC, abstractmethod
 import numpy as np
 import cv2
+from xuanpolicy.environment.vector_envs.vec_env_stats import VecEnvStats
 
 
 # referenced from openai/baselines
@@ -45,6 +46,7 @@ class VecEnv(ABC):
         self.observation_space = observation_space
         self.action_space = action_space
         self.closed = False
+        self.stats = None  # VecEnvStats, recorded after enable_stats()
 
     @abstractmethod
     def reset(self):
@@ -93,6 +95,27 @@ class VecEnv(ABC):
         self.step_async(actions)
         return self.step_wait()
 
+    def enable_stats(self, n_workers=0):
+        """
+        Record the latencies of step_async(), step_wait() and reset() and the reset counts, read by get_stats().
+        The timed methods are set on the instance, so a vec env without the statistics runs the plain methods.
+            n_workers: number of the worker processes that attach their latencies to the step replies.
+        """
+        if self.stats is not None:
+            return
+        self.stats = VecEnvStats(self.num_envs, n_workers)
+        self.step_async = self.stats.timed_step_async(self.step_async)
+        self.step_wait = self.stats.timed_step_wait(self.step_wait)
+        self.reset = self.stats.timed_reset(self.reset)
+
+    def get_stats(self):
+        """Returns the statistics since the last call as a dict of scalars, empty if they are not enabled."""
+        if self.stats is None:
+            return {}
+        scalars = self.stats.scalars()
+        self.stats.clear()
+        return scalars
+
     def render(self, mode):
         raise NotImplementedError
 
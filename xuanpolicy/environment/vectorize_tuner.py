@@ -0,0 +1,141 @@
+import os
+import socket
+import time
+import yaml
+import numpy as np
+from copy import deepcopy
+from xuanpolicy.environment import make_envs
+
+# the vec envs with the same step interface, the configured vectorize only competes with its own family
+VECTORIZE_CANDIDATES = {
+    "Gym": ["Dummy_Gym", "Thread_Gym", "Subproc_Gym", "Shmem_Gym"],
+    "Atari": ["Dummy_Atari", "Thread_Atari", "Subproc_Atari", "Shmem_Atari"],
+    "Pettingzoo": ["Dummy_Pettingzoo", "Subproc_Pettingzoo"],
+    "MAgent": ["Dummy_MAgent", "Thread_MAgent", "Subproc_MAgent"],
+}
+# the members the agents and runners read from the vec envs besides reset() and step()
+AGENT_INTERFACE = {
+    "Gym": ["buf_obs", "max_episode_length"],
+    "Atari": ["buf_obs", "max_episode_length"],
+    "Pettingzoo": ["buf_obs", "max_episode_length", "global_state", "global_state_one_env", "agent_mask"],
+    "MAgent": ["buf_obs", "max_episode_length", "global_state", "global_state_one_env", "agent_mask"],
+}
+
+
+def candidate_settings(family, parallels, n_cpus):
+    """
+    The (vectorize, in_series, n_threads) settings to benchmark for parallels environments on n_cpus cores.
+    The Subproc and Shmem vec envs try every in_series split with at most one worker per core.
+    """
+    settings = []
+    for vectorize in VECTORIZE_CANDIDATES[family]:
+        if vectorize.startswith("Dummy"):
+            settings.append((vectorize, 1, 0))
+        elif vectorize.startswith("Thread"):
+            for n_threads in sorted({min(n_cpus, parallels), parallels}):
+                settings.append((vectorize, 1, n_threads))
+        else:
+            for in_series in range(1, parallels + 1):
+                if parallels % in_series == 0 and parallels // in_series <= n_cpus:
+                    settings.append((vectorize, in_series, 0))
+    return settings
+
+
+def random_actions(envs, family):
+    if family in ["Pettingzoo", "MAgent"]:  # a dict of the agents for each env
+        return [{k: envs.action_space[k].sample() for k in envs.keys} for _ in range(envs.num_envs)]
+    return np.array([envs.action_space.sample() for _ in range(envs.num_envs)])
+
+
+def check_agent_interface(envs, family, results=None):
+    """
+    Raises an AssertionError if envs lacks a member of AGENT_INTERFACE, or if results, the returns of a step,
+    miss info["reset_obs"] for a finished environment.
+    """
+    missing = [name for name in AGENT_INTERFACE[family] if not hasattr(envs, name)]
+    assert not missing, "%s has no %s for the agents" % (type(envs).__name__, ", ".join(missing))
+    if results is None:
+        return
+    _, _, terminated, truncated, infos = results
+    if family in ["Pettingzoo", "MAgent"]:  # an env is finished when all the agents of all the groups are
+        finished = np.all([t.all(axis=-1) for t in terminated], axis=0) | \
+                   np.all([t.all(axis=-1) for t in truncated], axis=0)
+    else:
+        finished = np.logical_or(terminated, truncated)
+    for e in np.where(finished)[0]:
+        assert "reset_obs" in infos[e], "%s returns no reset_obs for the finished envs" % type(envs).__name__
+
+
+def benchmark_vectorize(config, settings, family, n_steps):
+    """
+    Returns the environment steps per second of the vec envs made with settings, warm-up steps excluded.
+    The warm-up steps check the interface of the agents first, the vec envs that fail it raise an AssertionError.
+    """
+    config_bench = deepcopy(config)
+    config_bench.vectorize, config_bench.in_series, config_bench.n_threads = settings
+    config_bench.env_stats = False
+    envs = make_envs(config_bench)
+    try:
+        envs.reset()
+        check_agent_interface(envs, family)
+        actions = [random_actions(envs, family) for _ in range(8)]
+        for step in range(n_steps // 10 + 1):
+            check_agent_interface(envs, family, envs.step(actions[step % len(actions)]))
+        start = time.time()
+        for step in range(n_steps):
+            envs.step(actions[step % len(actions)])
+        return n_steps * envs.num_envs / (time.time() - start)
+    finally:
+        envs.close()
+
+
+def load_vectorize_cache(cache_file):
+    if not os.path.exists(cache_file):
+        return {}
+    with open(cache_file, "r") as f:
+        return yaml.load(f, Loader=yaml.FullLoader) or {}
+
+
+def tune_vectorize(config):
+    """
+    Returns a copy of config with the fastest vectorize, in_series and n_threads for config.env_id on this host.
+    The choice is cached in config.vectorize_cache for each (env_id, host) and benchmarked again only when the
+    parallels or the vec env family of the cached entry differ from config.
+    """
+    families = [family for family, candidates in VECTORIZE_CANDIDATES.items() if config.vectorize in candidates]
+    if not families:
+        print("Vectorize tuning: no candidates for %s, keep it." % config.vectorize)
+        return config
+    family = families[0]
+    host, n_cpus = socket.gethostname(), os.cpu_count() or 1
+    cache = load_vectorize_cache(config.vectorize_cache)
+    entry = cache.get(host, {}).get(config.env_id)
+    if (entry is None) or entry["parallels"] != config.parallels or \
+            entry["vectorize"] not in VECTORIZE_CANDIDATES[family]:
+        results = []
+        for settings in candidate_settings(family, config.parallels, n_cpus):
+            try:
+                steps_per_second = benchmark_vectorize(config, settings, family, config.vectorize_tuning_steps)
+            except Exception as error:
+                print("Vectorize tuning: %s failed, %s" % (settings[0], error))
+                continue
+            print("Vectorize tuning: %s, in_series=%d, n_threads=%d: %.1f steps/s" % (settings + (steps_per_second,)))
+            results.append((steps_per_second, settings))
+        if not results:
+            return config
+        steps_per_second, (vectorize, in_series, n_threads) = max(results, key=lambda result: result[0])
+        entry = {"parallels": config.parallels, "vectorize": vectorize, "in_series": in_series,
+                 "n_threads": n_threads, "steps_per_second": float(steps_per_second), "n_cpus": n_cpus}
+        cache = load_vectorize_cache(config.vectorize_cache)  # merge the entries of other runs
+        cache.setdefault(host, {})[config.env_id] = entry
+        cache_dir = os.path.dirname(config.vectorize_cache)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with open(config.vectorize_cache, "w") as f:
+            yaml.dump(cache, f)
+    print("Vectorize tuning: use %s, in_series=%d, n_threads=%d for %s." % (entry["vectorize"], entry["in_series"],
+                                                                         entry["n_threads"], config.env_id))
+    config_tuned = deepcopy(config)
+    config_tuned.vectorize, config_tuned.in_series = entry["vectorize"], entry["in_series"]
+    config_tuned.n_threads = entry["n_threads"]
+    return config_tuned
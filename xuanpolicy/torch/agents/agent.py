@@ -1,3 +1,4 @@
+import glob
 import socket
 import time
 from pathlib import Path
@@ -5,6 +6,9 @@ from xuanpolicy.torch.agents import *
 
 
 class Agent(ABC):
+    # the training progress saved with the checkpoints, to resume the schedules and the normalization
+    train_state_keys = ['current_step', 'current_episode', 'returns', 'egreedy', 'noise_scale', 'obs_rms', 'ret_rms']
+
     def __init__(self,
                  config: Namespace,
                  envs: DummyVecEnv_Gym,
@@ -18,6 +22,11 @@ class Agent(ABC):
         self.config = config
         self.envs = envs
         self.policy = policy
+        if config.compile_policy:
+            compile_policy(policy, config.compile_backend)
+        if config.use_prefetch:
+            assert isinstance(memory, DummyOffPolicyBuffer), "Prefetching only supports the uniform replay buffers."
+            memory = PrefetchSampler(memory, device, config.prefetch_size)
         self.memory = memory
         self.learner = learner
 
@@ -63,6 +72,7 @@ class Agent(ABC):
             self.use_wandb = True
         else:
             raise "No logger is implemented."
+        self.metrics = MetricsSink(None if self.use_wandb else self.writer, config.log_flush_interval)
 
         self.device = device
         self.log_dir = log_dir
@@ -71,36 +81,53 @@ class Agent(ABC):
         create_directory(log_dir)
         self.current_step = 0
         self.current_episode = np.zeros((self.envs.num_envs,), np.int32)
+        self.async_states = None  # the last observations and actions sent to an AsyncVecEnv_Gym
+        self.env_stats_step = 0  # the step of the next log of the vec env statistics
 
-    def save_model(self, model_name):
+    def save_model(self, model_name, save_buffer=False):
+        """save_buffer: also save the replay buffer (with config.save_buffer), for the checkpoints to resume from."""
         model_path = self.model_dir_save + "/" + model_name
         self.learner.save_model(model_path)
+        save_memory_state(os.path.join(self.model_dir_save, "train_state"),
+                          get_memory_state(self, self.train_state_keys))
+        if save_buffer and self.config.save_buffer:
+            self.memory.save(os.path.join(self.model_dir_save, "buffer"))
 
     def load_model(self, path, seed=1):
-        self.learner.load_model(path, seed)
+        path = self.learner.load_model(path, seed)
+        train_state_path = os.path.join(path, "train_state")
+        if os.path.exists(train_state_path):
+            set_memory_state(self, self.train_state_keys, load_memory_state(train_state_path))
+        buffer_path = os.path.join(path, "buffer")
+        if self.config.save_buffer and os.path.exists(buffer_path):
+            self.memory.load(buffer_path)
+
+    def resume(self, seed=1):
+        """
+        Load the latest checkpoint of the former runs with seed in model_dir_load, with its training state and
+        buffer, to continue the training. Returns False if there is none, then the training starts from scratch.
+        """
+        checkpoints = [path for path in glob.glob(os.path.join(self.model_dir_load, f"seed_{seed}_*", "*"))
+                       if os.path.isfile(path) and (not path.endswith(".npy")) and
+                       os.path.abspath(os.path.dirname(path)) != os.path.abspath(self.model_dir_save)]
+        if not checkpoints:
+            print("No checkpoint of seed %d in %s, train from scratch." % (seed, self.model_dir_load))
+            return False
+        self.load_model(os.path.dirname(max(checkpoints, key=os.path.getmtime)), seed)
+        return True
 
     def log_infos(self, info: dict, x_index: int):
         """
         info: (dict) information to be visualized
         n_steps: current step
         """
-        if self.use_wandb:
-            for k, v in info.items():
-                wandb.log({k: v}, step=x_index)
-        else:
-            for k, v in info.items():
-                try:
-                    self.writer.add_scalar(k, v, x_index)
-                except:
-                    self.writer.add_scalars(k, v, x_index)
+        if self.envs.stats is not None and x_index >= self.env_stats_step:  # the vec env statistics since the last log
+            info = dict(info, **self.envs.get_stats())
+            self.env_stats_step = x_index + self.config.env_stats_interval
+        self.metrics.log(info, x_index)
 
     def log_videos(self, info: dict, fps: int, x_index: int=0):
-        if self.use_wandb:
-            for k, v in info.items():
-                wandb.log({k: wandb.Video(v, fps=fps, format='gif')}, step=x_index)
-        else:
-            for k, v in info.items():
-                self.writer.add_video(k, v, fps=fps, global_step=x_index)
+        self.metrics.log_videos(info, fps, x_index)
 
     def _process_observation(self, observations):
         if self.use_obsnorm:
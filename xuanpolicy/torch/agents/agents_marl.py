@@ -5,6 +5,9 @@ from pathlib import Path
 
 
 class MARLAgents(object):
+    # the exploration schedules saved with the checkpoints, the missing attributes are skipped
+    train_state_keys = ['egreedy', 'epsilon_decay']
+
     def __init__(self,
                  config: Namespace,
                  envs: DummyVecEnv_Pettingzoo,
@@ -20,6 +23,7 @@ class MARLAgents(object):
         self.dim_obs = self.args.dim_obs
         self.dim_act = self.args.dim_act
         self.dim_id = self.n_agents
+        self.agent_ids = {}  # the one-hot IDs of the agents for each batch size
         self.device = torch.device("cuda" if (torch.cuda.is_available() and config.device in ["gpu", "cuda:0"]) else "cpu")
         self.envs = envs
         self.start_training = config.start_training
@@ -27,6 +31,8 @@ class MARLAgents(object):
         self.render = config.render
         self.nenvs = envs.num_envs
         self.policy = policy
+        if config.compile_policy:
+            compile_policy(policy, config.compile_backend)
         self.memory = memory
         self.learner = learner
         self.device = device
@@ -35,11 +41,35 @@ class MARLAgents(object):
         create_directory(log_dir)
         create_directory(model_dir)
 
-    def save_model(self, model_name):
+    def save_model(self, model_name, save_buffer=False):
+        """save_buffer: also save the replay buffer (with args.save_buffer), for the checkpoints to resume from."""
         self.learner.save_model(model_name)
+        save_memory_state(os.path.join(self.model_dir, "train_state"), get_memory_state(self, self.train_state_keys))
+        if save_buffer and self.args.save_buffer:
+            self.memory.save(os.path.join(self.model_dir, "buffer"))
 
     def load_model(self, path):
         self.learner.load_model(path)
+        train_state_path = os.path.join(path, "train_state")
+        if os.path.exists(train_state_path):
+            set_memory_state(self, self.train_state_keys, load_memory_state(train_state_path))
+        buffer_path = os.path.join(path, "buffer")
+        if self.args.save_buffer and os.path.exists(buffer_path):
+            self.memory.load(buffer_path)
+
+    def resume(self, path):
+        """Load the checkpoint in path to continue the training, returns False if there is none."""
+        if (not os.path.isdir(path)) or not any(os.path.isfile(os.path.join(path, f)) for f in os.listdir(path)):
+            print("No checkpoint in %s, train from scratch." % path)
+            return False
+        self.load_model(path)
+        return True
+
+    def get_agent_ids(self, batch_size):
+        if batch_size not in self.agent_ids:
+            agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1)
+            self.agent_ids[batch_size] = agents_id.to(self.device)
+        return self.agent_ids[batch_size]
 
     def act(self, **kwargs):
         raise NotImplementedError
@@ -67,6 +97,12 @@ class linear_decay_or_increase(object):
         else:
             self.epsilon = min(self.epsilon + self.delta, self.end)
 
+    def state_dict(self):
+        return {"epsilon": np.asarray(self.epsilon)}
+
+    def load_state_dict(self, state):
+        self.epsilon = float(state["epsilon"])
+
 
 class RandomAgents(object):
     def __init__(self, args, envs, device=None):
@@ -83,3 +119,6 @@ class RandomAgents(object):
 
     def load_model(self, model_dir):
         return
+
+    def resume(self, model_dir):
+        return False
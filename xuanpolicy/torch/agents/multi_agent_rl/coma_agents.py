@@ -65,21 +65,22 @@ class COMA_Agents(MARLAgents):
 
     def act(self, obs_n, episode, test_mode, noise=False):
         batch_size = len(obs_n)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        states, dists = self.policy(obs_n, agents_id)
-        # acts = dists.stochastic_sample()  # stochastic policy
+        agents_id = self.get_agent_ids(batch_size)
+
+        def sample(states, dists):
+            # acts = dists.stochastic_sample()  # stochastic policy
+            greedy_actions = dists.logits.argmax(dim=-1, keepdims=False)
+            return greedy_actions, self.learner.onehot_action(greedy_actions, self.dim_act)
+        greedy_actions, actions_onehot = self.policy.act_numpy(obs_n, agents_id, sample=sample)
         epsilon = 1.0 if test_mode else self.epsilon_decay.epsilon
-        greedy_actions = dists.logits.argmax(dim=-1, keepdims=False)
         if noise:
             random_variable = np.random.random(greedy_actions.shape)
             action_pick = np.int32((random_variable < epsilon))
             random_actions = np.array([[self.args.action_space[agent].sample() for agent in self.agent_keys]])
-            actions_select = action_pick * greedy_actions.cpu().numpy() + (1 - action_pick) * random_actions
-            actions_onehot = self.learner.onehot_action(torch.Tensor(actions_select), self.dim_act)
-            return actions_select, actions_onehot.detach().cpu().numpy()
+            actions_select = action_pick * greedy_actions + (1 - action_pick) * random_actions
+            return actions_select, np.eye(self.dim_act, dtype=np.int64)[actions_select.astype(np.int64)]
         else:
-            actions_onehot = self.learner.onehot_action(greedy_actions, self.dim_act)
-            return greedy_actions.detach().cpu().numpy(), actions_onehot.detach().cpu().numpy()
+            return greedy_actions, actions_onehot
 
     def train(self, i_episode):
         self.epsilon_decay.update()
@@ -62,7 +62,9 @@ class DCG_Agents(MARLAgents):
         buffer = MARL_OffPolicyBuffer_RNN if self.use_recurrent else MARL_OffPolicyBuffer
         input_buffer = (config.n_agents, state_shape, config.obs_shape, config.act_shape, config.rew_shape,
                         config.done_shape, envs.num_envs, config.buffer_size, config.batch_size)
-        memory = buffer(*input_buffer, max_episode_length=envs.max_episode_length, dim_act=config.dim_act)
+        memory = buffer(*input_buffer, max_episode_length=envs.max_episode_length, dim_act=config.dim_act,
+                        storage=config.buffer_storage, storage_dir=config.buffer_dir,
+                        packed=config.rnn_buffer_packed, packed_steps=config.rnn_buffer_steps)
 
         from xuanpolicy.torch.learners.multi_agent_rl.dcg_learner import DCG_Learner
         learner = DCG_Learner(config, policy, optimizer, scheduler,
@@ -41,7 +41,9 @@ class IQL_Agents(MARLAgents):
         buffer = MARL_OffPolicyBuffer_RNN if self.use_recurrent else MARL_OffPolicyBuffer
         input_buffer = (config.n_agents, state_shape, config.obs_shape, config.act_shape, config.rew_shape,
                         config.done_shape, envs.num_envs, config.buffer_size, config.batch_size)
-        memory = buffer(*input_buffer, max_episode_length=envs.max_episode_length, dim_act=config.dim_act)
+        memory = buffer(*input_buffer, max_episode_length=envs.max_episode_length, dim_act=config.dim_act,
+                        storage=config.buffer_storage, storage_dir=config.buffer_dir,
+                        packed=config.rnn_buffer_packed, packed_steps=config.rnn_buffer_steps)
 
         learner = IQL_Learner(config, policy, optimizer, scheduler, config.device, config.model_dir, config.gamma,
                               config.sync_frequency)
@@ -50,18 +52,23 @@ class IQL_Agents(MARLAgents):
 
     def act(self, obs_n, *rnn_hidden, avail_actions=None, test_mode=False):
         batch_size = obs_n.shape[0]
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        obs_in = torch.Tensor(obs_n).view([batch_size, self.n_agents, -1]).to(self.device)
+        agents_id = self.get_agent_ids(batch_size)
+        obs_in = torch.as_tensor(obs_n, dtype=torch.float32, device=self.device)
+        obs_in = obs_in.reshape([batch_size, self.n_agents, -1])
+
+        def sample(hidden_state, greedy_actions, evalQ):
+            return hidden_state, greedy_actions
         if self.use_recurrent:
             batch_agents = batch_size * self.n_agents
-            hidden_state, greedy_actions, _ = self.policy(obs_in.view(batch_agents, 1, -1),
-                                                          agents_id.view(batch_agents, 1, -1),
-                                                          *rnn_hidden,
-                                                          avail_actions=avail_actions.reshape(batch_agents, 1, -1))
-            greedy_actions = greedy_actions.view(batch_size, self.n_agents)
+            avail_in = avail_actions.reshape(batch_agents, 1, -1)
+            hidden_state, greedy_actions = self.policy.act_numpy(obs_in.view(batch_agents, 1, -1),
+                                                                 agents_id.reshape(batch_agents, 1, -1),
+                                                                 *rnn_hidden, avail_actions=avail_in,
+                                                                 sample=sample)
+            greedy_actions = greedy_actions.reshape(batch_size, self.n_agents)
         else:
-            hidden_state, greedy_actions, _ = self.policy(obs_in, agents_id, avail_actions=avail_actions)
-        greedy_actions = greedy_actions.cpu().detach().numpy()
+            hidden_state, greedy_actions = self.policy.act_numpy(obs_in, agents_id, avail_actions=avail_actions,
+                                                                 sample=sample)
 
         if test_mode:
             return hidden_state, greedy_actions
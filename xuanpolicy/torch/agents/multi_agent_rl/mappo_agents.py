@@ -59,26 +59,30 @@ class MAPPO_Agents(MARLAgents):
 
     def act(self, obs_n, *rnn_hidden, avail_actions=None, state=None, test_mode=False):
         batch_size = len(obs_n)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        obs_in = torch.Tensor(obs_n).view([batch_size, self.n_agents, -1]).to(self.device)
+        agents_id = self.get_agent_ids(batch_size)
+        obs_in = torch.as_tensor(obs_n, dtype=torch.float32, device=self.device)
+        obs_in = obs_in.reshape([batch_size, self.n_agents, -1])
+
+        def sample(hidden_state, dists):
+            actions = dists.stochastic_sample()
+            return hidden_state, actions, dists.log_prob(actions)
         if self.use_recurrent:
             batch_agents = batch_size * self.n_agents
-            hidden_state, dists = self.policy(obs_in.view(batch_agents, 1, -1),
-                                              agents_id.view(batch_agents, 1, -1),
-                                              *rnn_hidden,
-                                              avail_actions=avail_actions.reshape(batch_agents, 1, -1))
-            actions = dists.stochastic_sample()
-            log_pi_a = dists.log_prob(actions).reshape(batch_size, self.n_agents)
+            avail_in = avail_actions.reshape(batch_agents, 1, -1)
+            hidden_state, actions, log_pi_a = self.policy.act_numpy(obs_in.view(batch_agents, 1, -1),
+                                                                    agents_id.reshape(batch_agents, 1, -1),
+                                                                    *rnn_hidden, avail_actions=avail_in,
+                                                                    sample=sample)
+            log_pi_a = log_pi_a.reshape(batch_size, self.n_agents)
             actions = actions.reshape(batch_size, self.n_agents)
         else:
-            hidden_state, dists = self.policy(obs_in, agents_id, avail_actions=avail_actions)
-            actions = dists.stochastic_sample()
-            log_pi_a = dists.log_prob(actions)
-        return hidden_state, actions.detach().cpu().numpy(), log_pi_a.detach().cpu().numpy()
+            hidden_state, actions, log_pi_a = self.policy.act_numpy(obs_in, agents_id, avail_actions=avail_actions,
+                                                                    sample=sample)
+        return hidden_state, actions, log_pi_a
 
     def values(self, obs_n, *rnn_hidden, state=None):
         batch_size = len(obs_n)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
+        agents_id = self.get_agent_ids(batch_size)
         # build critic input
         if self.use_global_state:
             state = torch.Tensor(state).unsqueeze(1).to(self.device)
@@ -87,14 +91,14 @@ class MAPPO_Agents(MARLAgents):
             critic_in = torch.Tensor(obs_n).view([batch_size, 1, -1]).to(self.device)
             critic_in = critic_in.expand(-1, self.n_agents, -1)
         if self.use_recurrent:
-            hidden_state, values_n = self.policy.get_values(critic_in.unsqueeze(2),  # add a sequence length axis.
-                                                            agents_id.unsqueeze(2),
-                                                            *rnn_hidden)
-            values_n = values_n.squeeze(2)
+            hidden_state, values_n = self.policy.act_numpy(critic_in.unsqueeze(2),  # add a sequence length axis.
+                                                           agents_id.unsqueeze(2),
+                                                           *rnn_hidden, method=self.policy.get_values,
+                                                           sample=lambda states, values: (states, values.squeeze(2)))
         else:
-            hidden_state, values_n = self.policy.get_values(critic_in, agents_id)
+            hidden_state, values_n = self.policy.act_numpy(critic_in, agents_id, method=self.policy.get_values)
 
-        return hidden_state, values_n.detach().cpu().numpy()
+        return hidden_state, values_n
 
     def train(self, i_step):
         if self.memory.full:
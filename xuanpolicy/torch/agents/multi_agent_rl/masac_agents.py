@@ -40,7 +40,9 @@ class MASAC_Agents(MARLAgents):
                                       config.done_shape,
                                       envs.num_envs,
                                       config.buffer_size,
-                                      config.batch_size)
+                                      config.batch_size,
+                                      storage=config.buffer_storage,
+                                      storage_dir=config.buffer_dir)
         learner = MASAC_Learner(config, policy, optimizer, scheduler,
                                 config.device, config.model_dir, config.gamma)
         super(MASAC_Agents, self).__init__(config, envs, policy, memory, learner, device,
@@ -49,10 +51,8 @@ class MASAC_Agents(MARLAgents):
 
     def act(self, obs_n, test_mode):
         batch_size = len(obs_n)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        _, dists = self.policy(obs_n, agents_id)
-        acts = dists.rsample()
-        actions = acts.cpu().detach().numpy()
+        agents_id = self.get_agent_ids(batch_size)
+        actions = self.policy.act_numpy(obs_n, agents_id, sample=lambda outputs, dists: dists.rsample())
         actions = np.clip(actions, self.actions_low, self.actions_high)
         return None, actions
 
@@ -48,28 +48,28 @@ class MFAC_Agents(MARLAgents):
 
     def act(self, obs_n, episode, test_mode, act_mean=None, agent_mask=None, noise=False):
         batch_size = len(obs_n)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        obs_n = torch.Tensor(obs_n).to(self.device)
-
-        _, dists = self.policy(obs_n, agents_id)
-        acts = dists.stochastic_sample()
-
+        agents_id = self.get_agent_ids(batch_size)
         n_alive = torch.Tensor(agent_mask).sum(dim=-1).unsqueeze(-1).repeat(1, self.dim_act).to(self.device)
         action_n_mask = torch.Tensor(agent_mask).unsqueeze(-1).repeat(1, 1, self.dim_act).to(self.device)
-        act_neighbor_onehot = self.learner.onehot_action(acts, self.dim_act) * action_n_mask
-        act_mean_current = act_neighbor_onehot.float().sum(dim=1) / n_alive
-        act_mean_current = act_mean_current.cpu().detach().numpy()
 
-        return acts.detach().cpu().numpy(), act_mean_current
+        def sample(outputs, dists):
+            acts = dists.stochastic_sample()
+            act_neighbor_onehot = self.learner.onehot_action(acts, self.dim_act) * action_n_mask
+            return acts, act_neighbor_onehot.float().sum(dim=1) / n_alive
+        acts, act_mean_current = self.policy.act_numpy(obs_n, agents_id, sample=sample)
+        return acts, act_mean_current
 
     def value(self, obs, state):
         batch_size = len(state)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        repre_out = self.policy.representation(obs)
-        critic_input = torch.concat([torch.Tensor(repre_out['state']), agents_id], dim=-1)
-        values_n = self.policy.critic(critic_input)
-        values = self.policy.value_tot(values_n, global_state=state).view(-1, 1).repeat(1, self.n_agents).unsqueeze(-1)
-        return values.detach().cpu().numpy()
+        agents_id = self.get_agent_ids(batch_size)
+
+        def get_values(obs, state):
+            repre_out = self.policy.representation(obs)
+            critic_input = torch.concat([repre_out['state'], agents_id], dim=-1)
+            values_n = self.policy.critic(critic_input)
+            values = self.policy.value_tot(values_n, global_state=state).view(-1, 1)
+            return values.repeat(1, self.n_agents).unsqueeze(-1)
+        return self.policy.act_numpy(obs, state, method=get_values)
 
     def train(self, i_episode):
         if self.memory.full:
@@ -49,21 +49,22 @@ class MFQ_Agents(MARLAgents):
 
     def act(self, obs_n, *rnn_hidden, test_mode=False, act_mean=None, agent_mask=None):
         batch_size = obs_n.shape[0]
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        obs_in = torch.Tensor(obs_n).to(self.device)
+        agents_id = self.get_agent_ids(batch_size)
+        obs_in = torch.as_tensor(obs_n, dtype=torch.float32, device=self.device)
         act_mean = torch.Tensor(act_mean).unsqueeze(dim=-2).repeat(1, self.n_agents, 1).to(self.device)
+        n_alive = torch.Tensor(agent_mask).sum(dim=-1).unsqueeze(-1).repeat(1, self.dim_act).to(self.device)
+        action_n_mask = torch.Tensor(agent_mask).unsqueeze(-1).repeat(1, 1, self.dim_act).to(self.device)
 
+        def sample(hidden_state, greedy_actions, q_output):
+            act_neighbor_sample = self.policy.sample_actions(logits=q_output).to(self.device)
+            act_neighbor_onehot = self.learner.onehot_action(act_neighbor_sample, self.dim_act) * action_n_mask
+            return hidden_state, greedy_actions, act_neighbor_onehot.float().sum(dim=1) / n_alive
         if self.use_recurrent:
-            hidden_state, greedy_actions, q_output = self.policy(obs_in, act_mean, agents_id, *rnn_hidden)
+            hidden_state, greedy_actions, act_mean_current = self.policy.act_numpy(obs_in, act_mean, agents_id,
+                                                                                   *rnn_hidden, sample=sample)
         else:
-            hidden_state, greedy_actions, q_output = self.policy(obs_in, act_mean, agents_id)
-        n_alive = torch.Tensor(agent_mask).sum(dim=-1).unsqueeze(-1).repeat(1, self.dim_act).to(self.device)
-        action_n_mask = torch.Tensor(agent_mask).unsqueeze(-1).repeat(1, 1, self.dim_act).to(self.device)
-        act_neighbor_sample = self.policy.sample_actions(logits=q_output).to(self.device)
-        act_neighbor_onehot = self.learner.onehot_action(act_neighbor_sample, self.dim_act) * action_n_mask
-        act_mean_current = act_neighbor_onehot.float().sum(dim=1) / n_alive
-        act_mean_current = act_mean_current.cpu().detach().numpy()
-        greedy_actions = greedy_actions.cpu().detach().numpy()
+            hidden_state, greedy_actions, act_mean_current = self.policy.act_numpy(obs_in, act_mean, agents_id,
+                                                                                   sample=sample)
         if test_mode:
             return hidden_state, greedy_actions, act_mean_current
         else:
@@ -48,23 +48,28 @@ class VDAC_Agents(MARLAgents):
 
     def act(self, obs_n, episode, test_mode, state=None, noise=False):
         batch_size = len(obs_n)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        states, dists, vs = self.policy(obs_n, agents_id)
-        if self.args.mixer == "VDN":
-            vs_tot = self.policy.value_tot(vs).repeat(1, self.n_agents).unsqueeze(-1)
-        else:
-            vs_tot = self.policy.value_tot(vs, state).repeat(1, self.n_agents).unsqueeze(-1)
-        acts = dists.stochastic_sample()
-        return acts.detach().cpu().numpy(), vs_tot.detach().cpu().numpy()
+        agents_id = self.get_agent_ids(batch_size)
+
+        def sample(states, dists, vs):
+            if self.args.mixer == "VDN":
+                vs_tot = self.policy.value_tot(vs).repeat(1, self.n_agents).unsqueeze(-1)
+            else:
+                vs_tot = self.policy.value_tot(vs, state).repeat(1, self.n_agents).unsqueeze(-1)
+            return dists.stochastic_sample(), vs_tot
+        acts, vs_tot = self.policy.act_numpy(obs_n, agents_id, sample=sample)
+        return acts, vs_tot
 
     def value(self, obs, state):
         batch_size = len(state)
-        agents_id = torch.eye(self.n_agents).unsqueeze(0).expand(batch_size, -1, -1).to(self.device)
-        repre_out = self.policy.representation(obs)
-        critic_input = torch.concat([torch.Tensor(repre_out['state']), agents_id], dim=-1)
-        values_n = self.policy.critic(critic_input)
-        values = self.policy.value_tot(values_n, global_state=state).view(-1, 1).repeat(1, self.n_agents).unsqueeze(-1)
-        return values.detach().cpu().numpy()
+        agents_id = self.get_agent_ids(batch_size)
+
+        def get_values(obs, state):
+            repre_out = self.policy.representation(obs)
+            critic_input = torch.concat([repre_out['state'], agents_id], dim=-1)
+            values_n = self.policy.critic(critic_input)
+            values = self.policy.value_tot(values_n, global_state=state).view(-1, 1)
+            return values.repeat(1, self.n_agents).unsqueeze(-1)
+        return self.policy.act_numpy(obs, state, method=get_values)
 
     def train(self, i_episode):
         if self.memory.full:
@@ -48,10 +48,7 @@ class A2C_Agent(Agent):
         super(A2C_Agent, self).__init__(config, envs, policy, memory, learner, device, config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, dists, vs = self.policy(obs)
-        acts = dists.stochastic_sample()
-        acts = acts.detach().cpu().numpy()
-        vs = vs.detach().cpu().numpy()
+        acts, vs = self.policy.act_numpy(obs, sample=lambda outputs, dists, vs: (dists.stochastic_sample(), vs))
         return acts, vs
 
     def train(self, train_steps):
@@ -65,11 +62,7 @@ class A2C_Agent(Agent):
             self.memory.store(obs, acts, self._process_reward(rewards), vals, terminals)
             if self.memory.full:
                 _, vals = self._action(self._process_observation(next_obs))
-                for i in range(self.n_envs):
-                    if terminals[i]:
-                        self.memory.finish_path(0.0, i)
-                    else:
-                        self.memory.finish_path(vals[i], i)
+                self.memory.finish_all_paths(vals, terminals)
                 indexes = np.arange(self.buffer_size)
                 for _ in range(self.n_epoch):
                     np.random.shuffle(indexes)
@@ -83,6 +76,12 @@ class A2C_Agent(Agent):
 
             self.returns = self.gamma * self.returns + rewards
             obs = next_obs
+            paths_end = np.logical_or(terminals, trunctions)
+            if self.atari:
+                paths_end = np.logical_and(paths_end, trunctions)  # a lost life does not end the path
+            if paths_end.any():
+                _, vals = self._action(self._process_observation(next_obs))
+                self.memory.finish_all_paths(vals, terminals, paths_end)
             for i in range(self.n_envs):
                 if terminals[i] or trunctions[i]:
                     self.ret_rms.update(self.returns[i:i + 1])
@@ -91,11 +90,6 @@ class A2C_Agent(Agent):
                         pass
                     else:
                         obs[i] = infos[i]["reset_obs"]
-                        if terminals[i]:
-                            self.memory.finish_path(0, i)
-                        else:
-                            _, vals = self._action(self._process_observation(next_obs))
-                            self.memory.finish_path(vals[i], i)
                         self.current_episode[i] += 1
                         if self.use_wandb:
                             step_info["Episode-Steps/env-%d" % i] = infos[i]["episode_step"]
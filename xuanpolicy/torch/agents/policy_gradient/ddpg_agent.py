@@ -29,7 +29,9 @@ class DDPG_Agent(Agent):
                                       self.auxiliary_info_shape,
                                       self.n_envs,
                                       config.n_size,
-                                      config.batch_size)
+                                      config.batch_size,
+                                      storage=config.buffer_storage,
+                                      storage_dir=config.buffer_dir)
         learner = DDPG_Learner(policy,
                                optimizer,
                                scheduler,
@@ -41,8 +43,7 @@ class DDPG_Agent(Agent):
                                          config.log_dir, config.model_dir)
 
     def _action(self, obs, noise_scale=0.0):
-        _, action = self.policy(obs)
-        action = action.detach().cpu().numpy()
+        action = self.policy.act_numpy(obs, sample=lambda outputs, action: action)
         action = action + np.random.normal(size=action.shape) * noise_scale
         return np.clip(action, -1, 1)
 
@@ -45,9 +45,7 @@ class PG_Agent(Agent):
         super(PG_Agent, self).__init__(config, envs, policy, memory, learner, device, config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, dists = self.policy(obs)
-        acts = dists.stochastic_sample()
-        acts = acts.detach().cpu().numpy()
+        acts = self.policy.act_numpy(obs, sample=lambda outputs, dists: dists.stochastic_sample())
         return acts
 
     def train(self, train_steps):
@@ -60,8 +58,7 @@ class PG_Agent(Agent):
             next_obs, rewards, terminals, trunctions, infos = self.envs.step(acts)
             self.memory.store(obs, acts, self._process_reward(rewards), 0, terminals)
             if self.memory.full:
-                for i in range(self.n_envs):
-                    self.memory.finish_path(self._process_reward(rewards)[i], i)
+                self.memory.finish_all_paths(self._process_reward(rewards), terminals)
                 indexes = np.arange(self.buffer_size)
                 for _ in range(self.n_epoch):
                     np.random.shuffle(indexes)
@@ -75,6 +72,11 @@ class PG_Agent(Agent):
 
             self.returns = self.gamma * self.returns + rewards
             obs = next_obs
+            paths_end = np.logical_or(terminals, trunctions)
+            if self.atari:
+                paths_end = np.logical_and(paths_end, trunctions)  # a lost life does not end the path
+            if paths_end.any():
+                self.memory.finish_all_paths(np.zeros(self.n_envs), terminals, paths_end)
             for i in range(self.n_envs):
                 if terminals[i] or trunctions[i]:
                     self.ret_rms.update(self.returns[i:i + 1])
@@ -83,7 +85,6 @@ class PG_Agent(Agent):
                         pass
                     else:
                         obs[i] = infos[i]["reset_obs"]
-                        self.memory.finish_path(0, i)
                         self.current_episode[i] += 1
                         if self.use_wandb:
                             step_info["Episode-Steps/env-%d" % i] = infos[i]["episode_step"]
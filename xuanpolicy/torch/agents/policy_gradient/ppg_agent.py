@@ -47,10 +47,10 @@ class PPG_Agent(Agent):
         super(PPG_Agent, self).__init__(config, envs, policy, memory, learner, device, config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, dists, vs, _ = self.policy(obs)
-        acts = dists.stochastic_sample()
-        vs = vs.detach().cpu().numpy()
-        acts = acts.detach().cpu().numpy()
+        def sample(outputs, dists, vs, aux_vs):
+            return dists.stochastic_sample(), vs, dists
+        # the distributions are kept for the KL penalty of the updates, so they are not built in inference mode
+        acts, vs, dists = self.policy.act_numpy(obs, sample=sample, inference_mode=False)
         return acts, vs, split_distributions(dists)
 
     def train(self, train_steps):
@@ -65,8 +65,7 @@ class PPG_Agent(Agent):
             self.memory.store(obs, acts, self._process_reward(rewards), rets, terminals, {"old_dist": dists})
             if self.memory.full:
                 _, vals, _ = self._action(self._process_observation(next_obs))
-                for i in range(self.n_envs):
-                    self.memory.finish_path(vals[i], i)
+                self.memory.finish_all_paths(vals, terminals)
                 # policy update
                 indexes = np.arange(self.buffer_size)
                 for _ in range(self.policy_nepoch):
@@ -104,10 +103,12 @@ class PPG_Agent(Agent):
                 self.memory.clear()
 
             obs = next_obs
+            paths_end = np.logical_or(terminals, trunctions)
+            if paths_end.any():
+                self.memory.finish_all_paths(np.zeros(self.n_envs), terminals, paths_end)
             for i in range(self.n_envs):
                 if terminals[i] or trunctions[i]:
                     obs[i] = infos[i]["reset_obs"]
-                    self.memory.finish_path(0, i)
                     self.current_episode[i] += 1
                     if self.use_wandb:
                         step_info["Episode-Steps/env-%d" % i] = infos[i]["episode_step"]
@@ -50,12 +50,10 @@ class PPOCLIP_Agent(Agent):
                                             config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, dists, vs = self.policy(obs)
-        acts = dists.stochastic_sample()
-        logps = dists.log_prob(acts)
-        vs = vs.detach().cpu().numpy()
-        acts = acts.detach().cpu().numpy()
-        logps = logps.detach().cpu().numpy()
+        def sample(outputs, dists, vs):
+            acts = dists.stochastic_sample()
+            return acts, vs, dists.log_prob(acts)
+        acts, vs, logps = self.policy.act_numpy(obs, sample=sample)
         return acts, vs, logps
 
     def train(self, train_steps):
@@ -70,24 +68,32 @@ class PPOCLIP_Agent(Agent):
             self.memory.store(obs, acts, self._process_reward(rewards), value, terminals, {"old_logp": logps})
             if self.memory.full:
                 _, vals, _ = self._action(self._process_observation(next_obs))
-                for i in range(self.n_envs):
-                    if terminals[i]:
-                        self.memory.finish_path(0.0, i)
-                    else:
-                        self.memory.finish_path(vals[i], i)
+                self.memory.finish_all_paths(vals, terminals)
+                # copy the rollout to the device once, the minibatches are indexed on the device.
+                obs_all, act_all, ret_all, value_all, adv_all, aux_all = self.memory.get_rollout()
+                rollout = self.learner.load_rollout(obs_all, act_all, ret_all, value_all, adv_all, aux_all['old_logp'])
                 indexes = np.arange(self.buffer_size)
                 for _ in range(self.n_epoch):
                     np.random.shuffle(indexes)
                     for start in range(0, self.buffer_size, self.batch_size):
                         end = start + self.batch_size
-                        sample_idx = indexes[start:end]
-                        obs_batch, act_batch, ret_batch, value_batch, adv_batch, aux_batch = self.memory.sample(sample_idx)
-                        step_info = self.learner.update(obs_batch, act_batch, ret_batch, value_batch, adv_batch, aux_batch['old_logp'])
+                        sample_idx = torch.as_tensor(indexes[start:end], device=self.device)
+                        obs_batch, act_batch, ret_batch, value_batch, adv_batch, logp_batch = [
+                            data[sample_idx] for data in rollout]
+                        if self.memory.use_advnorm:
+                            adv_batch = (adv_batch - adv_batch.mean()) / (adv_batch.std(unbiased=False) + 1e-8)
+                        step_info = self.learner.update(obs_batch, act_batch, ret_batch, value_batch, adv_batch, logp_batch)
                 self.log_infos(step_info, self.current_step)
                 self.memory.clear()
 
             self.returns = (1 - terminals) * self.gamma * self.returns + rewards
             obs = next_obs
+            paths_end = np.logical_or(terminals, trunctions)
+            if self.atari:
+                paths_end = np.logical_and(paths_end, trunctions)  # a lost life does not end the path
+            if paths_end.any():
+                _, vals, _ = self._action(self._process_observation(next_obs))
+                self.memory.finish_all_paths(vals, terminals, paths_end)
             for i in range(self.n_envs):
                 if terminals[i] or trunctions[i]:
                     self.ret_rms.update(self.returns[i:i + 1])
@@ -95,11 +101,6 @@ class PPOCLIP_Agent(Agent):
                     if self.atari and (~trunctions[i]):
                         pass
                     else:
-                        if terminals[i]:
-                            self.memory.finish_path(0.0, i)
-                        else:
-                            _, vals, _ = self._action(self._process_observation(next_obs))
-                            self.memory.finish_path(vals[i], i)
                         obs[i] = infos[i]["reset_obs"]
                         self.current_episode[i] += 1
                         if self.use_wandb:
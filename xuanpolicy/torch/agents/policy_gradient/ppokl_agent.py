@@ -47,10 +47,10 @@ class PPOKL_Agent(Agent):
                                           config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, dists, vs = self.policy(obs)
-        acts = dists.stochastic_sample()
-        vs = vs.detach().cpu().numpy()
-        acts = acts.detach().cpu().numpy()
+        def sample(outputs, dists, vs):
+            return dists.stochastic_sample(), vs, dists
+        # the distributions are kept for the KL penalty of the updates, so they are not built in inference mode
+        acts, vs, dists = self.policy.act_numpy(obs, sample=sample, inference_mode=False)
         return acts, vs, split_distributions(dists)
 
     def train(self, train_steps):
@@ -65,11 +65,7 @@ class PPOKL_Agent(Agent):
             self.memory.store(obs, acts, self._process_reward(rewards), values, terminals, {"old_dist": dists})
             if self.memory.full:
                 _, vals, _ = self._action(self._process_observation(next_obs))
-                for i in range(self.n_envs):
-                    if terminals[i]:
-                        self.memory.finish_path(0.0, i)
-                    else:
-                        self.memory.finish_path(vals[i], i)
+                self.memory.finish_all_paths(vals, terminals)
                 indexes = np.arange(self.buffer_size)
                 for _ in range(self.n_epoch):
                     np.random.shuffle(indexes)
@@ -85,6 +81,12 @@ class PPOKL_Agent(Agent):
 
             self.returns = (1 - terminals) * self.gamma * self.returns + rewards
             obs = next_obs
+            paths_end = np.logical_or(terminals, trunctions)
+            if self.atari:
+                paths_end = np.logical_and(paths_end, trunctions)  # a lost life does not end the path
+            if paths_end.any():
+                _, vals, _ = self._action(self._process_observation(next_obs))
+                self.memory.finish_all_paths(vals, terminals, paths_end)
             for i in range(self.n_envs):
                 if terminals[i] or trunctions[i]:
                     self.ret_rms.update(self.returns[i:i + 1])
@@ -92,11 +94,6 @@ class PPOKL_Agent(Agent):
                     if self.atari and (~trunctions[i]):
                         pass
                     else:
-                        if terminals[i]:
-                            self.memory.finish_path(0.0, i)
-                        else:
-                            _, vals, _ = self._action(self._process_observation(next_obs))
-                            self.memory.finish_path(vals[i], i)
                         obs[i] = infos[i]["reset_obs"]
                         self.current_episode[i] += 1
                         if self.use_wandb:
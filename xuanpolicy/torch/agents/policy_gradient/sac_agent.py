@@ -10,7 +10,8 @@ class SAC_Agent(Agent):
                  scheduler: Optional[Sequence[torch.optim.lr_scheduler._LRScheduler]] = None,
                  device: Optional[Union[int, str, torch.device]] = None):
         self.render = config.render
-        self.n_envs = envs.num_envs
+        # with an AsyncVecEnv_Gym, the slots of the partial batches are the envs of the replay buffer
+        self.n_envs = envs.batch_size if isinstance(envs, AsyncVecEnv_Gym) else envs.num_envs
 
         self.gamma = config.gamma
         self.train_frequency = config.training_frequency
@@ -28,7 +29,9 @@ class SAC_Agent(Agent):
                                       self.auxiliary_info_shape,
                                       self.n_envs,
                                       config.n_size,
-                                      config.batch_size)
+                                      config.batch_size,
+                                      storage=config.buffer_storage,
+                                      storage_dir=config.buffer_dir)
         learner = SAC_Learner(policy,
                               optimizer,
                               scheduler,
@@ -39,9 +42,7 @@ class SAC_Agent(Agent):
         super(SAC_Agent, self).__init__(config, envs, policy, memory, learner, device, config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, act_dist = self.policy(obs)
-        action = act_dist.sample()
-        action = action.detach().cpu().numpy()
+        action = self.policy.act_numpy(obs, sample=lambda outputs, act_dist: act_dist.sample())
         return action
 
     def train(self, train_steps):
@@ -79,6 +80,52 @@ class SAC_Agent(Agent):
 
             self.current_step += self.n_envs
 
+    def train_async(self, train_steps):
+        """Train with the partial batches of an AsyncVecEnv_Gym, each step stores the transitions of the ready envs."""
+        if self.async_states is None:  # the first step is sent to all the envs
+            env_ids = np.arange(self.envs.num_envs)
+            self.obs_rms.update(self.envs.buf_obs)
+            obs = self._process_observation(self.envs.buf_obs)
+            acts = np.array([self.action_space.sample() for _ in env_ids])
+            self.async_states = (obs.copy(), acts.copy())
+            self.envs.send(acts, env_ids)
+        last_obs, last_acts = self.async_states
+        for _ in tqdm(range(train_steps)):
+            step_info = {}
+            next_obs, rewards, terminals, trunctions, infos, env_ids = self.envs.recv()
+            self.memory.store(last_obs[env_ids], last_acts[env_ids], self._process_reward(rewards), terminals,
+                              self._process_observation(next_obs))
+            if (self.current_step > self.start_training) and (self.current_step % self.train_frequency == 0):
+                obs_batch, act_batch, rew_batch, terminal_batch, next_batch = self.memory.sample()
+                step_info = self.learner.update(obs_batch, act_batch, rew_batch, next_batch, terminal_batch)
+                self.log_infos(step_info, self.current_step)
+
+            self.returns[env_ids] = self.gamma * self.returns[env_ids] + rewards
+            obs = next_obs
+            for i, e in enumerate(env_ids):
+                if terminals[i] or trunctions[i]:
+                    obs[i] = infos[i]["reset_obs"]
+                    self.ret_rms.update(self.returns[e:e + 1])
+                    self.returns[e] = 0.0
+                    self.current_episode[e] += 1
+                    if self.use_wandb:
+                        step_info["Episode-Steps/env-%d" % e] = infos[i]["episode_step"]
+                        step_info["Train-Episode-Rewards/env-%d" % e] = infos[i]["episode_score"]
+                    else:
+                        step_info["Episode-Steps"] = {"env-%d" % e: infos[i]["episode_step"]}
+                        step_info["Train-Episode-Rewards"] = {"env-%d" % e: infos[i]["episode_score"]}
+                    self.log_infos(step_info, self.current_step)
+
+            self.obs_rms.update(obs)
+            obs = self._process_observation(obs)
+            acts = self._action(obs)
+            if self.current_step < self.start_training:
+                acts = np.array([self.action_space.sample() for _ in env_ids])
+            last_obs[env_ids], last_acts[env_ids] = obs, acts
+            self.envs.send(acts, env_ids)
+
+            self.current_step += self.n_envs
+
     def test(self, env_fn, test_episodes):
         test_envs = env_fn()
         num_envs = test_envs.num_envs
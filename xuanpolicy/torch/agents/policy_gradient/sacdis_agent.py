@@ -29,7 +29,9 @@ class SACDIS_Agent(Agent):
                         self.auxiliary_info_shape,
                         self.n_envs,
                         config.n_size,
-                        config.batch_size)
+                        config.batch_size,
+                        storage=config.buffer_storage,
+                        storage_dir=config.buffer_dir)
         learner = SACDIS_Learner(policy,
                                  optimizer,
                                  scheduler,
@@ -41,9 +43,7 @@ class SACDIS_Agent(Agent):
                                            config.log_dir, config.model_dir)
 
     def _action(self, obs):
-        _, act_prob, act_distribution = self.policy(obs)
-        action = act_distribution.sample()
-        action = action.detach().cpu().numpy()
+        action = self.policy.act_numpy(obs, sample=lambda outputs, act_prob, act_dist: act_dist.sample())
         return action
 
     def train(self, train_steps):
@@ -87,7 +87,7 @@ class SPDQN_Agent(Agent):
         return rewards
 
     def _action(self, obs):
-        with torch.no_grad():
+        with torch.inference_mode():
             obs = torch.as_tensor(obs, device=self.device).float()
             con_actions = self.policy.con_action(obs)
             rnd = np.random.rand()
@@ -28,7 +28,9 @@ class TD3_Agent(Agent):
                                       self.auxiliary_info_shape,
                                       self.n_envs,
                                       config.n_size,
-                                      config.batch_size)
+                                      config.batch_size,
+                                      storage=config.buffer_storage,
+                                      storage_dir=config.buffer_dir)
         learner = TD3_Learner(policy,
                               optimizer,
                               scheduler,
@@ -40,8 +42,7 @@ class TD3_Agent(Agent):
         super(TD3_Agent, self).__init__(config, envs, policy, memory, learner, device, config.log_dir, config.model_dir)
 
     def _action(self, obs, noise_scale=0.0):
-        _, action = self.policy.action(obs)
-        action = action.detach().cpu().numpy()
+        action = self.policy.act_numpy(obs, method=self.policy.action, sample=lambda outputs, action: action)
         action = action + np.random.normal(size=action.shape) * noise_scale
         return np.clip(action, -1, 1)
 
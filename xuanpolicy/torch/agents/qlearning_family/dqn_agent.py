@@ -10,7 +10,8 @@ class DQN_Agent(Agent):
                  scheduler: Optional[torch.optim.lr_scheduler._LRScheduler] = None,
                  device: Optional[Union[int, str, torch.device]] = None):
         self.render = config.render
-        self.n_envs = envs.num_envs
+        # with an AsyncVecEnv_Gym, the slots of the partial batches are the envs of the replay buffer
+        self.n_envs = envs.batch_size if isinstance(envs, AsyncVecEnv_Gym) else envs.num_envs
 
         self.gamma = config.gamma
         self.train_frequency = config.training_frequency
@@ -23,13 +24,18 @@ class DQN_Agent(Agent):
         self.action_space = envs.action_space
         self.auxiliary_info_shape = {}
         self.atari = True if config.env_name == "Atari" else False
+        # the frame rings of the Atari buffer need each env in its own slot, which the partial batches do not keep
+        assert not (self.atari and isinstance(envs, AsyncVecEnv_Gym)), \
+            "DQN does not support the Async_Gym envs on Atari."
         Buffer = DummyOffPolicyBuffer_Atari if self.atari else DummyOffPolicyBuffer
         memory = Buffer(self.observation_space,
                         self.action_space,
                         self.auxiliary_info_shape,
                         self.n_envs,
                         config.n_size,
-                        config.batch_size)
+                        config.batch_size,
+                        storage=config.buffer_storage,
+                        storage_dir=config.buffer_dir)
         learner = DQN_Learner(policy,
                               optimizer,
                               scheduler,
@@ -40,12 +46,12 @@ class DQN_Agent(Agent):
         super(DQN_Agent, self).__init__(config, envs, policy, memory, learner, device, config.log_dir, config.model_dir)
 
     def _action(self, obs, egreedy=0.0):
-        _, argmax_action, _ = self.policy(obs)
-        random_action = np.random.choice(self.action_space.n, self.n_envs)
+        argmax_action = self.policy.act_numpy(obs, sample=lambda outputs, argmax_action, evalQ: argmax_action)
+        random_action = np.random.choice(self.action_space.n, len(argmax_action))
         if np.random.rand() < egreedy:
             action = random_action
         else:
-            action = argmax_action.detach().cpu().numpy()
+            action = argmax_action
         return action
 
     def train(self, train_steps):
@@ -85,6 +91,54 @@ class DQN_Agent(Agent):
             if self.egreedy >= self.end_greedy:
                 self.egreedy = self.egreedy - (self.start_greedy - self.end_greedy) / self.config.decay_step_greedy
 
+    def train_async(self, train_steps):
+        """Train with the partial batches of an AsyncVecEnv_Gym, each step stores the transitions of the ready envs."""
+        if self.async_states is None:  # the first step is sent to all the envs
+            env_ids = np.arange(self.envs.num_envs)
+            self.obs_rms.update(self.envs.buf_obs)
+            obs = self._process_observation(self.envs.buf_obs)
+            acts = self._action(obs, self.egreedy)
+            self.async_states = (obs.copy(), acts.copy())
+            self.envs.send(acts, env_ids)
+        last_obs, last_acts = self.async_states
+        for _ in tqdm(range(train_steps)):
+            step_info = {}
+            next_obs, rewards, terminals, trunctions, infos, env_ids = self.envs.recv()
+            self.memory.store(last_obs[env_ids], last_acts[env_ids], self._process_reward(rewards), terminals,
+                              self._process_observation(next_obs))
+            if self.current_step > self.start_training and self.current_step % self.train_frequency == 0:
+                # training
+                obs_batch, act_batch, rew_batch, terminal_batch, next_batch = self.memory.sample()
+                step_info = self.learner.update(obs_batch, act_batch, rew_batch, next_batch, terminal_batch)
+                step_info["epsilon-greedy"] = self.egreedy
+                self.log_infos(step_info, self.current_step)
+
+            obs = next_obs
+            for i, e in enumerate(env_ids):
+                if terminals[i] or trunctions[i]:
+                    if self.atari and (~trunctions[i]):
+                        pass
+                    else:
+                        obs[i] = infos[i]["reset_obs"]
+                        self.current_episode[e] += 1
+                        if self.use_wandb:
+                            step_info["Episode-Steps/env-%d" % e] = infos[i]["episode_step"]
+                            step_info["Train-Episode-Rewards/env-%d" % e] = infos[i]["episode_score"]
+                        else:
+                            step_info["Episode-Steps"] = {"env-%d" % e: infos[i]["episode_step"]}
+                            step_info["Train-Episode-Rewards"] = {"env-%d" % e: infos[i]["episode_score"]}
+                        self.log_infos(step_info, self.current_step)
+
+            self.obs_rms.update(obs)
+            obs = self._process_observation(obs)
+            acts = self._action(obs, self.egreedy)
+            last_obs[env_ids], last_acts[env_ids] = obs, acts
+            self.envs.send(acts, env_ids)
+
+            self.current_step += self.n_envs
+            if self.egreedy >= self.end_greedy:
+                self.egreedy = self.egreedy - (self.start_greedy - self.end_greedy) / self.config.decay_step_greedy
+
     def test(self, env_fn, test_episodes):
         test_envs = env_fn()
         num_envs = test_envs.num_envs
@@ -1,7 +1,6 @@
 import numpy as np
 
 from xuanpolicy.torch.agents import *
-from collections import deque
 
 
 class DRQN_Agent(Agent):
@@ -27,6 +26,7 @@ class DRQN_Agent(Agent):
         self.auxiliary_info_shape = {}
 
         self.atari = True if config.env_name == "Atari" else False
+        self.image_obs = getattr(self.observation_space, "dtype", None) == np.uint8
         memory = RecurrentOffPolicyBuffer(self.observation_space,
                                           self.action_space,
                                           self.auxiliary_info_shape,
@@ -34,7 +34,9 @@ class DRQN_Agent(Agent):
                                           config.n_size,
                                           config.batch_size,
                                           episode_length=envs.max_episode_length,
-                                          lookup_length=config.lookup_length)
+                                          lookup_length=config.lookup_length,
+                                          step_capacity=getattr(config, "step_capacity", None),
+                                          obs_dtype=np.uint8 if self.atari or self.image_obs else np.float32)
         learner = DRQN_Learner(policy,
                                optimizer,
                                scheduler,
@@ -47,19 +49,19 @@ class DRQN_Agent(Agent):
         self.lstm = True if config.rnn == "LSTM" else False
 
     def _action(self, obs, egreedy=0.0, rnn_hidden=None):
-        _, argmax_action, _, rnn_hidden_next = self.policy(obs[:, np.newaxis], *rnn_hidden)
+        def sample(outputs, argmax_action, evalQ, rnn_hidden_next):
+            return argmax_action, rnn_hidden_next
+        argmax_action, rnn_hidden_next = self.policy.act_numpy(obs[:, np.newaxis], *rnn_hidden, sample=sample)
         random_action = np.random.choice(self.action_space.n, self.n_envs)
         if np.random.rand() < egreedy:
             action = random_action
         else:
-            action = argmax_action.detach().cpu().numpy()
+            action = argmax_action
         return action, rnn_hidden_next
 
     def train(self, train_steps):
         obs = self.envs.buf_obs
-        episode_data = [EpisodeBuffer() for _ in range(self.n_envs)]
-        for i_env in range(self.n_envs):
-            episode_data[i_env].obs.append(self._process_observation(obs[i_env]))
+        self.memory.start_episodes(self._process_observation(obs))
         self.rnn_hidden = self.policy.init_hidden(self.n_envs)
         dones = [False for _ in range(self.n_envs)]
         for _ in tqdm(range(train_steps)):
@@ -69,7 +71,8 @@ class DRQN_Agent(Agent):
             acts, self.rnn_hidden = self._action(obs, self.egreedy, self.rnn_hidden)
             next_obs, rewards, terminals, trunctions, infos = self.envs.step(acts)
 
-            if (self.current_step > self.start_training) and (self.current_step % self.train_frequency == 0):
+            if (self.current_step > self.start_training) and (self.current_step % self.train_frequency == 0) and \
+                    self.memory.can_sample:
                 # training
                 obs_batch, act_batch, rew_batch, terminal_batch = self.memory.sample()
                 step_info = self.learner.update(obs_batch, act_batch, rew_batch, terminal_batch)
@@ -77,8 +80,8 @@ class DRQN_Agent(Agent):
                 self.log_infos(step_info, self.current_step)
 
             obs = next_obs
+            self.memory.store(acts, self._process_reward(rewards), terminals, self._process_observation(obs))
             for i in range(self.n_envs):
-                episode_data[i].put([self._process_observation(obs[i]), acts[i], self._process_reward(rewards[i]), terminals[i]])
                 if terminals[i] or trunctions[i]:
                     if self.atari and (~trunctions[i]):
                         pass
@@ -93,10 +96,9 @@ class DRQN_Agent(Agent):
                             step_info["Episode-Steps"] = {"env-%d" % i: infos[i]["episode_step"]}
                             step_info["Train-Episode-Rewards"] = {"env-%d" % i: infos[i]["episode_score"]}
                         self.log_infos(step_info, self.current_step)
-                        self.memory.store(episode_data[i])
-                        episode_data[i] = EpisodeBuffer()
+                        self.memory.finish_episodes(i)
                         obs[i] = infos[i]["reset_obs"]
-                        episode_data[i].obs.append(self._process_observation(obs[i]))
+                        self.memory.start_episodes(self._process_observation(obs[i:i + 1]), [i])
 
             self.current_step += self.n_envs
             if self.egreedy > self.end_greedy:
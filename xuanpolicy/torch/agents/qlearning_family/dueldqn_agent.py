@@ -30,7 +30,9 @@ class DuelDQN_Agent(Agent):
                         self.auxiliary_info_shape,
                         self.n_envs,
                         config.n_size,
-                        config.batch_size)
+                        config.batch_size,
+                        storage=config.buffer_storage,
+                        storage_dir=config.buffer_dir)
         learner = DuelDQN_Learner(policy,
                                   optimizer,
                                   scheduler,
@@ -42,12 +44,12 @@ class DuelDQN_Agent(Agent):
                                             config.log_dir, config.model_dir)
 
     def _action(self, obs, egreedy=0.0):
-        _, argmax_action, _ = self.policy(obs)
-        random_action = np.random.choice(self.action_space.n, self.n_envs)
+        argmax_action = self.policy.act_numpy(obs, sample=lambda outputs, argmax_action, evalQ: argmax_action)
+        random_action = np.random.choice(self.action_space.n, len(argmax_action))
         if np.random.rand() < egreedy:
             action = random_action
         else:
-            action = argmax_action.detach().cpu().numpy()
+            action = argmax_action
         return action
 
     def train(self, train_steps):
@@ -30,7 +30,9 @@ class NoisyDQN_Agent(Agent):
                         self.auxiliary_info_shape,
                         self.n_envs,
                         config.n_size,
-                        config.batch_size)
+                        config.batch_size,
+                        storage=config.buffer_storage,
+                        storage_dir=config.buffer_dir)
         learner = DQN_Learner(policy,
                               optimizer,
                               scheduler,
@@ -43,8 +45,7 @@ class NoisyDQN_Agent(Agent):
 
     def _action(self, obs):
         self.policy.noise_scale = self.noise_scale
-        _, argmax_action, _ = self.policy(obs)
-        action = argmax_action.detach().cpu().numpy()
+        action = self.policy.act_numpy(obs, sample=lambda outputs, argmax_action, evalQ: argmax_action)
         return action
 
     def train(self, train_steps):
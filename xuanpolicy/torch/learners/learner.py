@@ -20,6 +20,23 @@ class Learner(ABC):
         self.device = device
         self.model_dir = model_dir
         self.iterations = 0
+        self.rollout_tensors = None
+
+    def load_rollout(self, *rollout):
+        """
+        Load a rollout of numpy arrays as tensors on the device. The device tensors are allocated once and refilled
+        in place for the next rollouts, on CPU the tensors share memory with the arrays.
+        """
+        if self.device is None or torch.device(self.device).type == "cpu":
+            self.rollout_tensors = [torch.from_numpy(data) for data in rollout]
+            return self.rollout_tensors
+        if (self.rollout_tensors is None) or any(tuple(tensor.shape) != data.shape
+                                                 for tensor, data in zip(self.rollout_tensors, rollout)):
+            self.rollout_tensors = [torch.empty(data.shape, dtype=torch.from_numpy(data).dtype, device=self.device)
+                                    for data in rollout]
+        for tensor, data in zip(self.rollout_tensors, rollout):
+            tensor.copy_(torch.from_numpy(data))
+        return self.rollout_tensors
 
     def save_model(self, model_path):
         torch.save(self.policy.state_dict(), model_path)
@@ -31,7 +48,7 @@ class Learner(ABC):
             if f"seed_{seed}" in f:
                 path = os.path.join(path, f)
                 break
-        model_names = os.listdir(path)
+        model_names = [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
         if os.path.exists(path + "/obs_rms.npy"):
             model_names.remove("obs_rms.npy")
         model_names.sort()
@@ -46,6 +63,7 @@ class Learner(ABC):
             "cuda:6": self.device,
             "cuda:7": self.device
         }))
+        return path
 
     @abstractmethod
     def update(self, *args):
@@ -87,7 +105,7 @@ class LearnerMAS(ABC):
         torch.save(self.policy.state_dict(), model_path)
 
     def load_model(self, path):
-        model_names = os.listdir(path)
+        model_names = [f for f in os.listdir(path) if os.path.isfile(os.path.join(path, f))]
         model_names.sort()
         model_path = path + model_names[-1]
         self.policy.load_state_dict(torch.load(model_path))
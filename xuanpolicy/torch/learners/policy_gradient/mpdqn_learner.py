@@ -54,6 +54,10 @@ class MPDQN_Learner(Learner):
 
         self.policy.soft_update(self.tau)
 
-        self.writer.add_scalar("Q_loss", q_loss.item(), self.iterations)
-        self.writer.add_scalar("P_loss", q_loss.item(), self.iterations)
-        self.writer.add_scalar('Qvalue', eval_q.mean().item(), self.iterations)
+        info = {
+            "Q_loss": q_loss.item(),
+            "P_loss": p_loss.item(),
+            "Qvalue": eval_q.mean().item()
+        }
+
+        return info
@@ -20,17 +20,18 @@ class C51_Learner(Learner):
         rew_batch = torch.as_tensor(rew_batch, device=self.device)
         ter_batch = torch.as_tensor(terminal_batch, device=self.device)
         _, _, evalZ = self.policy(obs_batch)
-        _, targetA, targetZ = self.policy.target(next_batch)
-
         current_dist = (evalZ * F.one_hot(act_batch, evalZ.shape[1]).unsqueeze(-1)).sum(1)
-        target_dist = (targetZ * F.one_hot(targetA.detach(), evalZ.shape[1]).unsqueeze(-1)).sum(1).detach()
 
-        current_supports = self.policy.supports
-        next_supports = rew_batch.unsqueeze(1) + self.gamma * self.policy.supports * (1 - ter_batch.unsqueeze(1))
-        next_supports = next_supports.clamp(self.policy.vmin, self.policy.vmax)
+        with torch.no_grad():
+            _, targetA, targetZ = self.policy.target(next_batch)
+            target_dist = (targetZ * F.one_hot(targetA, evalZ.shape[1]).unsqueeze(-1)).sum(1)
+
+            current_supports = self.policy.supports
+            next_supports = rew_batch.unsqueeze(1) + self.gamma * self.policy.supports * (1 - ter_batch.unsqueeze(1))
+            next_supports = next_supports.clamp(self.policy.vmin, self.policy.vmax)
 
-        projection = 1 - (next_supports.unsqueeze(-1) - current_supports.unsqueeze(0)).abs() / self.policy.deltaz
-        target_dist = torch.bmm(target_dist.unsqueeze(1), projection.clamp(0, 1)).squeeze(1)
+            projection = 1 - (next_supports.unsqueeze(-1) - current_supports.unsqueeze(0)).abs() / self.policy.deltaz
+            target_dist = torch.bmm(target_dist.unsqueeze(1), projection.clamp(0, 1)).squeeze(1)
         loss = -(target_dist * torch.log(current_dist + 1e-8)).sum(1).mean()
         self.optimizer.zero_grad()
         loss.backward()
@@ -20,12 +20,18 @@ class DDQN_Learner(Learner):
         rew_batch = torch.as_tensor(rew_batch, device=self.device)
         ter_batch = torch.as_tensor(terminal_batch, device=self.device)
 
-        _, _, evalQ = self.policy(obs_batch)
-        _, targetA, targetQ = self.policy(next_batch)
-
-        targetA = F.one_hot(targetA, targetQ.shape[-1])
-        targetQ = (targetQ * targetA).sum(dim=-1)
-        targetQ = rew_batch + self.gamma * (1 - ter_batch) * targetQ
+        # one forward of the online network for the observations and the next observations
+        batch_size = len(obs_batch)
+        if isinstance(obs_batch, torch.Tensor):  # the batches of the PrefetchSampler
+            obs_all = torch.cat([obs_batch, next_batch])
+        else:
+            obs_all = np.concatenate([obs_batch, next_batch])
+        _, argmaxA, Q = self.policy(obs_all)
+        evalQ, targetQ = Q[:batch_size], Q[batch_size:]
+        with torch.no_grad():
+            targetA = F.one_hot(argmaxA[batch_size:], targetQ.shape[-1])
+            targetQ = (targetQ * targetA).sum(dim=-1)
+            targetQ = rew_batch + self.gamma * (1 - ter_batch) * targetQ
         predictQ = (evalQ * F.one_hot(act_batch.long(), evalQ.shape[1])).sum(dim=-1)
 
         loss = F.mse_loss(predictQ, targetQ)
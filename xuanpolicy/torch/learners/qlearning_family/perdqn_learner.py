@@ -21,9 +21,10 @@ class PerDQN_Learner(Learner):
         ter_batch = torch.as_tensor(terminal_batch, device=self.device)
 
         _, _, evalQ = self.policy(obs_batch)
-        _, _, targetQ = self.policy.target(next_batch)
-        targetQ = targetQ.max(dim=-1).values
-        targetQ = rew_batch + self.gamma * (1 - ter_batch) * targetQ
+        with torch.no_grad():
+            _, _, targetQ = self.policy.target(next_batch)
+            targetQ = targetQ.max(dim=-1).values
+            targetQ = rew_batch + self.gamma * (1 - ter_batch) * targetQ
         predictQ = (evalQ * F.one_hot(act_batch.long(), evalQ.shape[1])).sum(dim=-1)
 
         td_error = targetQ - predictQ
@@ -19,12 +19,19 @@ class QRDQN_Learner(Learner):
         act_batch = torch.as_tensor(act_batch, device=self.device).long()
         rew_batch = torch.as_tensor(rew_batch, device=self.device)
         ter_batch = torch.as_tensor(terminal_batch, device=self.device)
-        _, _, evalZ = self.policy(obs_batch)
-        _, targetA, targetZ = self.policy(next_batch)
+        # one forward of the online network for the observations and the next observations
+        batch_size = len(obs_batch)
+        if isinstance(obs_batch, torch.Tensor):  # the batches of the PrefetchSampler
+            obs_all = torch.cat([obs_batch, next_batch])
+        else:
+            obs_all = np.concatenate([obs_batch, next_batch])
+        _, argmaxA, Z = self.policy(obs_all)
+        evalZ, targetZ = Z[:batch_size], Z[batch_size:]
 
         current_quantile = (evalZ * F.one_hot(act_batch, evalZ.shape[1]).unsqueeze(-1)).sum(1)
-        target_quantile = (targetZ * F.one_hot(targetA.detach(), evalZ.shape[1]).unsqueeze(-1)).sum(1).detach()
-        target_quantile = rew_batch.unsqueeze(1) + self.gamma * target_quantile * (1 - ter_batch.unsqueeze(1))
+        with torch.no_grad():
+            target_quantile = (targetZ * F.one_hot(argmaxA[batch_size:], evalZ.shape[1]).unsqueeze(-1)).sum(1)
+            target_quantile = rew_batch.unsqueeze(1) + self.gamma * target_quantile * (1 - ter_batch.unsqueeze(1))
 
         loss = F.mse_loss(target_quantile, current_quantile)
         self.optimizer.zero_grad()
@@ -58,7 +58,7 @@ class CriticNet(nn.Module):
         return self.model(x)[:, 0]
 
 
-class ActorCriticPolicy(nn.Module):
+class ActorCriticPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: ModuleType,
@@ -85,7 +85,7 @@ class ActorCriticPolicy(nn.Module):
         return outputs, a, v
 
 
-class ActorPolicy(nn.Module):
+class ActorPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: ModuleType,
@@ -107,7 +107,7 @@ class ActorPolicy(nn.Module):
         return outputs, a
 
 
-class PPGActorCritic(nn.Module):
+class PPGActorCritic(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: ModuleType,
@@ -190,7 +190,7 @@ class ActorNet_SACDIS(nn.Module):
         return action_prob, dist
 
 
-class SACDISPolicy(nn.Module):
+class SACDISPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: Basic_Identical,
@@ -240,9 +240,5 @@ class SACDISPolicy(nn.Module):
         return act_prob, log_action_prob, self.critic(outputs_critic['state'])
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.representation_critic.parameters(), self.target_representation_critic.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic.parameters(), self.target_critic.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.representation_critic, self.target_representation_critic),
+                           (self.critic, self.target_critic))
@@ -75,7 +75,7 @@ class COMA_Critic(nn.Module):
         return self.model(x)
 
 
-class MAAC_Policy(nn.Module):
+class MAAC_Policy(nn.Module, NumpyInference):
     """
     MAAC_Policy: Multi-Agent Actor-Critic Policy
     """
@@ -150,7 +150,7 @@ class MAAC_Policy(nn.Module):
         return values_n if self.mixer is None else self.mixer(values_n, global_state)
 
 
-class MeanFieldActorCriticPolicy(nn.Module):
+class MeanFieldActorCriticPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  n_agents: int,
@@ -198,15 +198,10 @@ class MeanFieldActorCriticPolicy(nn.Module):
         return self.target_critic_net(critic_in)
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.actor_net.parameters(), self.target_actor_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic_net.parameters(), self.target_critic_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.actor_net, self.target_actor_net), (self.critic_net, self.target_critic_net))
 
 
-class COMAPolicy(nn.Module):
+class COMAPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  state_dim: int,
                  action_space: Discrete,
@@ -253,5 +248,4 @@ class COMAPolicy(nn.Module):
         return outputs, act_dist
 
     def copy_target(self):
-        for ep, tp in zip(self.critic.parameters(), self.target_critic.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.critic, self.target_critic))
@@ -145,7 +145,7 @@ class QRDQNhead(nn.Module):
         return quantiles
 
 
-class BasicQnetwork(nn.Module):
+class BasicQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  representation: nn.Module,
@@ -176,13 +176,10 @@ class BasicQnetwork(nn.Module):
         return outputs_target, argmax_action.detach(), targetQ.detach()
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead))
 
 
-class DuelQnetwork(nn.Module):
+class DuelQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: Basic_Identical,
@@ -213,13 +210,10 @@ class DuelQnetwork(nn.Module):
         return outputs, argmax_action, targetQ
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead))
 
 
-class NoisyQnetwork(nn.Module):
+class NoisyQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  representation: Basic_Identical,
@@ -237,19 +231,22 @@ class NoisyQnetwork(nn.Module):
                                      normalize, initialize, activation, device)
         self.target_Qhead = copy.deepcopy(self.eval_Qhead)
         self.noise_scale = 0.0
+        self.eval_noise_parameter = None
+        self.target_noise_parameter = None
 
     def update_noise(self, noisy_bound: float = 0.0):
-        self.eval_noise_parameter = []
-        self.target_noise_parameter = []
-        for parameter in self.eval_Qhead.parameters():
-            self.eval_noise_parameter.append(torch.randn_like(parameter) * noisy_bound)
-            self.target_noise_parameter.append(torch.randn_like(parameter) * noisy_bound)
+        if self.eval_noise_parameter is None:
+            # allocated once, out of the inference mode of act_numpy, and refilled in place
+            with torch.inference_mode(False):
+                self.eval_noise_parameter = [torch.zeros_like(p) for p in self.eval_Qhead.parameters()]
+                self.target_noise_parameter = [torch.zeros_like(p) for p in self.target_Qhead.parameters()]
+        for noise_param in self.eval_noise_parameter + self.target_noise_parameter:
+            noise_param.normal_(0.0, noisy_bound)
 
     def forward(self, observation: Union[np.ndarray, dict]):
         outputs = self.representation(observation)
         self.update_noise(self.noise_scale)
-        for parameter, noise_param in zip(self.eval_Qhead.parameters(), self.eval_noise_parameter):
-            parameter.data.copy_(parameter.data + noise_param)
+        torch._foreach_add_([parameter.data for parameter in self.eval_Qhead.parameters()], self.eval_noise_parameter)
         evalQ = self.eval_Qhead(outputs['state'])
         argmax_action = evalQ.argmax(dim=-1)
         return outputs, argmax_action, evalQ
@@ -257,20 +254,16 @@ class NoisyQnetwork(nn.Module):
     def target(self, observation: Union[np.ndarray, dict]):
         outputs = self.target_representation(observation)
         self.update_noise(self.noise_scale)
-        for parameter, noise_param in zip(self.target_Qhead.parameters(), self.target_noise_parameter):
-            parameter.data.copy_(parameter.data + noise_param)
+        torch._foreach_add_([parameter.data for parameter in self.target_Qhead.parameters()], self.target_noise_parameter)
         targetQ = self.target_Qhead(outputs['state'])
         argmax_action = targetQ.argmax(dim=-1)
         return outputs, argmax_action, targetQ.detach()
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead))
 
 
-class C51Qnetwork(nn.Module):
+class C51Qnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  atom_num: int,
@@ -313,13 +306,10 @@ class C51Qnetwork(nn.Module):
         return outputs, argmax_action, target_Z
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Zhead.parameters(), self.target_Zhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Zhead, self.target_Zhead))
 
 
-class QRDQN_Network(nn.Module):
+class QRDQN_Network(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  quantile_num: int,
@@ -355,10 +345,7 @@ class QRDQN_Network(nn.Module):
         return outputs, argmax_action, target_Z
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Zhead.parameters(), self.target_Zhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Zhead, self.target_Zhead))
 
 
 class ActorNet(nn.Module):
@@ -403,7 +390,7 @@ class CriticNet(nn.Module):
         return self.model(torch.concat((x, a), dim=-1))[:, 0]
 
 
-class DDPGPolicy(nn.Module):
+class DDPGPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: Basic_Identical,
@@ -444,15 +431,10 @@ class DDPGPolicy(nn.Module):
         return self.critic(outputs['state'], self.actor(outputs['state']))
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.actor.parameters(), self.target_actor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic.parameters(), self.target_critic.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.actor, self.target_actor), (self.critic, self.target_critic))
 
 
-class TD3Policy(nn.Module):
+class TD3Policy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: Basic_Identical,
@@ -505,18 +487,11 @@ class TD3Policy(nn.Module):
         return outputs, (qa + qb) / 2.0
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.actor.parameters(), self.target_actor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.criticA.parameters(), self.target_criticA.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.criticB.parameters(), self.target_criticB.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-
-
-class PDQNPolicy(nn.Module):
+        polyak_update(tau, (self.actor, self.target_actor), (self.criticA, self.target_criticA),
+                           (self.criticB, self.target_criticB))
+
+
+class PDQNPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  observation_space,
                  action_space,
@@ -569,18 +544,11 @@ class PDQNPolicy(nn.Module):
         return policy_q
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.conactor.parameters(), self.target_conactor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.qnetwork.parameters(), self.target_qnetwork.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-
-
-class MPDQNPolicy(nn.Module):
+        polyak_update(tau, (self.representation, self.target_representation), (self.conactor, self.target_conactor),
+                           (self.qnetwork, self.target_qnetwork))
+
+
+class MPDQNPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  observation_space,
                  action_space,
@@ -676,18 +644,11 @@ class MPDQNPolicy(nn.Module):
         return Q
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.conactor.parameters(), self.target_conactor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.qnetwork.parameters(), self.target_qnetwork.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-
-
-class SPDQNPolicy(nn.Module):
+        polyak_update(tau, (self.representation, self.target_representation), (self.conactor, self.target_conactor),
+                           (self.qnetwork, self.target_qnetwork))
+
+
+class SPDQNPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  observation_space,
                  action_space,
@@ -759,18 +720,11 @@ class SPDQNPolicy(nn.Module):
         return Q
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.conactor.parameters(), self.target_conactor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.qnetwork.parameters(), self.target_qnetwork.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-
-
-class DRQNPolicy(nn.Module):
+        polyak_update(tau, (self.representation, self.target_representation), (self.conactor, self.target_conactor),
+                           (self.qnetwork, self.target_qnetwork))
+
+
+class DRQNPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  representation: Basic_Identical,
@@ -786,6 +740,7 @@ class DRQNPolicy(nn.Module):
         kwargs["input_dim"] = self.representation.output_shapes['state'][0]
         kwargs["action_dim"] = self.action_dim
         self.lstm = True if kwargs["rnn"] == "LSTM" else False
+        self.use_rnn = True
         self.cnn = True if self.representation._get_name() == "Basic_CNN" else False
         self.eval_Qhead = BasicRecurrent(**kwargs)
         self.target_Qhead = copy.deepcopy(self.eval_Qhead)
@@ -835,7 +790,4 @@ class DRQNPolicy(nn.Module):
             return rnn_hidden
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead))
@@ -33,7 +33,7 @@ class BasicQhead(nn.Module):
         return self.model(x)
 
 
-class BasicQnetwork(nn.Module):
+class BasicQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  n_agents: int,
@@ -85,13 +85,10 @@ class BasicQnetwork(nn.Module):
         return rnn_hidden, self.target_Qhead(q_inputs)
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead))
 
 
-class MFQnetwork(nn.Module):
+class MFQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  n_agents: int,
@@ -128,13 +125,10 @@ class MFQnetwork(nn.Module):
         return self.target_Qhead(q_inputs)
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead))
 
 
-class MixingQnetwork(nn.Module):
+class MixingQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  n_agents: int,
@@ -196,12 +190,8 @@ class MixingQnetwork(nn.Module):
         return self.target_Qtot(q, states)
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qtot.parameters(), self.target_Qtot.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead),
+                     (self.eval_Qtot, self.target_Qtot))
 
 
 class Weighted_MixingQnetwork(MixingQnetwork):
@@ -241,19 +231,12 @@ class Weighted_MixingQnetwork(MixingQnetwork):
         return self.target_Qhead_centralized(q_inputs)
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qtot.parameters(), self.target_Qtot.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead_centralized.parameters(), self.target_Qhead_centralized.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.q_feedforward.parameters(), self.target_q_feedforward.parameters()):
-            tp.data.copy_(ep)
-
-
-class Qtran_MixingQnetwork(nn.Module):
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead),
+                     (self.eval_Qtot, self.target_Qtot), (self.eval_Qhead_centralized, self.target_Qhead_centralized),
+                     (self.q_feedforward, self.target_q_feedforward))
+
+
+class Qtran_MixingQnetwork(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  n_agents: int,
@@ -290,15 +273,11 @@ class Qtran_MixingQnetwork(nn.Module):
         return outputs, self.target_Qhead(q_inputs)
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.qtran_net.parameters(), self.target_qtran_net.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.representation, self.target_representation), (self.eval_Qhead, self.target_Qhead),
+                     (self.qtran_net, self.target_qtran_net))
 
 
-class DCG_policy(nn.Module):
+class DCG_policy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Discrete,
                  global_state_dim: int,
@@ -350,15 +329,11 @@ class DCG_policy(nn.Module):
         return rnn_hidden, argmax_action, evalQ
 
     def copy_target(self):
-        for ep, tp in zip(self.representation.parameters(), self.target_representation.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.utility.parameters(), self.target_utility.parameters()):
-            tp.data.copy_(ep)
-        for ep, tp in zip(self.payoffs.parameters(), self.target_payoffs.parameters()):
-            tp.data.copy_(ep)
+        pairs = [(self.representation, self.target_representation), (self.utility, self.target_utility),
+                 (self.payoffs, self.target_payoffs)]
         if self.dcg_s:
-            for ep, tp in zip(self.bias.parameters(), self.target_bias.parameters()):
-                tp.data.copy_(ep)
+            pairs.append((self.bias, self.target_bias))
+        copy_targets(*pairs)
 
 
 class ActorNet(nn.Module):
@@ -413,7 +388,7 @@ class CriticNet(nn.Module):
         return self.model(x)
 
 
-class Basic_DDPG_policy(nn.Module):
+class Basic_DDPG_policy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: spaces_pettingzoo,
                  n_agents: int,
@@ -462,12 +437,7 @@ class Basic_DDPG_policy(nn.Module):
         return self.target_actor_net(actor_in)
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.actor_net.parameters(), self.target_actor_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic_net.parameters(), self.target_critic_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.actor_net, self.target_actor_net), (self.critic_net, self.target_critic_net))
 
 
 class MADDPG_policy(Basic_DDPG_policy):
@@ -560,12 +530,5 @@ class MATD3_policy(Basic_DDPG_policy):
         return outputs_n, torch.cat((qa, qb), dim=-1)
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.actor_net.parameters(), self.target_actor_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic_net_A.parameters(), self.target_critic_net_A.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic_net_B.parameters(), self.target_critic_net_B.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.actor_net, self.target_actor_net), (self.critic_net_A, self.target_critic_net_A),
+                           (self.critic_net_B, self.target_critic_net_B))
@@ -51,7 +51,7 @@ class CriticNet(nn.Module):
         return self.model(x)[:, 0]
 
 
-class ActorCriticPolicy(nn.Module):
+class ActorCriticPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: ModuleType,
@@ -77,7 +77,7 @@ class ActorCriticPolicy(nn.Module):
         return outputs, a, v
 
 
-class ActorPolicy(nn.Module):
+class ActorPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: ModuleType,
@@ -100,7 +100,7 @@ class ActorPolicy(nn.Module):
         return outputs, a
 
 
-class PPGActorCritic(nn.Module):
+class PPGActorCritic(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: ModuleType,
@@ -184,7 +184,7 @@ class CriticNet_SAC(nn.Module):
         return self.model(torch.concat((x, a), dim=-1))[:, 0]
 
 
-class SACPolicy(nn.Module):
+class SACPolicy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  representation: Basic_Identical,
@@ -235,15 +235,6 @@ class SACPolicy(nn.Module):
         return act_log, self.critic(outputs_critic['state'], act)
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.representation_actor.parameters(), self.target_representation_actor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.representation_critic.parameters(), self.target_representation_critic.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.actor.parameters(), self.target_actor.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic.parameters(), self.target_critic.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.representation_actor, self.target_representation_actor),
+                           (self.representation_critic, self.target_representation_critic),
+                           (self.actor, self.target_actor), (self.critic, self.target_critic))
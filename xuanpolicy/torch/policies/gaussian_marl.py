@@ -61,8 +61,7 @@ class BasicQnetwork(nn.Module):
         return self.target_Qhead(q_inputs)
 
     def copy_target(self):
-        for ep, tp in zip(self.eval_Qhead.parameters(), self.target_Qhead.parameters()):
-            tp.data.copy_(ep)
+        copy_targets((self.eval_Qhead, self.target_Qhead))
 
 
 
@@ -130,7 +129,7 @@ class CriticNet(nn.Module):
         return self.model(x)
 
 
-class Basic_ISAC_policy(nn.Module):
+class Basic_ISAC_policy(nn.Module, NumpyInference):
     def __init__(self,
                  action_space: Space,
                  n_agents: int,
@@ -179,12 +178,7 @@ class Basic_ISAC_policy(nn.Module):
         return self.target_actor_net(actor_in)
 
     def soft_update(self, tau=0.005):
-        for ep, tp in zip(self.actor_net.parameters(), self.target_actor_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
-        for ep, tp in zip(self.critic_net.parameters(), self.target_critic_net.parameters()):
-            tp.data.mul_(1 - tau)
-            tp.data.add_(tau * ep.data)
+        polyak_update(tau, (self.actor_net, self.target_actor_net), (self.critic_net, self.target_critic_net))
 
 
 class MASAC_policy(Basic_ISAC_policy):
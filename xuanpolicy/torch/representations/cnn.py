@@ -1,6 +1,17 @@
 from xuanpolicy.torch.representations import *
 
 
+def image_tensor(observations: Union[np.ndarray, torch.Tensor], device):
+    """
+    Scale the NHWC image observations to [0, 1] and return them as a float NCHW tensor on device.
+    The learners can pass the minibatches as tensors that are already on the device.
+    """
+    if isinstance(observations, torch.Tensor):
+        return observations.to(device).permute(0, 3, 1, 2).float() / 255.0
+    observations = observations / 255.0
+    return torch.as_tensor(np.transpose(observations, (0, 3, 1, 2)), dtype=torch.float32, device=device)
+
+
 # process the input observations with stacks of CNN layers
 class Basic_CNN(nn.Module):
     def __init__(self,
@@ -35,11 +46,8 @@ class Basic_CNN(nn.Module):
         layers.append(nn.Flatten())
         return nn.Sequential(*layers)
 
-    def forward(self, observations: np.ndarray):
-        observations = observations / 255.0
-        tensor_observation = torch.as_tensor(np.transpose(observations, (0, 3, 1, 2)), dtype=torch.float32,
-                                             device=self.device)
-        return {'state': self.model(tensor_observation)}
+    def forward(self, observations: Union[np.ndarray, torch.Tensor]):
+        return {'state': self.model(image_tensor(observations, self.device))}
 
 
 class AC_CNN_Atari(nn.Module):
@@ -86,8 +94,5 @@ class AC_CNN_Atari(nn.Module):
             layers.extend(mlp)
         return nn.Sequential(*layers)
 
-    def forward(self, observations: np.ndarray):
-        observations = observations / 255.0
-        tensor_observation = torch.as_tensor(np.transpose(observations, (0, 3, 1, 2)), dtype=torch.float32,
-                                             device=self.device)
-        return {'state': self.model(tensor_observation)}
+    def forward(self, observations: Union[np.ndarray, torch.Tensor]):
+        return {'state': self.model(image_tensor(observations, self.device))}
@@ -1,16 +1,32 @@
+import os
+from xuanpolicy.common import get_memory_state, set_memory_state, save_memory_state, load_memory_state
 from xuanpolicy.environment import make_envs
+from xuanpolicy.environment.vectorize_tuner import tune_vectorize
 from xuanpolicy.torch.utils.operations import set_seed
 
 
 class Runner_Base(object):
+    # the training progress of the runners that count the steps themselves, saved with the checkpoints
+    train_state_keys = ['current_step', 'current_episode']
+
     def __init__(self, args):
         # set random seeds
         set_seed(args.seed)
 
         # build environments
-        self.envs = make_envs(args)
+        self.envs = make_envs(tune_vectorize(args) if args.vectorize_tuning else args)
+        if args.env_stats:
+            self.envs.enable_stats()
         self.envs.reset()
         self.n_envs = self.envs.num_envs
 
+    def save_train_state(self, model_dir):
+        save_memory_state(os.path.join(model_dir, "runner_state"), get_memory_state(self, self.train_state_keys))
+
+    def load_train_state(self, model_dir):
+        state_path = os.path.join(model_dir, "runner_state")
+        if os.path.exists(state_path):
+            set_memory_state(self, self.train_state_keys, load_memory_state(state_path))
+
     def run(self):
         pass
@@ -6,6 +6,7 @@ from xuanpolicy.torch.agents import REGISTRY as REGISTRY_Agent
 from xuanpolicy.torch.policies import REGISTRY as REGISTRY_Policy
 from xuanpolicy.torch.utils.input_reformat import get_repre_in, get_policy_in
 from xuanpolicy.torch.utils.operations import set_seed
+from xuanpolicy.torch.utils import PrefetchSampler
 import itertools
 import torch
 import gym.spaces
@@ -75,6 +76,13 @@ class Runner_DRL(Runner_Base):
             self.agent = REGISTRY_Agent[self.agent_name](self.args, self.envs, policy, optimizer, lr_scheduler,
                                                          self.args.device)
 
+        if self.args.vectorize == "Async_Gym":  # each training step consumes a partial batch of the envs
+            assert hasattr(self.agent, "train_async"), f"{self.agent_name} does not support the Async_Gym envs."
+            self.n_envs = self.envs.batch_size
+            self.train = self.agent.train_async
+        else:
+            self.train = self.agent.train
+
     def run(self):
         if self.args.test_mode:
             def env_fn():
@@ -87,12 +95,17 @@ class Runner_DRL(Runner_Base):
             print(f"Mean Score: {np.mean(scores)}, Std: {np.std(scores)}")
             print("Finish testing.")
         else:
-            n_train_steps = self.args.running_steps // self.n_envs
-            self.agent.train(n_train_steps)
+            if self.args.resume_training:
+                self.agent.resume(self.args.seed)
+            n_train_steps = max(self.args.running_steps - self.agent.current_step, 0) // self.n_envs
+            self.train(n_train_steps)
             print("Finish training.")
-            self.agent.save_model("final_train_model.pth")
+            self.agent.save_model("final_train_model.pth", save_buffer=True)
 
         self.envs.close()
+        self.agent.metrics.close()
+        if isinstance(self.agent.memory, PrefetchSampler):
+            self.agent.memory.close()
         if self.agent.use_wandb:
             wandb.finish()
         else:
@@ -104,7 +117,9 @@ class Runner_DRL(Runner_Base):
             args_test = deepcopy(self.args)
             args_test.parallels = args_test.test_episode
             return make_envs(args_test)
-        train_steps = self.args.running_steps // self.n_envs
+        if self.args.resume_training:
+            self.agent.resume(self.args.seed)
+        train_steps = max(self.args.running_steps - self.agent.current_step, 0) // self.n_envs
         eval_interval = self.args.eval_interval // self.n_envs
         test_episode = self.args.test_episode
         num_epoch = int(train_steps / eval_interval)
@@ -115,7 +130,7 @@ class Runner_DRL(Runner_Base):
                             "step": self.agent.current_step}
         for i_epoch in range(num_epoch):
             print("Epoch: %d/%d:" % (i_epoch, num_epoch))
-            self.agent.train(eval_interval)
+            self.train(eval_interval)
             test_scores = self.agent.test(env_fn, test_episode)
 
             if np.mean(test_scores) > best_scores_info["mean"]:
@@ -129,6 +144,9 @@ class Runner_DRL(Runner_Base):
         print("Best Model Score: %.2f, std=%.2f" % (best_scores_info["mean"], best_scores_info["std"]))
 
         self.envs.close()
+        self.agent.metrics.close()
+        if isinstance(self.agent.memory, PrefetchSampler):
+            self.agent.memory.close()
         if self.agent.use_wandb:
             wandb.finish()
         else:
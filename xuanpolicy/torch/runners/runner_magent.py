@@ -1,7 +1,13 @@
 from .runner_pettingzoo import Pettingzoo_Runner
+from xuanpolicy.environment import NativeVecEnv_MAgent
 
 
 class MAgent_Runner(Pettingzoo_Runner):
     def __init__(self, args):
         super(MAgent_Runner, self).__init__(args)
         self.fps = 50
+
+    def combine_env_actions(self, actions):
+        if isinstance(self.envs, NativeVecEnv_MAgent):  # takes the group-wise actions directly
+            return actions
+        return super(MAgent_Runner, self).combine_env_actions(actions)
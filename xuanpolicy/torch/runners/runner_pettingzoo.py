@@ -5,6 +5,7 @@ from pathlib import Path
 import wandb
 from torch.utils.tensorboard import SummaryWriter
 from .runner_basic import Runner_Base, make_envs
+from xuanpolicy.common import MetricsSink
 from xuanpolicy.torch.agents import REGISTRY as REGISTRY_Agent
 from gymnasium.spaces.box import Box
 from tqdm import tqdm
@@ -64,18 +65,21 @@ class Pettingzoo_Runner(Runner_Base):
                     self.use_wandb = True
                 else:
                     raise "No logger is implemented."
+                self.metrics = MetricsSink(None if self.use_wandb else self.writer, arg.log_flush_interval)
 
                 self.current_step = 0
                 self.current_episode = np.zeros((self.envs.num_envs,), np.int32)
+                self.env_stats_step = 0  # the step of the next log of the vec env statistics
                 break
 
         self.episode_length = self.envs.max_episode_length
 
         # environment details, representations, policies, optimizers, and agents.
         for h, arg in enumerate(self.args):
-            arg.handle_name = self.envs.envs[0].side_names[h]
+            arg.handle_name = self.envs.side_names[h]
             if self.n_handles > 1 and arg.agent != "RANDOM":
                 arg.model_dir += "{}/".format(arg.handle_name)
+                arg.buffer_dir += "{}/".format(arg.handle_name)
             arg.handle, arg.n_agents = h, self.envs.n_agents[h]
             arg.agent_keys, arg.agent_ids = self.agent_keys[h], self.agent_ids[h]
             arg.state_space = self.envs.state_space
@@ -106,23 +110,13 @@ class Pettingzoo_Runner(Runner_Base):
         info: (dict) information to be visualized
         n_steps: current step
         """
-        if self.use_wandb:
-            for k, v in info.items():
-                wandb.log({k: v}, step=x_index)
-        else:
-            for k, v in info.items():
-                try:
-                    self.writer.add_scalar(k, v, x_index)
-                except:
-                    self.writer.add_scalars(k, v, x_index)
+        if self.envs.stats is not None and x_index >= self.env_stats_step:  # the vec env statistics since the last log
+            info = dict(info, **self.envs.get_stats())
+            self.env_stats_step = x_index + self.args_base.env_stats_interval
+        self.metrics.log(info, x_index)
 
     def log_videos(self, info: dict, fps: int, x_index: int=0):
-        if self.use_wandb:
-            for k, v in info.items():
-                wandb.log({k: wandb.Video(v, fps=fps, format='gif')}, step=x_index)
-        else:
-            for k, v in info.items():
-                self.writer.add_video(k, v, fps=fps, global_step=x_index)
+        self.metrics.log_videos(info, fps, x_index)
 
     def print_infos(self, args):
         infos = []
@@ -322,6 +316,12 @@ class Pettingzoo_Runner(Runner_Base):
 
         return episode_score
 
+    def resume(self):
+        """Load the checkpoints of the groups and the steps saved with them, a group without one starts from scratch."""
+        for mas_group in self.marl_agents:
+            if mas_group.resume(mas_group.args.model_dir):
+                self.load_train_state(mas_group.args.model_dir)
+
     def run(self):
         if self.args_base.test_mode:
             def env_fn():
@@ -334,13 +334,18 @@ class Pettingzoo_Runner(Runner_Base):
             self.test_episode(env_fn)
             print("Finish testing.")
         else:
-            n_train_episodes = self.args_base.running_steps // self.episode_length // self.n_envs
+            if self.args_base.resume_training:
+                self.resume()
+            n_train_steps = max(self.args_base.running_steps - self.current_step, 0)
+            n_train_episodes = n_train_steps // self.episode_length // self.n_envs
             self.train_episode(n_train_episodes)
             print("Finish training.")
             for h, mas_group in enumerate(self.marl_agents):
-                mas_group.save_model("final_train_model.pth")
+                mas_group.save_model("final_train_model.pth", save_buffer=True)
+                self.save_train_state(mas_group.model_dir)
 
         self.envs.close()
+        self.metrics.close()
         if self.use_wandb:
             wandb.finish()
         else:
@@ -352,7 +357,10 @@ class Pettingzoo_Runner(Runner_Base):
             args_test.parallels = args_test.test_episode
             return make_envs(args_test)
 
-        n_train_episodes = self.args_base.running_steps // self.episode_length // self.n_envs
+        if self.args_base.resume_training:
+            self.resume()
+        n_train_steps = max(self.args_base.running_steps - self.current_step, 0)
+        n_train_episodes = n_train_steps // self.episode_length // self.n_envs
         n_eval_interval = self.args_base.eval_interval // self.episode_length // self.n_envs
         num_epoch = int(n_train_episodes / n_eval_interval)
 
@@ -378,14 +386,16 @@ class Pettingzoo_Runner(Runner_Base):
                     }
                     # save best model
                     self.marl_agents[h].save_model("best_model.pth")
+                    self.save_train_state(self.marl_agents[h].model_dir)
 
         # end benchmarking
         print("Finish benchmarking.")
         for h in range(self.n_handles):
-            print("Best Score for {}: ".format(self.envs.envs[0].side_names[h]))
+            print("Best Score for {}: ".format(self.envs.side_names[h]))
             print("Mean: ", best_scores[h]["mean"], "Std: ", best_scores[h]["std"])
 
         self.envs.close()
+        self.metrics.close()
         if self.use_wandb:
             wandb.finish()
         else:
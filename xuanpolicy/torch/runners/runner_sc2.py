@@ -2,6 +2,7 @@ import os
 import socket
 from pathlib import Path
 from .runner_basic import Runner_Base, make_envs
+from xuanpolicy.common import MetricsSink
 from xuanpolicy.torch.agents import REGISTRY as REGISTRY_Agent
 import wandb
 from torch.utils.tensorboard import SummaryWriter
@@ -49,11 +50,13 @@ class SC2_Runner(Runner_Base):
             self.use_wandb = True
         else:
             raise "No logger is implemented."
+        self.metrics = MetricsSink(None if self.use_wandb else self.writer, args.log_flush_interval)
 
         self.on_policy = self.args.on_policy
         self.running_steps = args.running_steps
         self.training_frequency = args.training_frequency
         self.current_step = 0
+        self.env_stats_step = 0  # the step of the next log of the vec env statistics
         self.envs_step = np.zeros((self.envs.num_envs,), np.int32)
         self.current_episode = np.zeros((self.envs.num_envs,), np.int32)
         self.episode_length = self.envs.max_episode_length
@@ -101,23 +104,13 @@ class SC2_Runner(Runner_Base):
         info: (dict) information to be visualized
         n_steps: current step
         """
-        if self.use_wandb:
-            for k, v in info.items():
-                wandb.log({k: v}, step=x_index)
-        else:
-            for k, v in info.items():
-                try:
-                    self.writer.add_scalar(k, v, x_index)
-                except:
-                    self.writer.add_scalars(k, v, x_index)
+        if self.envs.stats is not None and x_index >= self.env_stats_step:  # the vec env statistics since the last log
+            info = dict(info, **self.envs.get_stats())
+            self.env_stats_step = x_index + self.args.env_stats_interval
+        self.metrics.log(info, x_index)
 
     def log_videos(self, info: dict, fps: int, x_index: int = 0):
-        if self.use_wandb:
-            for k, v in info.items():
-                wandb.log({k: wandb.Video(v, fps=fps, format='gif')}, step=x_index)
-        else:
-            for k, v in info.items():
-                self.writer.add_video(k, v, fps=fps, global_step=x_index)
+        self.metrics.log_videos(info, fps, x_index)
 
     def get_actions(self, obs_n, avail_actions, *rnn_hidden, state=None, test_mode=False):
         log_pi_n, values_n, actions_n_onehot = None, None, None
@@ -316,12 +309,17 @@ class SC2_Runner(Runner_Base):
             self.test_episode(n_test_episodes)
             print("Finish testing.")
         else:
-            n_train_episodes = self.args.running_steps // self.episode_length // self.n_envs
+            if self.args.resume_training and self.agents.resume(self.agents.model_dir):
+                self.load_train_state(self.agents.model_dir)
+            n_train_steps = max(self.args.running_steps - self.current_step, 0)
+            n_train_episodes = n_train_steps // self.episode_length // self.n_envs
             self.train_episode(n_train_episodes)
             print("Finish training.")
-            self.agents.save_model("final_train_model.pth")
+            self.agents.save_model("final_train_model.pth", save_buffer=True)
+            self.save_train_state(self.agents.model_dir)
 
         self.envs.close()
+        self.metrics.close()
         if self.use_wandb:
             wandb.finish()
         else:
@@ -332,7 +330,10 @@ class SC2_Runner(Runner_Base):
         arg_test.parallels = 1
         self.test_envs = make_envs(arg_test)
 
-        n_train_episodes = self.args.running_steps // self.n_envs // self.episode_length
+        if self.args.resume_training and self.agents.resume(self.agents.model_dir):
+            self.load_train_state(self.agents.model_dir)
+        n_train_steps = max(self.args.running_steps - self.current_step, 0)
+        n_train_episodes = n_train_steps // self.n_envs // self.episode_length
         n_eval_interval = self.args.eval_interval // self.n_envs // self.episode_length
         n_test_episodes = self.args.test_episode
         num_epoch = int(n_train_episodes / n_eval_interval)
@@ -361,6 +362,7 @@ class SC2_Runner(Runner_Base):
                 best_win_rate = test_win_rate
                 # save best model
                 self.agents.save_model("best_model.pth")
+                self.save_train_state(self.agents.model_dir)
 
         # end benchmarking
         print("Finish benchmarking.")
@@ -369,6 +371,7 @@ class SC2_Runner(Runner_Base):
 
         self.envs.close()
         self.test_envs.close()
+        self.metrics.close()
         if self.use_wandb:
             wandb.finish()
         else:
@@ -1,6 +1,7 @@
 from .operations import *
 from .layers import *
 from .distributions import *
+from .sampler import PrefetchSampler
 
 ActivationFunctions = {
     "ReLU": nn.ReLU,
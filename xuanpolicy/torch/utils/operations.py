@@ -1,4 +1,5 @@
 import random
+import warnings
 
 import torch
 import torch.nn as nn
@@ -101,3 +102,147 @@ def merge_distributions(distribution_list):
         return dist
     else:
         pass
+
+
+class NumpyInference(object):
+    """
+    The inference path of the policies for the rollouts and tests, mixed into the policy modules.
+    act_numpy runs the policy without autograd and returns its outputs as NumPy arrays. The float observations are
+    staged in float32 host buffers, and the outputs of a GPU policy are copied back through pinned host buffers with
+    one synchronization. The buffers are allocated once for each shape and reused by the following calls.
+    """
+    def act_numpy(self, *inputs, method=None, sample=None, inference_mode=None, **kwargs):
+        """
+            inputs, kwargs: the inputs of the policy.
+            method: the method of the policy to run, forward by default.
+            sample: maps the outputs of the method to the values to return, e.g. draws the actions of a distribution.
+            inference_mode: run under torch.inference_mode, or under torch.no_grad if False. It defaults to False for
+                the recurrent policies, whose hidden states are reset in place by the runners.
+        The tensors among the returned values are converted to NumPy arrays, the other values such as the hidden
+        states are returned as they are.
+        """
+        if inference_mode is None:
+            inference_mode = not getattr(self, "use_rnn", False)
+        buffers = self.__dict__.setdefault("inference_buffers", {})
+        device = next(self.parameters()).device
+        inputs = [self._stage_input(buffers, device, i, x) for i, x in enumerate(inputs)]
+        with torch.inference_mode() if inference_mode else torch.no_grad():
+            outputs = (method or self)(*inputs, **kwargs)
+            if sample is not None:
+                outputs = sample(*outputs)
+            return self._numpy_outputs(buffers, device, outputs)
+
+    @staticmethod
+    def _stage_input(buffers, device, i, x):
+        if not isinstance(x, np.ndarray) or x.dtype.kind != 'f':
+            return x
+        if device.type == "cpu" and x.dtype == np.float32:  # torch.as_tensor does not copy it
+            return x
+        key = ("input", i, x.shape)
+        if key not in buffers:
+            buffers[key] = torch.empty(x.shape, dtype=torch.float32, pin_memory=(device.type == "cuda")).numpy()
+        np.copyto(buffers[key], x, casting="same_kind")
+        return buffers[key]
+
+    @staticmethod
+    def _numpy_outputs(buffers, device, outputs):
+        single = not isinstance(outputs, tuple)
+        outputs = (outputs,) if single else outputs
+        if device.type == "cuda":
+            pinned = []
+            for i, value in enumerate(outputs):
+                if isinstance(value, torch.Tensor) and value.is_cuda:
+                    key = ("output", i, value.shape, value.dtype)
+                    if key not in buffers:
+                        buffers[key] = torch.empty(value.shape, dtype=value.dtype, pin_memory=True)
+                    buffers[key].copy_(value, non_blocking=True)
+                    pinned.append(i)
+            torch.cuda.current_stream(device).synchronize()
+            # the pinned buffers are overwritten by the next call, so the caller gets its own copies
+            outputs = tuple(buffers[("output", i, value.shape, value.dtype)].numpy().copy() if i in pinned else value
+                            for i, value in enumerate(outputs))
+        outputs = tuple(value.numpy() if isinstance(value, torch.Tensor) else value for value in outputs)
+        return outputs[0] if single else outputs
+
+
+class CompiledForward(object):
+    """
+    The forward of a compiled block of a policy. If the compiled forward fails, e.g. the backend is not supported on
+    this host, the block warns once and runs its eager forward from then on.
+    """
+    def __init__(self, name, eager_forward, compiled_forward):
+        self.name = name
+        self.eager_forward = eager_forward
+        self.compiled_forward = compiled_forward
+
+    def __call__(self, *args, **kwargs):
+        if self.compiled_forward is not None:
+            try:
+                return self.compiled_forward(*args, **kwargs)
+            except Exception as error:
+                warnings.warn("Compiled %s failed, falling back to eager: %s" % (self.name, error))
+                self.compiled_forward = None
+        return self.eager_forward(*args, **kwargs)
+
+
+def _compile_forward(module: nn.Module, backend: str):
+    eager_forward = module.forward
+    if hasattr(torch, "compile"):
+        return torch.compile(eager_forward, backend=backend)
+    scripted = torch.jit.script(module)  # torch < 2.0
+    if {p.data_ptr() for p in scripted.parameters()} != {p.data_ptr() for p in module.parameters()}:
+        raise RuntimeError("the scripted module does not share the parameters")
+    return scripted.forward
+
+
+def compile_policy(policy: nn.Module, backend: str = "inductor"):
+    """
+    Compile the compute graphs of a policy in place for its inference and learner forward passes.
+    The compiled blocks are the nn.Sequential modules, which only take tensors: the representations still convert the
+    NumPy observations in their eager forward, outside of the graphs. The blocks use torch.compile with backend, or
+    TorchScript before torch 2.0, and keep their parameters and state_dict keys.
+        policy: the policy module.
+        backend: the backend of torch.compile, e.g. "inductor", "aot_eager".
+    Returns the names of the compiled blocks, the blocks that fail to compile stay eager.
+    """
+    compiled = []
+    for name, module in policy.named_modules():
+        if not isinstance(module, nn.Sequential) or len(module) == 0:
+            continue
+        if any(name.startswith(prefix + ".") for prefix in compiled):  # inside a compiled block
+            continue
+        try:
+            compiled_forward = _compile_forward(module, backend)
+        except Exception as error:
+            warnings.warn("Cannot compile %s, keeping it eager: %s" % (name, error))
+            continue
+        module.forward = CompiledForward(name, module.forward, compiled_forward)
+        compiled.append(name)
+    return compiled
+
+
+def copy_targets(*pairs):
+    """
+    Copy the eval networks to their target networks, with a few torch._foreach_* calls for all of their tensors.
+        pairs: the (eval network, target network) modules.
+    """
+    eval_params = [p.data for eval_net, _ in pairs for p in eval_net.parameters()]
+    target_params = [p.data for _, target_net in pairs for p in target_net.parameters()]
+    if hasattr(torch, "_foreach_copy_"):
+        torch._foreach_copy_(target_params, eval_params)
+    else:  # torch < 2.1
+        for ep, tp in zip(eval_params, target_params):
+            tp.copy_(ep)
+
+
+def polyak_update(tau, *pairs):
+    """
+    The soft update target = (1 - tau) * target + tau * eval of the target networks, with two torch._foreach_* calls
+    for all of their tensors.
+        tau: the weight of the eval networks.
+        pairs: the (eval network, target network) modules.
+    """
+    eval_params = [p.data for eval_net, _ in pairs for p in eval_net.parameters()]
+    target_params = [p.data for _, target_net in pairs for p in target_net.parameters()]
+    torch._foreach_mul_(target_params, 1 - tau)
+    torch._foreach_add_(target_params, eval_params, alpha=tau)
@@ -0,0 +1,104 @@
+import queue
+import threading
+import numpy as np
+import torch
+
+
+class PrefetchSampler(object):
+    """
+    Wrap an off-policy replay buffer and prefetch the sampled batches as tensors in a background thread.
+    store(), save(), load(), clear() and the background sampling are serialized by a lock, so a batch never contains
+    a half-stored step. A prefetched batch is sampled at most queue_size calls before it is used, the batches sampled
+    before a load() or clear() are dropped. Call close() to stop the thread.
+        memory: the replay buffer to sample from, its other attributes are forwarded.
+        device: the device of the prefetched tensors.
+        queue_size: number of ready-to-use batches kept in the queue.
+    """
+    def __init__(self, memory, device=None, queue_size: int = 2):
+        self.memory = memory
+        self.device = device
+        self.lock = threading.Lock()
+        self.batches = queue.Queue(maxsize=queue_size)
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.version = 0  # increased by load() and clear(), the batches of the older versions are dropped
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['memory'], name)
+
+    def _to_tensor(self, data):
+        if data is None:
+            return None
+        elif isinstance(data, dict):
+            return {key: self._to_tensor(value) for key, value in data.items()}
+        elif isinstance(data, (tuple, list)):
+            return type(data)(self._to_tensor(value) for value in data)
+        elif isinstance(data, np.ndarray) and data.dtype != object:
+            return torch.as_tensor(data, device=self.device)
+        return data
+
+    def _prefetch(self):
+        while not self.stop_event.is_set():
+            try:
+                with self.lock:
+                    samples, version = self.memory.sample(), self.version
+                batch = (version, self._to_tensor(samples))
+            except Exception as error:  # re-raised in the main thread
+                batch = (None, error)
+            while not self.stop_event.is_set():
+                try:
+                    self.batches.put(batch, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if isinstance(batch[1], Exception):
+                return
+
+    def _drain(self):
+        while True:
+            try:
+                self.batches.get_nowait()
+            except queue.Empty:
+                return
+
+    def store(self, *args, **kwargs):
+        with self.lock:
+            self.memory.store(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        with self.lock:
+            self.memory.save(*args, **kwargs)
+
+    def load(self, *args, **kwargs):
+        with self.lock:
+            self.memory.load(*args, **kwargs)
+            self.version += 1
+        self._drain()
+
+    def clear(self, *args, **kwargs):
+        with self.lock:
+            self.memory.clear(*args, **kwargs)
+            self.version += 1
+        self._drain()
+
+    def sample(self):
+        if self.thread is None:  # start after the first steps are stored
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._prefetch, daemon=True)
+            self.thread.start()
+        while True:
+            version, batch = self.batches.get()
+            if isinstance(batch, Exception):
+                self.thread = None
+                raise batch
+            if version == self.version:
+                return batch
+
+    def close(self):
+        """Stop the prefetching thread and drop the prefetched batches."""
+        if self.thread is not None:
+            self.stop_event.set()
+            self._drain()
+            self.thread.join()
+            self.thread = None
+        self._drain()